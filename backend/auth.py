@@ -4,8 +4,11 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from cryptography.fernet import Fernet
 import os
+import time
 from dotenv import load_dotenv
 
+from cache_service import TTLCache
+
 load_dotenv()
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -17,6 +20,13 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 480
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", Fernet.generate_key().decode())
 cipher_suite = Fernet(ENCRYPTION_KEY.encode() if isinstance(ENCRYPTION_KEY, str) else ENCRYPTION_KEY)
 
+# Payloads de tokens ya verificados; TOKEN_CACHE_SIZE=0 deshabilita la caché
+token_cache = TTLCache(
+    "tokens",
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("TOKEN_CACHE_TTL", "300"))
+)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -34,11 +44,22 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def verify_token(token: str) -> Optional[dict]:
+    payload = token_cache.get(token)
+    if payload is not None:
+        return dict(payload)
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         return None
+    
+    # La entrada nunca sobrevive al claim exp del token
+    ttl = token_cache.ttl
+    if payload.get("exp"):
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        token_cache.set(token, payload, ttl)
+    return dict(payload)
 
 def encrypt_password(password: str) -> str:
     return cipher_suite.encrypt(password.encode()).decode()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Comparar tamaño y tiempo de compresión gzip/brotli sobre cargas representativas
+(listado de bitácoras en JSON y msgpack, exportación CSV en streaming).
+
+Uso:
+    python benchmark_compresion.py [--filas 1000] [--filas-csv 20000]
+"""
+import argparse
+import csv
+import random
+import time
+import zlib
+from datetime import datetime, timedelta
+from io import StringIO
+
+import orjson
+from bson import ObjectId
+
+import compression
+from compression import Compresor, brotli
+from responses import json_default, msgpack
+
+TIPOS = ["Mantenimiento preventivo", "Mantenimiento correctivo", "Instalación", "Revisión"]
+ESTADOS = ["Pendiente", "En Progreso", "Completado"]
+FRASES = [
+    "Se realizó limpieza física del equipo y revisión de ventiladores",
+    "El usuario reporta lentitud al iniciar sesión",
+    "Se actualizó el sistema operativo y los controladores de red",
+    "Reemplazo de disco duro por SSD de 480 GB",
+    "Respaldo de datos del usuario en el servidor de archivos",
+    "Falla intermitente en la conexión inalámbrica",
+    "Se configuró la impresora compartida del área contable",
+]
+
+def bitacoras(filas: int):
+    random.seed(7)
+    empresas = [ObjectId() for _ in range(5)]
+    equipos = [ObjectId() for _ in range(300)]
+    tecnicos = [ObjectId() for _ in range(8)]
+    inicio = datetime(2024, 1, 1)
+    for _ in range(filas):
+        fecha = inicio + timedelta(minutes=random.randint(0, 500000))
+        yield {
+            "_id": ObjectId(),
+            "empresa_id": str(random.choice(empresas)),
+            "equipo_id": str(random.choice(equipos)),
+            "tecnico_id": str(random.choice(tecnicos)),
+            "tipo": random.choice(TIPOS),
+            "descripcion": " ".join(random.sample(FRASES, 2)),
+            "estado": random.choice(ESTADOS),
+            "fecha": fecha,
+            "observaciones": random.choice(FRASES) if random.random() < 0.5 else None,
+            "tiempo_estimado": random.randint(15, 240),
+            "limpieza_fisica": random.random() < 0.5,
+            "creado_en": fecha,
+            "campos_personalizados": {},
+        }
+
+def csv_por_bloques(filas: int, tamano_bloque: int = 200):
+    """Bloques como los que emite GET /bitacoras/exportar"""
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["fecha", "equipo", "tipo", "descripcion", "tecnico", "estado", "observaciones", "anotaciones_extras"])
+    for numero, bitacora in enumerate(bitacoras(filas), 1):
+        writer.writerow([
+            bitacora["fecha"].strftime("%d/%m/%Y %H:%M"), f"PC-{bitacora['equipo_id'][-4:]}", bitacora["tipo"],
+            bitacora["descripcion"], f"Técnico {bitacora['tecnico_id'][-2:]}", bitacora["estado"],
+            bitacora["observaciones"] or "", ""
+        ])
+        if numero % tamano_bloque == 0:
+            yield output.getvalue().encode()
+            output.seek(0)
+            output.truncate(0)
+    if output.getvalue():
+        yield output.getvalue().encode()
+
+def medir(nombre: str, tamano: int, funcion, repeticiones: int):
+    funcion()
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        salida = funcion()
+    ms = (time.perf_counter() - inicio) * 1000 / repeticiones
+    print(f"  {nombre:<14} {len(salida):>10,} B  {len(salida) / tamano:6.1%}  {ms:8.2f} ms  {tamano / 1e6 / (ms / 1000):7.1f} MB/s")
+
+def variantes():
+    for nivel in (1, 4, 6, 9):
+        yield f"gzip-{nivel}", "gzip", nivel
+    if brotli is not None:
+        for calidad in (1, 3, 4, 6, 11):
+            yield f"br-{calidad}", "br", calidad
+
+def compresor(codificacion: str, nivel: int, streaming: bool) -> Compresor:
+    # Los niveles se leen del módulo al crear el compresor
+    compression.GZIP_LEVEL = compression.GZIP_STREAM_LEVEL = nivel
+    compression.BROTLI_QUALITY = compression.BROTLI_STREAM_QUALITY = nivel
+    return Compresor(codificacion, streaming=streaming)
+
+def benchmark_cuerpo(titulo: str, cuerpo: bytes, repeticiones: int):
+    print(f"\n{titulo}: {len(cuerpo):,} B")
+    for nombre, codificacion, nivel in variantes():
+        repeticiones_variante = 1 if nombre == "br-11" else repeticiones
+        medir(nombre, len(cuerpo), lambda: compresor(codificacion, nivel, False).terminar(cuerpo), repeticiones_variante)
+
+def benchmark_stream(titulo: str, bloques, repeticiones: int):
+    tamano = sum(len(bloque) for bloque in bloques)
+    print(f"\n{titulo}: {tamano:,} B en {len(bloques)} bloques (vaciado por bloque)")
+
+    def comprimir_stream(codificacion, nivel):
+        c = compresor(codificacion, nivel, True)
+        return b"".join(c.comprimir(bloque) for bloque in bloques) + c.terminar()
+
+    for nombre, codificacion, nivel in variantes():
+        if nombre == "br-11":
+            continue
+        medir(nombre, tamano, lambda: comprimir_stream(codificacion, nivel), repeticiones)
+
+def main(args):
+    documentos = list(bitacoras(args.filas))
+    benchmark_cuerpo(
+        f"GET /bitacoras ({args.filas} documentos, JSON)",
+        orjson.dumps(documentos, default=json_default, option=orjson.OPT_NON_STR_KEYS),
+        args.repeticiones
+    )
+    if msgpack is not None:
+        benchmark_cuerpo(
+            f"GET /bitacoras ({args.filas} documentos, msgpack)",
+            msgpack.packb(documentos, default=json_default, use_bin_type=True),
+            args.repeticiones
+        )
+    benchmark_stream(f"GET /bitacoras/exportar ({args.filas_csv} filas, CSV)", list(csv_por_bloques(args.filas_csv)), args.repeticiones)
+
+    print(f"\nzlib {zlib.ZLIB_RUNTIME_VERSION}, brotli {'no instalado' if brotli is None else getattr(brotli, '__version__', 'instalado')}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de compresión de respuestas")
+    parser.add_argument("--filas", type=int, default=1000)
+    parser.add_argument("--filas-csv", type=int, default=20000)
+    parser.add_argument("--repeticiones", type=int, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Comparar la serialización de un listado de bitácoras: ruta anterior (conversión de _id
+por documento + jsonable_encoder + json), orjson y msgpack.
+
+Uso:
+    python benchmark_serializacion.py [--filas 10000]
+"""
+import argparse
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from benchmark_compresion import bitacoras
+from responses import MsgPackResponse, ORJSONResponse, msgpack
+
+def ruta_anterior(documentos):
+    for documento in documentos:
+        documento["_id"] = str(documento["_id"])
+    return JSONResponse(jsonable_encoder(documentos)).body
+
+def medir(nombre: str, funcion, documentos, repeticiones: int):
+    tamano, segundos = 0, 0.0
+    for _ in range(repeticiones):
+        # Copia por repetición: la ruta anterior modifica los documentos
+        copia = [dict(documento) for documento in documentos]
+        inicio = time.perf_counter()
+        tamano = len(funcion(copia))
+        segundos += time.perf_counter() - inicio
+    print(f"  {nombre:<16} {segundos / repeticiones * 1000:9.1f} ms  {tamano:>12,} B")
+
+def main(args):
+    documentos = list(bitacoras(args.filas))
+    print(f"{args.filas} bitácoras, media de {args.repeticiones} repeticiones")
+    medir("jsonable_encoder", ruta_anterior, documentos, args.repeticiones)
+    medir("orjson", lambda docs: ORJSONResponse(docs).body, documentos, args.repeticiones)
+    if msgpack is not None:
+        medir("msgpack", lambda docs: MsgPackResponse(docs).body, documentos, args.repeticiones)
+    else:
+        print("  msgpack no instalado")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de serialización de respuestas")
+    parser.add_argument("--filas", type=int, default=10000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    main(parser.parse_args())
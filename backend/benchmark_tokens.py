@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Comparar verify_token con y sin la caché de payloads verificados.
+
+Uso:
+    python benchmark_tokens.py [--verificaciones 20000] [--tokens 50]
+"""
+import argparse
+import time
+
+from auth import create_access_token, token_cache, verify_token
+
+def medir(nombre: str, tokens, verificaciones: int):
+    token_cache.clear()
+    inicio = time.perf_counter()
+    for numero in range(verificaciones):
+        assert verify_token(tokens[numero % len(tokens)]) is not None
+    segundos = time.perf_counter() - inicio
+    print(f"  {nombre:<10} {segundos:8.3f} s  {segundos / verificaciones * 1e6:8.2f} µs/verificación")
+
+def main(args):
+    # Varios usuarios con sesión abierta, como en el servidor
+    tokens = [
+        create_access_token({"sub": f"usuario{numero}", "email": f"u{numero}@itsm.com", "rol": "tecnico"})
+        for numero in range(args.tokens)
+    ]
+    print(f"{args.verificaciones} verificaciones sobre {len(tokens)} tokens")
+
+    maxsize = token_cache.maxsize
+    medir("con caché", tokens, args.verificaciones)
+    token_cache.maxsize = 0
+    try:
+        medir("sin caché", tokens, args.verificaciones)
+    finally:
+        token_cache.maxsize = maxsize
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de verify_token con y sin caché")
+    parser.add_argument("--verificaciones", type=int, default=20000)
+    parser.add_argument("--tokens", type=int, default=50)
+    main(parser.parse_args())
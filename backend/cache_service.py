@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Todas las cachés creadas, por nombre, para exponer sus métricas
+CACHES: Dict[str, "TTLCache"] = {}
+
+class TTLCache:
+    """
+    Caché LRU en memoria del proceso, con expiración por entrada y métricas.
+    maxsize <= 0 deshabilita la caché (todas las lecturas son fallos).
+    """
+    def __init__(self, nombre: str, maxsize: int = 1024, ttl: float = 60.0):
+        self.nombre = nombre
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        CACHES[nombre] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+
+        expira, valor = item
+        if expira <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return valor
+
+    def set(self, key: Hashable, valor: Any, ttl: Optional[float] = None):
+        """Guardar un valor; ttl permite acortar la vida de una entrada concreta"""
+        if not self.enabled:
+            return
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), valor)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def invalidate_where(self, predicado: Callable[[Hashable], bool]) -> int:
+        """Invalidar las entradas cuya clave cumple predicado; devuelve cuántas"""
+        claves = [clave for clave in self._data if predicado(clave)]
+        for clave in claves:
+            del self._data[clave]
+        return len(claves)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+# Usuario autenticado por id; TTL corto para que desactivaciones en otros procesos se apliquen pronto
+user_cache = TTLCache(
+    "usuarios",
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "30"))
+)
+
+# Documento único de configuración (incluye el logo en base64); se refresca en cada escritura
+config_cache = TTLCache(
+    "configuracion",
+    maxsize=1,
+    ttl=float(os.getenv("CONFIG_CACHE_TTL", "300"))
+)
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {nombre: cache.stats() for nombre, cache in CACHES.items()}
@@ -0,0 +1,190 @@
+from typing import List, Optional, Tuple
+import asyncio
+import os
+import zlib
+from dotenv import load_dotenv
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional; sin él solo se comprime con gzip
+    brotli = None
+
+load_dotenv()
+
+# Respuestas más pequeñas no se comprimen: la cabecera y el tiempo no compensan
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+# Las respuestas en streaming se comprimen bloque a bloque: un nivel más bajo mantiene la latencia
+GZIP_STREAM_LEVEL = int(os.getenv("GZIP_STREAM_LEVEL", "4"))
+BROTLI_STREAM_QUALITY = int(os.getenv("BROTLI_STREAM_QUALITY", "3"))
+# A partir de este tamaño el cuerpo se comprime en un hilo para no bloquear el event loop
+COMPRESSION_THREAD_MIN = int(os.getenv("COMPRESSION_THREAD_MIN", str(256 * 1024)))
+
+TIPOS_COMPRIMIBLES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/msgpack",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+# Los eventos SSE deben llegar al cliente en cuanto se emiten; algunos proxies los retienen si van comprimidos
+TIPOS_EXCLUIDOS = ("text/event-stream",)
+
+def codificaciones_aceptadas(accept_encoding: str) -> List[str]:
+    """Codificaciones de Accept-Encoding con q > 0, en orden de preferencia del cliente"""
+    aceptadas = []
+    for parte in accept_encoding.split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        calidad = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                calidad = float(parametros[2:])
+            except ValueError:
+                calidad = 0.0
+        if nombre and calidad > 0:
+            aceptadas.append((calidad, nombre.strip().lower()))
+    return [nombre for _, nombre in sorted(aceptadas, key=lambda item: -item[0])]
+
+def elegir_codificacion(accept_encoding: str) -> Optional[str]:
+    """brotli si el cliente lo acepta y está instalado; si no, gzip"""
+    aceptadas = codificaciones_aceptadas(accept_encoding)
+    if brotli is not None and ("br" in aceptadas or "*" in aceptadas):
+        return "br"
+    if "gzip" in aceptadas or "*" in aceptadas:
+        return "gzip"
+    return None
+
+class Compresor:
+    """Compresión incremental con la misma interfaz para gzip y brotli"""
+    def __init__(self, codificacion: str, streaming: bool = False):
+        self.codificacion = codificacion
+        if codificacion == "br":
+            calidad = BROTLI_STREAM_QUALITY if streaming else BROTLI_QUALITY
+            self._brotli = brotli.Compressor(quality=calidad)
+        else:
+            nivel = GZIP_STREAM_LEVEL if streaming else GZIP_LEVEL
+            # wbits 16 + MAX_WBITS: formato gzip (cabecera y CRC) en lugar de zlib
+            self._zlib = zlib.compressobj(nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def comprimir(self, datos: bytes) -> bytes:
+        """Comprimir un bloque y vaciar el búfer para que el cliente pueda procesarlo ya"""
+        if self.codificacion == "br":
+            return self._brotli.process(datos) + self._brotli.flush()
+        return self._zlib.compress(datos) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def terminar(self, datos: bytes = b"") -> bytes:
+        if self.codificacion == "br":
+            return self._brotli.process(datos) + self._brotli.finish()
+        return self._zlib.compress(datos) + self._zlib.flush(zlib.Z_FINISH)
+
+def comprimir(datos: bytes, codificacion: str) -> bytes:
+    return Compresor(codificacion).terminar(datos)
+
+def _comprimible(cabeceras: dict, status: int) -> bool:
+    if status < 200 or status in (204, 206, 304):
+        return False
+    if "content-encoding" in cabeceras:
+        return False
+    tipo = cabeceras.get("content-type", "").lower()
+    if tipo.startswith(TIPOS_EXCLUIDOS):
+        return False
+    return tipo.startswith(TIPOS_COMPRIMIBLES)
+
+def _cabeceras(headers: List[Tuple[bytes, bytes]]) -> dict:
+    return {nombre.decode("latin-1").lower(): valor.decode("latin-1") for nombre, valor in headers}
+
+def _con_vary(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    vary = [valor for nombre, valor in headers if nombre.lower() == b"vary"]
+    if any(b"accept-encoding" in valor.lower() or valor.strip() == b"*" for valor in vary):
+        return headers
+    if vary:
+        return [
+            (nombre, valor + b", Accept-Encoding" if nombre.lower() == b"vary" else valor)
+            for nombre, valor in headers
+        ]
+    return headers + [(b"vary", b"Accept-Encoding")]
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI de compresión gzip/brotli para JSON, NDJSON, msgpack y CSV.
+    Las respuestas completas se comprimen si superan minimum_size; las de streaming
+    (StreamingResponse: exportaciones CSV, NDJSON) se comprimen bloque a bloque sin
+    acumular el cuerpo en memoria.
+    """
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = _cabeceras(scope.get("headers", [])).get("accept-encoding", "")
+        codificacion = elegir_codificacion(accept_encoding)
+        if codificacion is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio = None
+        compresor: Optional[Compresor] = None
+        comprimiendo = False
+
+        async def enviar(message):
+            nonlocal inicio, compresor, comprimiendo
+
+            if message["type"] == "http.response.start":
+                # Se retiene hasta ver el primer bloque del cuerpo: decide si comprimir
+                inicio = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            cuerpo = message.get("body", b"")
+            mas = message.get("more_body", False)
+
+            if inicio is not None:
+                start, inicio = inicio, None
+                headers = list(start.get("headers", []))
+                cabeceras = _cabeceras(headers)
+                # Un cuerpo completo pequeño no compensa; un stream se comprime siempre
+                comprimiendo = _comprimible(cabeceras, start["status"]) and (mas or len(cuerpo) >= self.minimum_size)
+
+                if not comprimiendo:
+                    if _comprimible(cabeceras, start["status"]):
+                        start = {**start, "headers": _con_vary(headers)}
+                    await send(start)
+                    await send(message)
+                    return
+
+                compresor = Compresor(codificacion, streaming=mas)
+                headers = [(nombre, valor) for nombre, valor in headers if nombre.lower() != b"content-length"]
+                headers = _con_vary(headers) + [(b"content-encoding", codificacion.encode())]
+
+                if not mas:
+                    if len(cuerpo) >= COMPRESSION_THREAD_MIN:
+                        cuerpo = await asyncio.get_running_loop().run_in_executor(None, compresor.terminar, cuerpo)
+                    else:
+                        cuerpo = compresor.terminar(cuerpo)
+                    headers.append((b"content-length", str(len(cuerpo)).encode()))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": cuerpo})
+                    return
+
+                await send({**start, "headers": headers})
+
+            if not comprimiendo:
+                await send(message)
+                return
+
+            datos = compresor.terminar(cuerpo) if not mas else compresor.comprimir(cuerpo) if cuerpo else b""
+            if datos or not mas:
+                await send({"type": "http.response.body", "body": datos, "more_body": mas})
+
+        await self.app(scope, receive, enviar)
@@ -1,4 +1,6 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from typing import Dict, List
 import os
 from dotenv import load_dotenv
 
@@ -8,10 +10,97 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Índices declarados por colección, según la forma real de las consultas.
+# init_db crea los que falten y reporta los que difieren de la base de datos.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "usuarios": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("rol", ASCENDING)]),
+    ],
+    "empresas": [
+        IndexModel([("activo", ASCENDING)]),
+    ],
+    "equipos": [
+        # Listado por empresa con paginación por _id
+        IndexModel([("empresa_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("estado", ASCENDING)]),
+        # Importación con upsert por (empresa, número de serie)
+        IndexModel([("empresa_id", ASCENDING), ("numero_serie", ASCENDING)]),
+        # Sincronización incremental del índice de búsqueda
+        IndexModel([("actualizado_en", ASCENDING)]),
+    ],
+    "bitacoras": [
+        # Exportaciones y reportes: empresa + rango de fechas, orden por fecha
+        IndexModel([("empresa_id", ASCENDING), ("fecha", DESCENDING), ("_id", DESCENDING)]),
+        # Historial de equipo: equipo + orden por fecha
+        IndexModel([("equipo_id", ASCENDING), ("fecha", DESCENDING), ("_id", DESCENDING)]),
+        # Listado general paginado por (fecha, _id)
+        IndexModel([("fecha", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("estado", ASCENDING)]),
+        # Búsqueda de texto en el contenido (una sola por colección)
+        IndexModel(
+            [(campo, TEXT) for campo in ("descripcion", "diagnostico_problema", "solucion_aplicada", "observaciones", "anotaciones_extras")],
+            weights={"descripcion": 5, "diagnostico_problema": 3, "solucion_aplicada": 3},
+            default_language="spanish",
+            name="bitacoras_texto"
+        ),
+    ],
+    "servicios": [
+        IndexModel([("empresa_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("activo", ASCENDING), ("empresa_id", ASCENDING)]),
+    ],
+    "trabajos": [
+        # Los trabajos en segundo plano se conservan una semana
+        IndexModel([("creado_en", ASCENDING)], expireAfterSeconds=7 * 24 * 3600),
+    ],
+}
+
+def _index_spec(info: Dict) -> Dict:
+    """Normalizar la definición de un índice para comparar registro y base de datos"""
+    key = info["key"].items() if hasattr(info["key"], "items") else info["key"]
+    key = [(campo, int(orden) if isinstance(orden, (int, float)) else orden) for campo, orden in key]
+    spec = {"key": key, "unique": bool(info.get("unique", False))}
+    
+    # Los índices de texto se reportan como _fts/_ftsx con los campos en 'weights'
+    if any(orden == TEXT for _, orden in key):
+        campos = [campo for campo, orden in key if orden == TEXT and campo != "_fts"] or list(info.get("weights", {}))
+        spec["key"] = sorted((campo, TEXT) for campo in campos)
+        spec["weights"] = {campo: info.get("weights", {}).get(campo, 1) for campo in campos}
+    return spec
+
+async def sync_indexes() -> Dict[str, Dict[str, List[str]]]:
+    """
+    Sincronizar INDEXES con la base de datos: crear los índices faltantes y
+    devolver por colección los creados, los distintos al registro y los no declarados.
+    Los índices distintos o no declarados solo se reportan, nunca se eliminan.
+    """
+    drift = {}
+    for coleccion, modelos in INDEXES.items():
+        existentes = await db[coleccion].index_information()
+
+        faltantes, distintos = [], []
+        for modelo in modelos:
+            nombre = modelo.document["name"]
+            if nombre not in existentes:
+                faltantes.append(modelo)
+            elif _index_spec(existentes[nombre]) != _index_spec(modelo.document):
+                distintos.append(nombre)
+
+        declarados = {modelo.document["name"] for modelo in modelos}
+        no_declarados = [nombre for nombre in existentes if nombre != "_id_" and nombre not in declarados]
+
+        creados = await db[coleccion].create_indexes(faltantes) if faltantes else []
+
+        drift[coleccion] = {"creados": creados, "distintos": distintos, "no_declarados": no_declarados}
+    return drift
+
 async def init_db():
-    await db.usuarios.create_index("email", unique=True)
-    await db.equipos.create_index("empresa_id")
-    await db.bitacoras.create_index("equipo_id")
-    await db.bitacoras.create_index("empresa_id")
-    await db.servicios.create_index("empresa_id")
-    print("Database indexes created")
\ No newline at end of file
+    drift = await sync_indexes()
+    for coleccion, cambios in drift.items():
+        if cambios["creados"]:
+            print(f"Índices creados en {coleccion}: {', '.join(cambios['creados'])}")
+        if cambios["distintos"]:
+            print(f"ADVERTENCIA: índices de {coleccion} distintos al registro: {', '.join(cambios['distintos'])}")
+        if cambios["no_declarados"]:
+            print(f"ADVERTENCIA: índices de {coleccion} no declarados en el registro: {', '.join(cambios['no_declarados'])}")
+    print("Database indexes created")
@@ -1,7 +1,7 @@
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
 import os
-from typing import Optional
+from typing import Optional, List, Dict
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -53,6 +53,32 @@ class EmailService:
         """
         return self.send_email(to_email, subject, html_content)
     
+    def send_maintenance_summary(self, to_email: str, mantenimientos: List[Dict[str, str]]):
+        """Un solo correo con varios mantenimientos (equipo, fecha, tecnico) registrados a la vez"""
+        subject = f"Mantenimientos programados - {len(mantenimientos)} equipos"
+        filas = "".join(
+            f"<tr><td style=\"padding: 6px;\">{m['equipo']}</td>"
+            f"<td style=\"padding: 6px;\">{m['fecha']}</td>"
+            f"<td style=\"padding: 6px;\">{m['tecnico']}</td></tr>"
+            for m in mantenimientos
+        )
+        html_content = f"""
+        <html>
+            <body style="font-family: Arial, sans-serif; padding: 20px;">
+                <h2 style="color: #0F172A;">Notificación de Mantenimientos</h2>
+                <p>Se han programado mantenimientos para los siguientes equipos:</p>
+                <table style="background-color: #F1F5F9; border-radius: 5px; margin: 15px 0; border-collapse: collapse;">
+                    <tr><th style="padding: 6px; text-align: left;">Equipo</th><th style="padding: 6px; text-align: left;">Fecha</th><th style="padding: 6px; text-align: left;">Técnico asignado</th></tr>
+                    {filas}
+                </table>
+                <p>Por favor, asegúrese de que los equipos estén disponibles en las fechas indicadas.</p>
+                <hr style="border: none; border-top: 1px solid #E2E8F0; margin: 20px 0;">
+                <p style="font-size: 12px; color: #64748B;">Este es un mensaje automático del Sistema ITSM.</p>
+            </body>
+        </html>
+        """
+        return self.send_email(to_email, subject, html_content)
+    
     def send_report_notification(self, to_email: str, empresa: str, tipo_reporte: str):
         subject = f"Reporte generado - {empresa}"
         html_content = f"""
@@ -0,0 +1,250 @@
+from pymongo.errors import OperationFailure, PyMongoError
+from typing import Dict, Any, Iterable, List, Optional, Set
+import asyncio
+import os
+from dotenv import load_dotenv
+
+from database import db
+from stats_service import stats_service, GLOBAL_ID
+
+load_dotenv()
+
+COLECCIONES_EVENTOS = ("empresas", "equipos", "bitacoras", "servicios")
+TIPOS_EVENTO = COLECCIONES_EVENTOS + ("estadisticas",)
+
+# Sin change streams (Mongo standalone) se consultan los contadores de 'versiones' con este intervalo
+SSE_POLL_INTERVAL = float(os.getenv("SSE_POLL_INTERVAL", "2"))
+# Los cambios de contadores se agrupan durante este intervalo antes de publicar las estadísticas
+SSE_STATS_INTERVAL = float(os.getenv("SSE_STATS_INTERVAL", "1"))
+# Eventos pendientes por cliente; un cliente más lento recibe 'resync' en lugar de los eventos perdidos
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "1000"))
+SSE_RETRY_SECONDS = 5
+
+# 40573: $changeStream solo en replica sets; 20: operación no permitida (p. ej. mongod sin oplog)
+CODIGOS_SIN_CHANGE_STREAMS = {40573, 20}
+
+class Suscripcion:
+    """Cola de eventos de un cliente SSE, filtrada por empresa y tipos de evento"""
+    def __init__(self, empresa_id: Optional[str] = None, tipos: Iterable[str] = TIPOS_EVENTO):
+        self.empresa_id = empresa_id
+        self.tipos = set(tipos)
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+
+    def acepta(self, evento: Dict[str, Any]) -> bool:
+        if evento["tipo"] == "resync":
+            return True
+        if evento["tipo"] not in self.tipos:
+            return False
+        if evento["tipo"] == "estadisticas":
+            # Cada cliente recibe solo sus contadores: los globales o los de su empresa
+            return evento["empresa_id"] == self.empresa_id
+        # empresa_id None: no se sabe a qué empresa afecta (p. ej. un borrado), se envía a todos
+        return self.empresa_id is None or evento["empresa_id"] in (None, self.empresa_id)
+
+    def entregar(self, evento: Dict[str, Any]):
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            # El cliente no da abasto: se descartan sus eventos y se le pide recargar
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            self.cola.put_nowait({"tipo": "resync", "empresa_id": None, "motivo": "cola_llena"})
+
+class EventService:
+    """
+    Cambios de empresas, equipos, bitácoras y servicios para los clientes SSE.
+    Una sola tarea por proceso lee los cambios y los reparte a las suscripciones:
+    con change streams (replica set) se envía el documento insertado o solo los campos
+    modificados; en un Mongo standalone se sondean los contadores de 'versiones' y se
+    envía qué colección cambió para qué empresa, para que el cliente recargue con ETag.
+    """
+    def __init__(self):
+        self._suscripciones: Set[Suscripcion] = set()
+        self._tarea: Optional[asyncio.Task] = None
+        self._tarea_estadisticas: Optional[asyncio.Task] = None
+        self._estadisticas_pendientes: Set[Optional[str]] = set()
+        self._excluir: List[str] = []
+        self.modo: Optional[str] = None
+
+    def iniciar(self, excluir: Dict[str, List[str]] = None):
+        """Arrancar la lectura de cambios (una vez por proceso); excluir: campos que nunca se envían"""
+        if self._tarea is not None and not self._tarea.done():
+            return
+        self._excluir = sorted({campo for campos in (excluir or {}).values() for campo in campos})
+        self._tarea = asyncio.create_task(self._ejecutar())
+
+    async def detener(self):
+        for tarea in (self._tarea, self._tarea_estadisticas):
+            if tarea is not None:
+                tarea.cancel()
+        self._tarea = self._tarea_estadisticas = None
+
+    def suscribir(self, empresa_id: Optional[str] = None, tipos: Iterable[str] = TIPOS_EVENTO) -> Suscripcion:
+        suscripcion = Suscripcion(empresa_id, tipos)
+        self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion: Suscripcion):
+        self._suscripciones.discard(suscripcion)
+
+    def _publicar(self, evento: Dict[str, Any]):
+        for suscripcion in list(self._suscripciones):
+            if suscripcion.acepta(evento):
+                suscripcion.entregar(evento)
+
+    def _marcar_estadisticas(self, empresa_ids: Iterable[Optional[str]]):
+        self._estadisticas_pendientes.update(empresa_ids)
+        if self._tarea_estadisticas is None or self._tarea_estadisticas.done():
+            self._tarea_estadisticas = asyncio.create_task(self._publicar_estadisticas())
+
+    async def _publicar_estadisticas(self):
+        """Agrupar los cambios de contadores y publicar una lectura por alcance (global o empresa)"""
+        await asyncio.sleep(SSE_STATS_INTERVAL)
+        pendientes, self._estadisticas_pendientes = self._estadisticas_pendientes, set()
+        for empresa_id in pendientes:
+            if not any(s.empresa_id == empresa_id and "estadisticas" in s.tipos for s in self._suscripciones):
+                continue
+            try:
+                datos = await stats_service.obtener(empresa_id)
+            except PyMongoError as e:
+                print(f"Error leyendo estadísticas para eventos: {str(e)}")
+                continue
+            self._publicar({"tipo": "estadisticas", "empresa_id": empresa_id, "datos": datos})
+
+    async def _ejecutar(self):
+        try:
+            await self._escuchar()
+        except OperationFailure as e:
+            if e.code not in CODIGOS_SIN_CHANGE_STREAMS:
+                raise
+            print(f"Change streams no disponibles ({e.code}), eventos por sondeo cada {SSE_POLL_INTERVAL}s")
+            await self._sondear()
+
+    def _pipeline(self) -> List[Dict[str, Any]]:
+        pipeline = [{"$match": {"ns.coll": {"$in": list(TIPOS_EVENTO)}}}]
+        if self._excluir:
+            pipeline.append({"$project": {
+                **{f"fullDocument.{campo}": 0 for campo in self._excluir},
+                **{f"updateDescription.updatedFields.{campo}": 0 for campo in self._excluir},
+            }})
+        return pipeline
+
+    async def _escuchar(self):
+        """Leer el change stream de la base de datos, reanudando desde el último evento tras un error"""
+        token = None
+        primera = True
+        while True:
+            try:
+                async with db.watch(self._pipeline(), full_document="updateLookup", resume_after=token) as stream:
+                    # El cursor se abre en la primera lectura: en un Mongo standalone falla aquí
+                    cambio = await stream.try_next()
+                    self.modo = "change_stream"
+                    primera = False
+                    if cambio is not None:
+                        token = stream.resume_token
+                        self._procesar(cambio)
+                    async for cambio in stream:
+                        token = stream.resume_token
+                        self._procesar(cambio)
+            except OperationFailure as e:
+                if primera and e.code in CODIGOS_SIN_CHANGE_STREAMS:
+                    raise
+                # Historial del oplog perdido u otro error: no se puede reanudar, los clientes recargan
+                print(f"Error en change stream de eventos: {str(e)}")
+                token = None
+                self._publicar({"tipo": "resync", "empresa_id": None, "motivo": "reinicio"})
+                await asyncio.sleep(SSE_RETRY_SECONDS)
+            except PyMongoError as e:
+                print(f"Change stream de eventos interrumpido: {str(e)}")
+                await asyncio.sleep(SSE_RETRY_SECONDS)
+
+    def _procesar(self, cambio: Dict[str, Any]):
+        coleccion = cambio["ns"]["coll"]
+        operacion = cambio["operationType"]
+        documento_id = cambio.get("documentKey", {}).get("_id")
+
+        if coleccion == "estadisticas":
+            if documento_id == GLOBAL_ID:
+                self._marcar_estadisticas([None])
+            elif isinstance(documento_id, str) and documento_id.startswith("empresa:"):
+                self._marcar_estadisticas([documento_id.split(":", 1)[1]])
+            return
+
+        if operacion not in ("insert", "update", "replace", "delete"):
+            # drop, rename, invalidate: el contenido de la colección ya no es el conocido
+            self._publicar({"tipo": "resync", "empresa_id": None, "motivo": operacion})
+            return
+
+        documento = cambio.get("fullDocument") or {}
+        if coleccion == "empresas":
+            empresa_id = str(documento_id)
+        else:
+            # En un borrado solo se conoce el _id; en una modificación, el documento tras el cambio
+            empresa_id = documento.get("empresa_id")
+
+        evento = {"tipo": coleccion, "operacion": operacion, "id": documento_id, "empresa_id": empresa_id}
+        if operacion in ("insert", "replace"):
+            evento["documento"] = documento
+        elif operacion == "update":
+            descripcion = cambio.get("updateDescription", {})
+            evento["cambios"] = descripcion.get("updatedFields", {})
+            if descripcion.get("removedFields"):
+                evento["eliminados"] = descripcion["removedFields"]
+        self._publicar(evento)
+
+    async def _leer_versiones(self) -> Dict[str, Dict[str, int]]:
+        return {documento["_id"]: documento async for documento in db.versiones.find({})}
+
+    async def _sondear(self):
+        """Sin change streams: detectar cambios por los contadores que mantiene version_service"""
+        self.modo = "sondeo"
+        anteriores = None
+        while True:
+            if not self._suscripciones:
+                # Sin clientes no se consulta; al volver a haberlos se parte de una lectura nueva
+                anteriores = None
+                await asyncio.sleep(SSE_POLL_INTERVAL)
+                continue
+            try:
+                actuales = await self._leer_versiones()
+            except PyMongoError as e:
+                print(f"Error sondeando versiones para eventos: {str(e)}")
+                await asyncio.sleep(SSE_POLL_INTERVAL)
+                continue
+            if anteriores is not None:
+                self._comparar_versiones(anteriores, actuales)
+            anteriores = actuales
+            await asyncio.sleep(SSE_POLL_INTERVAL)
+
+    def _comparar_versiones(self, anteriores: Dict[str, Dict[str, int]], actuales: Dict[str, Dict[str, int]]):
+        estadisticas: Set[Optional[str]] = set()
+        for coleccion in COLECCIONES_EVENTOS:
+            general = actuales.get(coleccion, {})
+            general_anterior = anteriores.get(coleccion, {})
+            if general.get("version", 0) == general_anterior.get("version", 0):
+                continue
+
+            if general.get("epoca", 0) != general_anterior.get("epoca", 0):
+                # Escritura sin empresas conocidas: todas pueden haber cambiado
+                empresas = [None]
+                estadisticas.update(s.empresa_id for s in self._suscripciones)
+            else:
+                prefijo = f"{coleccion}:"
+                empresas = [
+                    clave[len(prefijo):] for clave, documento in actuales.items()
+                    if clave.startswith(prefijo) and documento.get("version", 0) != anteriores.get(clave, {}).get("version", 0)
+                ] or [None]
+            estadisticas.add(None)
+            estadisticas.update(empresa_id for empresa_id in empresas if empresa_id)
+
+            for empresa_id in empresas:
+                self._publicar({
+                    "tipo": coleccion,
+                    "operacion": "cambio",
+                    "empresa_id": empresa_id,
+                    "version": general.get("version", 0)
+                })
+        if estadisticas:
+            self._marcar_estadisticas(estadisticas)
+
+event_service = EventService()
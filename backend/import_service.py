@@ -0,0 +1,278 @@
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+from datetime import date, datetime
+import asyncio
+import os
+from dotenv import load_dotenv
+
+from database import db
+from jobs_service import job_service
+from stats_service import stats_service, CAMPOS_CONTADORES
+from search_service import equipos_search
+from version_service import version_service
+
+load_dotenv()
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "4"))
+
+FORMATOS = {".csv": "csv", ".xlsx": "xlsx"}
+
+# validar(filas) -> ([(indice, documento, campos)], {indice: error}), con índices relativos al bloque;
+# campos: rutas del documento que vienen de celdas del archivo (las que un upsert modifica)
+Validador = Callable[[List[Dict[str, Any]]], Tuple[List[tuple], Dict[int, str]]]
+
+def detectar_formato(nombre_archivo: str) -> str:
+    extension = os.path.splitext(nombre_archivo or "")[1].lower()
+    if extension not in FORMATOS:
+        raise ValueError("Formato no soportado, use CSV o XLSX")
+    return FORMATOS[extension]
+
+def _celda(valor: Any) -> Optional[str]:
+    """Normalizar una celda a texto; las celdas vacías se omiten"""
+    if valor is None:
+        return None
+    if isinstance(valor, datetime):
+        valor = valor.date() if valor.time() == datetime.min.time() else valor
+        return valor.isoformat()
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    valor = str(valor).strip()
+    return valor or None
+
+def _fila(columnas: List[str], valores) -> Dict[str, Any]:
+    fila = {}
+    for columna, valor in zip(columnas, valores):
+        valor = _celda(valor)
+        if columna and valor is not None:
+            fila[columna] = valor
+    return fila
+
+def leer_bloques(ruta: str, formato: str, chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """Leer el archivo por bloques de chunk_size filas sin cargarlo entero en memoria"""
+    if formato == "csv":
+        import pandas as pd
+
+        lector = pd.read_csv(ruta, chunksize=chunk_size, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+        for bloque in lector:
+            columnas = [str(columna).strip() for columna in bloque.columns]
+            yield [_fila(columnas, valores) for valores in bloque.itertuples(index=False, name=None)]
+        return
+
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Se requiere openpyxl para importar archivos XLSX")
+
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        columnas = [str(columna).strip() if columna is not None else "" for columna in next(filas, ())]
+        bloque = []
+        for valores in filas:
+            bloque.append(_fila(columnas, valores))
+            if len(bloque) >= chunk_size:
+                yield bloque
+                bloque = []
+        if bloque:
+            yield bloque
+    finally:
+        libro.close()
+
+def _clave_equipo(documento: Dict[str, Any]) -> Tuple[Any, Any]:
+    """Un numero_serie identifica un equipo dentro de su empresa, no entre empresas"""
+    return documento.get("empresa_id"), documento.get("numero_serie")
+
+def _valor_ruta(documento: Dict[str, Any], ruta: str) -> Any:
+    for parte in ruta.split("."):
+        documento = documento[parte]
+    return documento
+
+def _errores_escritura(error: BulkWriteError) -> Dict[int, str]:
+    return {e["index"]: e.get("errmsg", "Error de escritura") for e in error.details.get("writeErrors", [])}
+
+class ImportService:
+    """
+    Importación masiva de equipos desde CSV/XLSX: lectura por bloques, validación y
+    cifrado en un pool de hilos (fuera del event loop) y escritura por lotes, solapando
+    la preparación de un bloque con la escritura del anterior.
+    """
+    def __init__(self):
+        self.collection = db.equipos
+        self.pool = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="importacion")
+
+    async def _preparar(self, bloque: List[Dict[str, Any]], validar: Validador) -> Tuple[List[tuple], Dict[int, str]]:
+        """Repartir el bloque entre los hilos del pool y unir los resultados"""
+        loop = asyncio.get_running_loop()
+        tamano = max(1, -(-len(bloque) // IMPORT_WORKERS))
+        partes = await asyncio.gather(*[
+            loop.run_in_executor(self.pool, validar, bloque[inicio:inicio + tamano])
+            for inicio in range(0, len(bloque), tamano)
+        ])
+
+        validos, errores = [], {}
+        for numero, (validos_parte, errores_parte) in enumerate(partes):
+            desplazamiento = numero * tamano
+            validos.extend((desplazamiento + indice, *resto) for indice, *resto in validos_parte)
+            errores.update({desplazamiento + indice: error for indice, error in errores_parte.items()})
+        return validos, errores
+
+    async def _insertar(self, validos: List[tuple]) -> Tuple[Dict[str, int], Dict[int, str]]:
+        fallidos = {}
+        try:
+            await self.collection.insert_many([documento for _, documento, _ in validos], ordered=False)
+        except BulkWriteError as e:
+            fallidos = _errores_escritura(e)
+
+        errores = {validos[posicion][0]: mensaje for posicion, mensaje in fallidos.items()}
+        escritos = [documento for posicion, (_, documento, _) in enumerate(validos) if posicion not in fallidos]
+        await stats_service.registrar_lote("equipos", despues=escritos)
+        if escritos:
+            await version_service.incrementar("equipos", {documento["empresa_id"] for documento in escritos})
+        return {"insertados": len(escritos)}, errores
+
+    async def _upsert(self, validos: List[tuple]) -> Tuple[Dict[str, int], Dict[int, str]]:
+        """
+        Alta o actualización por (empresa_id, numero_serie). En un equipo existente solo cambian
+        las columnas con valor en la fila; los valores por defecto del modelo se aplican solo al alta.
+        """
+        errores = {}
+
+        # Si un equipo se repite en el bloque, vale la última fila
+        ultima = {_clave_equipo(documento): indice for indice, documento, _ in validos}
+        for indice, documento, _ in validos:
+            if ultima[_clave_equipo(documento)] != indice:
+                errores[indice] = "numero_serie repetido en una fila posterior del archivo"
+        validos = [valido for valido in validos if valido[0] not in errores]
+
+        campos = {**CAMPOS_CONTADORES["equipos"], "numero_serie": 1}
+        filtro = {
+            "empresa_id": {"$in": list({empresa_id for empresa_id, _ in ultima})},
+            "numero_serie": {"$in": list({numero_serie for _, numero_serie in ultima})}
+        }
+        antes = {}
+        async for documento in self.collection.find(filtro, campos):
+            antes.setdefault(_clave_equipo(documento), documento)
+
+        operaciones, cambios_por_fila = [], []
+        for _, documento, columnas in validos:
+            cambios = {campo: _valor_ruta(documento, campo) for campo in columnas}
+            cambios["actualizado_en"] = documento["actualizado_en"]
+            # $setOnInsert no puede tocar un campo que $set ya modifica (ni su padre)
+            modificados = {campo.split(".", 1)[0] for campo in cambios}
+            al_insertar = {campo: valor for campo, valor in documento.items() if campo not in modificados}
+            operaciones.append(UpdateOne(
+                {"empresa_id": documento["empresa_id"], "numero_serie": documento["numero_serie"]},
+                {"$set": cambios, "$setOnInsert": al_insertar},
+                upsert=True
+            ))
+            cambios_por_fila.append(cambios)
+
+        fallidos = {}
+        try:
+            await self.collection.bulk_write(operaciones, ordered=False)
+        except BulkWriteError as e:
+            fallidos = _errores_escritura(e)
+
+        conteo = {"insertados": 0, "actualizados": 0}
+        anteriores, posteriores = [], []
+        for posicion, (indice, documento, _) in enumerate(validos):
+            if posicion in fallidos:
+                errores[indice] = fallidos[posicion]
+                continue
+            anterior = antes.get(_clave_equipo(documento))
+            if anterior:
+                conteo["actualizados"] += 1
+                anteriores.append(anterior)
+                posteriores.append({**anterior, **cambios_por_fila[posicion]})
+            else:
+                conteo["insertados"] += 1
+                posteriores.append(documento)
+
+        await stats_service.registrar_lote("equipos", anteriores, posteriores)
+        if posteriores:
+            await version_service.incrementar("equipos", {documento.get("empresa_id") for documento in anteriores + posteriores})
+        return conteo, errores
+
+    async def _escribir(self, filas: int, validos: List[tuple], errores: Dict[int, str], primera_fila: int,
+                        modo: str, job_id: Optional[str], on_progress) -> Dict[str, int]:
+        conteo = {}
+        if validos:
+            conteo, errores_escritura = await (self._upsert(validos) if modo == "upsert" else self._insertar(validos))
+            errores = {**errores, **errores_escritura}
+
+        incrementos = {
+            "procesados": filas,
+            "insertados": conteo.get("insertados", 0),
+            "actualizados": conteo.get("actualizados", 0),
+            "errores": len(errores)
+        }
+        # Número de fila del archivo: la fila 1 es el encabezado
+        detalle = [{"fila": primera_fila + indice, "error": error} for indice, error in sorted(errores.items())]
+
+        if job_id:
+            await job_service.progreso(job_id, incrementos, detalle)
+        if on_progress:
+            on_progress(incrementos, detalle)
+        return incrementos
+
+    async def importar(self, ruta: str, validar: Validador, modo: str = "insertar", formato: Optional[str] = None,
+                       job_id: Optional[str] = None, on_progress=None, chunk_size: int = IMPORT_CHUNK_SIZE,
+                       eliminar_archivo: bool = False) -> Dict[str, int]:
+        """
+        Importar equipos desde ruta.
+        modo: 'insertar' (insert_many) o 'upsert' (alta o actualización por numero_serie).
+        Devuelve los totales; el progreso se publica por bloque en el trabajo y/o en on_progress.
+        """
+        if modo not in ("insertar", "upsert"):
+            raise ValueError("Modo de importación no válido")
+
+        loop = asyncio.get_running_loop()
+        totales = {"procesados": 0, "insertados": 0, "actualizados": 0, "errores": 0}
+
+        def acumular(escritura: asyncio.Task):
+            for campo, valor in escritura.result().items():
+                totales[campo] += valor
+
+        try:
+            if job_id:
+                await job_service.iniciar(job_id)
+
+            bloques = leer_bloques(ruta, formato or detectar_formato(ruta), chunk_size)
+            primera_fila, escritura = 2, None
+            while True:
+                bloque = await loop.run_in_executor(self.pool, next, bloques, None)
+                if bloque is None:
+                    break
+
+                validos, errores = await self._preparar(bloque, validar)
+
+                # Un solo bloque en escritura a la vez: se prepara el siguiente mientras tanto
+                if escritura:
+                    await escritura
+                    acumular(escritura)
+                escritura = asyncio.create_task(self._escribir(len(bloque), validos, errores, primera_fila, modo, job_id, on_progress))
+                primera_fila += len(bloque)
+
+            if escritura:
+                await escritura
+                acumular(escritura)
+        except Exception as e:
+            if job_id:
+                await job_service.terminar(job_id, error=str(e), resultado=totales)
+            raise
+        finally:
+            if eliminar_archivo and os.path.exists(ruta):
+                os.remove(ruta)
+            # Los equipos importados se incorporan al índice de búsqueda por su actualizado_en
+            equipos_search.invalidar()
+
+        if job_id:
+            await job_service.terminar(job_id, resultado=totales)
+        return totales
+
+import_service = ImportService()
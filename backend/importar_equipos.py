@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Importar equipos desde un archivo CSV o XLSX (migraciones de clientes).
+
+Uso:
+    python importar_equipos.py equipos.xlsx [--modo upsert] [--chunk-size 1000]
+"""
+import argparse
+import asyncio
+import time
+
+from import_service import import_service, IMPORT_CHUNK_SIZE
+from server import validar_filas_equipo
+
+async def main(args):
+    inicio = time.monotonic()
+    procesadas = 0
+
+    def mostrar_progreso(incrementos, errores):
+        nonlocal procesadas
+        procesadas += incrementos["procesados"]
+        for error in errores:
+            print(f"  Fila {error['fila']}: {error['error']}")
+        print(f"{procesadas} filas procesadas ({procesadas / (time.monotonic() - inicio):.0f} filas/s)")
+
+    totales = await import_service.importar(
+        args.archivo,
+        validar_filas_equipo,
+        modo=args.modo,
+        on_progress=mostrar_progreso,
+        chunk_size=args.chunk_size
+    )
+    print(
+        f"Importación terminada en {time.monotonic() - inicio:.1f}s: "
+        f"{totales['insertados']} insertados, {totales['actualizados']} actualizados, {totales['errores']} errores"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importar equipos desde CSV o XLSX")
+    parser.add_argument("archivo")
+    parser.add_argument("--modo", choices=["insertar", "upsert"], default="insertar")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,100 @@
+from bson import ObjectId
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+import os
+from dotenv import load_dotenv
+
+from database import db
+
+load_dotenv()
+
+# Errores por fila que se guardan como máximo en el documento del trabajo
+MAX_ERRORES_GUARDADOS = 1000
+# Un trabajo sin progreso durante este tiempo se considera interrumpido (proceso reiniciado)
+TRABAJO_INACTIVO = timedelta(seconds=int(os.getenv("TRABAJO_INACTIVO_SEGUNDOS", "600")))
+
+class JobService:
+    """
+    Trabajos en segundo plano (importaciones, borrados en cascada) registrados en la
+    colección 'trabajos', para consultar su progreso desde cualquier proceso del servidor.
+    """
+    def __init__(self):
+        self.collection = db.trabajos
+
+    async def crear(self, tipo: str, usuario_id: Optional[str] = None, **datos) -> str:
+        ahora = datetime.utcnow()
+        result = await self.collection.insert_one({
+            "tipo": tipo,
+            "estado": "pendiente",
+            "usuario_id": usuario_id,
+            "progreso": {},
+            "errores": [],
+            "creado_en": ahora,
+            "actualizado_en": ahora,
+            **datos
+        })
+        return str(result.inserted_id)
+
+    async def iniciar(self, job_id: str):
+        await self.collection.update_one(
+            {"_id": ObjectId(job_id)},
+            {"$set": {"estado": "en_curso", "iniciado_en": datetime.utcnow(), "actualizado_en": datetime.utcnow()}}
+        )
+
+    async def progreso(self, job_id: str, incrementos: Dict[str, int], errores: List[Dict[str, Any]] = ()):
+        """Sumar contadores de progreso y añadir errores (solo los primeros MAX_ERRORES_GUARDADOS)"""
+        update = {
+            "$inc": {f"progreso.{campo}": valor for campo, valor in incrementos.items()},
+            "$set": {"actualizado_en": datetime.utcnow()}
+        }
+        if errores:
+            update["$push"] = {"errores": {"$each": list(errores), "$slice": MAX_ERRORES_GUARDADOS}}
+        await self.collection.update_one({"_id": ObjectId(job_id)}, update)
+
+    async def terminar(self, job_id: str, error: Optional[str] = None, resultado: Optional[Dict[str, Any]] = None):
+        cambios = {
+            "estado": "error" if error else "completado",
+            "terminado_en": datetime.utcnow(),
+            "actualizado_en": datetime.utcnow()
+        }
+        if error:
+            cambios["error"] = error
+        if resultado is not None:
+            cambios["resultado"] = resultado
+        await self.collection.update_one({"_id": ObjectId(job_id)}, {"$set": cambios})
+
+    def _inactivos(self) -> Dict[str, Any]:
+        return {
+            "estado": {"$in": ["pendiente", "en_curso"]},
+            "actualizado_en": {"$lt": datetime.utcnow() - TRABAJO_INACTIVO}
+        }
+
+    async def reclamar_interrumpido(self, tipo: str) -> Optional[Dict[str, Any]]:
+        """
+        Tomar un trabajo interrumpido de este tipo para reanudarlo. Es atómico: si varios
+        procesos arrancan a la vez, cada trabajo lo reanuda solo uno de ellos.
+        """
+        return await self.collection.find_one_and_update(
+            {"tipo": tipo, **self._inactivos()},
+            {"$set": {"actualizado_en": datetime.utcnow()}, "$inc": {"reanudaciones": 1}}
+        )
+
+    async def abandonar_interrumpidos(self, excluir_tipos: List[str] = ()) -> int:
+        """Marcar como error los trabajos interrumpidos que no se pueden reanudar"""
+        result = await self.collection.update_many(
+            {"tipo": {"$nin": list(excluir_tipos)}, **self._inactivos()},
+            {"$set": {
+                "estado": "error",
+                "error": "Interrumpido por un reinicio del servidor",
+                "terminado_en": datetime.utcnow(),
+                "actualizado_en": datetime.utcnow()
+            }}
+        )
+        return result.modified_count
+
+    async def obtener(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not ObjectId.is_valid(job_id):
+            return None
+        return await self.collection.find_one({"_id": ObjectId(job_id)})
+
+job_service = JobService()
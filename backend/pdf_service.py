@@ -1,7 +1,10 @@
 from fpdf import FPDF
 from typing import List, Dict, Any
 from datetime import datetime
+import base64
+import hashlib
 import os
+import tempfile
 
 class ITSMReportPDF(FPDF):
     def __init__(self, titulo: str = "Reporte ITSM", logo_path: str = None, sistema_nombre: str = "Sistema ITSM"):
@@ -184,6 +187,40 @@ class PDFService:
         base_dir = os.path.dirname(os.path.abspath(__file__))
         self.output_dir = os.path.join(base_dir, "pdfs")
         os.makedirs(self.output_dir, exist_ok=True)
+        self.logo_dir = os.path.join(tempfile.gettempdir(), "itsm_logos")
+        os.makedirs(self.logo_dir, exist_ok=True)
+        # Último logo resuelto: (logo_url, ruta del archivo)
+        self._logo = (None, None)
+    
+    def get_logo_path(self, logo_url: str = None) -> str:
+        """
+        Ruta de un archivo con el logo de la configuración (data URL en base64).
+        El nombre se deriva del hash del contenido, así que cada logo se decodifica y
+        escribe una sola vez y los reportes concurrentes comparten el mismo archivo.
+        """
+        if not logo_url or not logo_url.startswith("data:image"):
+            return None
+        
+        url_anterior, ruta_anterior = self._logo
+        # La limpieza de temporales puede haber borrado el archivo: entonces se vuelve a escribir
+        if (logo_url is url_anterior or logo_url == url_anterior) and os.path.exists(ruta_anterior):
+            return ruta_anterior
+        
+        cabecera, datos = logo_url.split(",", 1)
+        extension = "".join(c for c in cabecera[len("data:image/"):].split(";")[0] if c.isalnum()) or "png"
+        digest = hashlib.sha256(datos.encode()).hexdigest()[:32]
+        ruta = os.path.join(self.logo_dir, f"logo_{digest}.{extension}")
+        
+        if not os.path.exists(ruta):
+            # Escritura atómica: otro proceso nunca ve un archivo a medio escribir
+            os.makedirs(self.logo_dir, exist_ok=True)
+            fd, temporal = tempfile.mkstemp(dir=self.logo_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(base64.b64decode(datos))
+            os.replace(temporal, ruta)
+        
+        self._logo = (logo_url, ruta)
+        return ruta
     
     async def get_config(self, db):
         config = await db.configuracion.find_one({})
@@ -195,6 +232,7 @@ class PDFService:
                                   template: str = "moderna") -> str:
         """
         Generar reporte detallado de empresa con todos sus equipos y mantenimientos
+        equipos: cada equipo trae en 'bitacoras' sus mantenimientos ya agrupados y ordenados por fecha
         template: 'moderna', 'clasica', 'minimalista'
         """
         pdf = ITSMReportPDF(f"Reporte de Empresa - {empresa.get('nombre', '')}", logo_path, sistema_nombre)
@@ -811,7 +849,7 @@ class PDFService:
                             pdf.cell(0, 4, f"  • {campo}: {valor_str}", 0, 1)
                 
                 # Bitácoras detalladas de este equipo
-                bitacoras_equipo = [b for b in bitacoras if b.get('equipo_id') == equipo.get('_id')]
+                bitacoras_equipo = equipo.get('bitacoras', [])
                 if bitacoras_equipo:
                     pdf.ln(3)
                     pdf.set_font("DejaVu", "B", 10)
@@ -887,7 +925,7 @@ Email: {empresa.get('email', 'N/A')}""")
                 pdf.ln(3)
                 
                 # Historial de mantenimientos de este equipo
-                bitacoras_equipo = [b for b in bitacoras if b.get('equipo_id') == equipo.get('_id')]
+                bitacoras_equipo = equipo.get('bitacoras', [])
                 if bitacoras_equipo:
                     pdf.set_font("DejaVu", "B", 10)
                     pdf.cell(0, 6, f"Historial de Mantenimientos ({len(bitacoras_equipo)})", 0, 1)
@@ -949,7 +987,7 @@ Email: {empresa.get('email', 'N/A')}""")
                 pdf.ln(2)
                 
                 # Historial de mantenimientos minimalista
-                bitacoras_equipo = [b for b in bitacoras if b.get('equipo_id') == equipo.get('_id')]
+                bitacoras_equipo = equipo.get('bitacoras', [])
                 if bitacoras_equipo:
                     pdf.set_font("DejaVu", "", 8)
                     pdf.set_text_color(100, 116, 139)
@@ -0,0 +1,43 @@
+from fastapi.responses import JSONResponse, Response
+from typing import Any, Optional
+from datetime import datetime
+from bson import ObjectId
+import orjson
+
+try:
+    import msgpack
+except ImportError:  # incluido en requirements.txt; sin él se responde JSON aunque se pida msgpack
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+def json_default(valor: Any):
+    """Tipos que orjson/msgpack no serializan por sí mismos"""
+    if isinstance(valor, ObjectId):
+        return str(valor)
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSONResponse con orjson: ObjectId y datetime se codifican de forma nativa,
+    así que los handlers pueden devolver documentos de Mongo sin reescribirlos.
+    """
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, default=json_default, use_bin_type=True)
+
+def api_response(contenido: Any, accept: Optional[str] = None, status_code: int = 200) -> Response:
+    """
+    Respuesta según el header Accept: msgpack si se pide y está instalado, JSON (orjson) en otro caso.
+    Devolver un Response evita el recorrido de jsonable_encoder de FastAPI.
+    """
+    if msgpack is not None and accept and MSGPACK_MEDIA_TYPE in accept:
+        return MsgPackResponse(contenido, status_code=status_code)
+    return ORJSONResponse(contenido, status_code=status_code)
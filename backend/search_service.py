@@ -0,0 +1,369 @@
+from array import array
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import heapq
+import html
+import os
+import re
+import time
+import unicodedata
+from dotenv import load_dotenv
+
+from database import db
+from cache_service import TTLCache
+
+load_dotenv()
+
+# Campos de equipos indexados y su peso en la puntuación
+CAMPOS_BUSQUEDA_EQUIPOS = {
+    "numero_serie": 3,
+    "direccion_mac": 3,
+    "direccion_ip": 3,
+    "hostname": 2,
+    "nombre": 1,
+    "marca": 1,
+    "modelo": 1,
+}
+
+# Pesos de mayor a menor; cada registro guarda un texto por peso con los valores separados por \x00
+PESOS = sorted(set(CAMPOS_BUSQUEDA_EQUIPOS.values()), reverse=True)
+
+_NO_ALFANUMERICO = re.compile(r"[\W_]+")
+
+def normalizar(texto: Any) -> str:
+    """Minúsculas, sin acentos y solo alfanuméricos: 'AA:BB-01' -> 'aabb01'"""
+    if texto is None:
+        return ""
+    texto = str(texto).lower()
+    if not texto.isascii():
+        texto = "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+    return _NO_ALFANUMERICO.sub("", texto)
+
+def _trigramas(valor: str) -> Iterable[str]:
+    return (valor[i:i + 3] for i in range(len(valor) - 2))
+
+def _puntuar(patrones: Tuple[str, str, str], grupos: Tuple[str, ...]) -> int:
+    """Mejor coincidencia del término: valor completo (10), prefijo (5) o parcial (2), por el peso del campo"""
+    termino, exacto, prefijo = patrones
+    mejor = 0
+    for peso, texto in zip(PESOS, grupos):
+        if termino not in texto:
+            continue
+        if exacto in texto:
+            return max(mejor, 10 * peso)
+        mejor = max(mejor, (5 if prefijo in texto else 2) * peso)
+    return mejor
+
+class EquiposSearchIndex:
+    """
+    Índice de trigramas en memoria sobre los campos identificativos de los equipos
+    (serie, MAC, IP, hostname, nombre, marca, modelo) para búsquedas por prefijo y parciales.
+
+    Se construye completo en la primera búsqueda. Los handlers de este proceso lo actualizan
+    al escribir; los cambios de otros procesos se recogen cada SEARCH_INDEX_TTL segundos
+    leyendo los equipos con actualizado_en reciente. Los equipos borrados en otros procesos
+    se descartan al no encontrarse en la base de datos (ver eliminar).
+
+    Los resultados se cachean por consulta; un cambio en el índice invalida solo las
+    consultas de las empresas afectadas y las que no filtran por empresa.
+    """
+    # Margen sobre actualizado_en por diferencias de reloj entre servidores
+    MARGEN_SINCRONIZACION = timedelta(seconds=60)
+    # Por encima de estos cambios pendientes se reconstruye en lugar de actualizar en el event loop
+    MAX_CAMBIOS_INCREMENTALES = 2000
+    # Equipos leídos e indexados por lote al construir: no se acumula la colección en memoria
+    LOTE_CONSTRUCCION = int(os.getenv("SEARCH_BUILD_BATCH", "5000"))
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._registros: List[Optional[tuple]] = []
+        self._por_id: Dict[str, int] = {}
+        self._trigramas: Dict[str, array] = {}
+        self._prefijos: Dict[str, array] = {}
+        self._borrados = 0
+        # Cambia con cada modificación del índice: un resultado calculado mientras tanto no se cachea
+        self._version = 0
+        self._resultados = TTLCache("busqueda_equipos", maxsize=int(os.getenv("SEARCH_CACHE_SIZE", "256")), ttl=ttl)
+        self._sincronizado_en: Optional[float] = None
+        self._marca: Optional[datetime] = None
+        self._sincronizacion: Optional[asyncio.Task] = None
+        # Escrituras recibidas durante una reconstrucción, para aplicarlas al índice nuevo
+        self._pendientes: Optional[List[tuple]] = None
+
+    @staticmethod
+    def _construir(documentos: List[Dict[str, Any]], estructuras: Optional[tuple] = None) -> tuple:
+        """Indexar documentos en estructuras nuevas o, si se pasan, a continuación de las existentes"""
+        registros, por_id, trigramas, prefijos = estructuras or ([], {}, {}, {})
+        for documento in documentos:
+            EquiposSearchIndex._agregar(registros, por_id, trigramas, prefijos, documento)
+        return registros, por_id, trigramas, prefijos
+
+    @staticmethod
+    def _registro(documento: Dict[str, Any]) -> Tuple[tuple, Dict[str, str]]:
+        """(equipo_id, empresa_id, textos por peso, numero_serie) y los valores normalizados"""
+        valores = {campo: normalizar(documento.get(campo)) for campo in CAMPOS_BUSQUEDA_EQUIPOS}
+        grupos = tuple(
+            "\x00" + "\x00".join(valor for campo, valor in valores.items() if CAMPOS_BUSQUEDA_EQUIPOS[campo] == peso) + "\x00"
+            for peso in PESOS
+        )
+        registro = (str(documento["_id"]), str(documento.get("empresa_id") or ""), grupos, valores["numero_serie"])
+        return registro, valores
+
+    @staticmethod
+    def _agregar(registros, por_id, trigramas, prefijos, documento: Dict[str, Any]):
+        registro, valores = EquiposSearchIndex._registro(documento)
+        indice = len(registros)
+        registros.append(registro)
+        por_id[registro[0]] = indice
+
+        gramas = set()
+        for valor in valores.values():
+            gramas.update(_trigramas(valor))
+        for grama in gramas:
+            trigramas.setdefault(grama, array("I")).append(indice)
+        for prefijo in {valor[:2] for valor in valores.values() if len(valor) >= 2}:
+            prefijos.setdefault(prefijo, array("I")).append(indice)
+
+    def _proyeccion(self) -> Dict[str, int]:
+        proyeccion = {campo: 1 for campo in CAMPOS_BUSQUEDA_EQUIPOS}
+        proyeccion["empresa_id"] = 1
+        return proyeccion
+
+    async def _reconstruir(self):
+        """Construcción completa en un hilo aparte; el índice anterior sigue respondiendo mientras tanto"""
+        self._pendientes = []
+        try:
+            marca = datetime.utcnow() - self.MARGEN_SINCRONIZACION
+            loop = asyncio.get_running_loop()
+            estructuras = ([], {}, {}, {})
+            lote = []
+            cursor = db.equipos.find({}, self._proyeccion()).batch_size(self.LOTE_CONSTRUCCION)
+            async for documento in cursor:
+                lote.append(documento)
+                if len(lote) >= self.LOTE_CONSTRUCCION:
+                    await loop.run_in_executor(None, self._construir, lote, estructuras)
+                    lote = []
+            if lote:
+                await loop.run_in_executor(None, self._construir, lote, estructuras)
+
+            self._registros, self._por_id, self._trigramas, self._prefijos = estructuras
+            self._borrados = 0
+            self._version += 1
+            self._resultados.clear()
+            self._marca = marca
+
+            pendientes, self._pendientes = self._pendientes, None
+            for operacion, argumento in pendientes:
+                if operacion == "indexar":
+                    self.indexar(argumento)
+                else:
+                    self.eliminar(argumento)
+        finally:
+            self._pendientes = None
+
+    async def _sincronizar(self):
+        try:
+            # Compactar cuando los registros borrados pesan demasiado
+            if self._marca is None or self._borrados > max(1000, len(self._registros) // 4):
+                await self._reconstruir()
+            else:
+                marca = datetime.utcnow() - self.MARGEN_SINCRONIZACION
+                filtro = {"actualizado_en": {"$gte": self._marca}}
+                cambios = await db.equipos.find(filtro, self._proyeccion()).limit(self.MAX_CAMBIOS_INCREMENTALES + 1).to_list(None)
+                if len(cambios) > self.MAX_CAMBIOS_INCREMENTALES:
+                    await self._reconstruir()
+                else:
+                    self.indexar(cambios)
+                    self._marca = marca
+            self._sincronizado_en = time.monotonic()
+        finally:
+            self._sincronizacion = None
+
+    async def _asegurar(self):
+        """Construir el índice la primera vez; después sincronizarlo en segundo plano al caducar"""
+        if self._sincronizacion is None and (
+            self._sincronizado_en is None or time.monotonic() - self._sincronizado_en > self.ttl
+        ):
+            self._sincronizacion = asyncio.create_task(self._sincronizar())
+        if self._sincronizado_en is None:
+            await asyncio.shield(self._sincronizacion)
+
+    def _invalidar_resultados(self, empresas: Iterable[str]):
+        """Descartar las búsquedas cacheadas de esas empresas y las de todas las empresas"""
+        empresas = set(empresas)
+        if not empresas:
+            return
+        self._version += 1
+        self._resultados.invalidate_where(lambda clave: not clave[1] or clave[1] in empresas)
+
+    def indexar(self, documentos: Iterable[Dict[str, Any]]):
+        """Añadir o reemplazar equipos (con _id) en el índice"""
+        documentos = list(documentos)
+        if self._pendientes is not None:
+            self._pendientes.append(("indexar", documentos))
+        if self._marca is None:
+            return
+        # La sincronización periódica relee equipos ya indexados: si no cambiaron, no se tocan
+        documentos = [documento for documento in documentos if not self._indexado(documento)]
+        self.eliminar([documento["_id"] for documento in documentos], registrar=False)
+        for documento in documentos:
+            self._agregar(self._registros, self._por_id, self._trigramas, self._prefijos, documento)
+        self._invalidar_resultados(str(documento.get("empresa_id") or "") for documento in documentos)
+
+    def _indexado(self, documento: Dict[str, Any]) -> bool:
+        indice = self._por_id.get(str(documento["_id"]))
+        return indice is not None and self._registros[indice] == self._registro(documento)[0]
+
+    def eliminar(self, ids: Iterable[Any], registrar: bool = True):
+        """Quitar equipos del índice; sus entradas de trigramas se descartan al reconstruir"""
+        ids = [str(i) for i in ids]
+        if registrar and self._pendientes is not None:
+            self._pendientes.append(("eliminar", ids))
+        empresas = set()
+        for equipo_id in ids:
+            indice = self._por_id.pop(equipo_id, None)
+            if indice is not None:
+                empresas.add(self._registros[indice][1])
+                self._registros[indice] = None
+                self._borrados += 1
+        self._invalidar_resultados(empresas)
+
+    def invalidar(self):
+        """Sincronizar en la próxima búsqueda (tras cambios masivos)"""
+        if self._sincronizado_en is not None:
+            self._sincronizado_en = 0.0
+
+    @staticmethod
+    def _candidatos(termino: str, trigramas: Dict[str, array], prefijos: Dict[str, array]) -> set:
+        if len(termino) < 3:
+            return set(prefijos.get(termino, ()))
+
+        listas = [trigramas.get(grama) for grama in set(_trigramas(termino))]
+        if any(lista is None for lista in listas):
+            return set()
+        listas.sort(key=len)
+        candidatos = set(listas[0])
+        for lista in listas[1:]:
+            candidatos.intersection_update(lista)
+            if not candidatos:
+                break
+        return candidatos
+
+    async def buscar(self, texto: str, empresa_id: Optional[str] = None, limit: int = 20) -> List[Tuple[str, int]]:
+        """
+        Devolver [(equipo_id, puntuación)] ordenados por relevancia.
+        Cada palabra del texto debe aparecer (completa, como prefijo o parcial) en algún campo.
+        """
+        terminos = [normalizar(palabra) for palabra in texto.split()]
+        terminos = [termino for termino in terminos if termino]
+        if not terminos or any(len(termino) < 2 for termino in terminos):
+            raise ValueError("Cada término de búsqueda debe tener al menos 2 caracteres")
+
+        await self._asegurar()
+
+        # Las búsquedas amplias ('dell') puntúan decenas de miles de candidatos: se repiten mucho
+        # y se puntúan en un hilo para no bloquear el event loop
+        clave = (tuple(terminos), empresa_id, limit)
+        resultado = self._resultados.get(clave)
+        if resultado is None:
+            version = self._version
+            estructuras = (self._registros, self._trigramas, self._prefijos)
+            resultado = await asyncio.get_running_loop().run_in_executor(
+                None, self._buscar, estructuras, terminos, empresa_id, limit
+            )
+            if version == self._version:
+                self._resultados.set(clave, resultado)
+        return resultado
+
+    @staticmethod
+    def _buscar(estructuras: tuple, terminos: List[str], empresa_id: Optional[str], limit: int) -> List[Tuple[str, int]]:
+        registros, trigramas, prefijos = estructuras
+        candidatos = None
+        for termino in sorted(terminos, key=len, reverse=True):
+            encontrados = EquiposSearchIndex._candidatos(termino, trigramas, prefijos)
+            candidatos = encontrados if candidatos is None else candidatos & encontrados
+            if not candidatos:
+                return []
+
+        patrones = [(termino, f"\x00{termino}\x00", f"\x00{termino}") for termino in terminos]
+        resultados = []
+        for indice in candidatos:
+            registro = registros[indice]
+            if registro is None or (empresa_id and registro[1] != empresa_id):
+                continue
+
+            puntuacion = 0
+            for patron in patrones:
+                mejor = _puntuar(patron, registro[2])
+                if not mejor:
+                    break
+                puntuacion += mejor
+            else:
+                resultados.append((puntuacion, registro[3], registro[0]))
+
+        # Mayor puntuación primero; a igualdad, por número de serie
+        mejores = heapq.nsmallest(limit, resultados, key=lambda resultado: (-resultado[0], resultado[1]))
+        return [(equipo_id, puntuacion) for puntuacion, _, equipo_id in mejores]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "equipos": len(self._por_id),
+            "trigramas": len(self._trigramas),
+            "borrados": self._borrados,
+            "edad": round(time.monotonic() - self._sincronizado_en, 1) if self._sincronizado_en else None,
+            "ttl": self.ttl
+        }
+
+# Campos de bitácora cubiertos por el índice de texto 'bitacoras_texto'
+CAMPOS_TEXTO_BITACORAS = ["descripcion", "diagnostico_problema", "solucion_aplicada", "observaciones", "anotaciones_extras"]
+
+_PALABRA = re.compile(r"\w+")
+
+def _sin_acentos(texto: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", texto.lower()) if not unicodedata.combining(c))
+
+def raices_busqueda(texto: str) -> List[str]:
+    """
+    Raíces de los términos de una consulta $text para resaltarlos, aproximando el stemming
+    de Mongo: 'impresoras' resalta 'impresora'. Se ignoran los términos negados (-palabra)
+    y las palabras de menos de 3 letras.
+    """
+    raices = []
+    for termino in texto.replace('"', " ").split():
+        if termino.startswith("-"):
+            continue
+        for palabra in _PALABRA.findall(_sin_acentos(termino)):
+            if len(palabra) >= 3:
+                raices.append(palabra[:max(3, len(palabra) - 2)] if len(palabra) > 4 else palabra)
+    return raices
+
+def fragmento(texto: Optional[str], raices: List[str], contexto: int = 60) -> Optional[str]:
+    """
+    Fragmento de texto alrededor de la primera coincidencia, escapado como HTML y con las
+    palabras coincidentes entre <mark></mark>. None si el campo no contiene ningún término.
+    """
+    if not texto or not raices:
+        return None
+
+    coincidencias = [
+        (m.start(), m.end()) for m in _PALABRA.finditer(texto)
+        if any(_sin_acentos(m.group()).startswith(raiz) for raiz in raices)
+    ]
+    if not coincidencias:
+        return None
+
+    inicio = max(0, coincidencias[0][0] - contexto)
+    fin = min(len(texto), coincidencias[0][1] + 2 * contexto)
+    partes, posicion = [], inicio
+    for desde, hasta in coincidencias:
+        if desde < inicio or hasta > fin:
+            continue
+        partes.append(html.escape(texto[posicion:desde]))
+        partes.append(f"<mark>{html.escape(texto[desde:hasta])}</mark>")
+        posicion = hasta
+    partes.append(html.escape(texto[posicion:fin]))
+
+    return ("…" if inicio > 0 else "") + "".join(partes) + ("…" if fin < len(texto) else "")
+
+equipos_search = EquiposSearchIndex(ttl=float(os.getenv("SEARCH_INDEX_TTL", "30")))
@@ -1,20 +1,39 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Body, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Body, BackgroundTasks, Query, UploadFile, File
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, ValidationError
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateMany
+from pymongo.errors import BulkWriteError
+import asyncio
+import base64
+import copy
+import hashlib
+import json
+import orjson
 import os
+import tempfile
 import logging
 
 from models import Usuario, Empresa, Equipo, Bitacora, Servicio, Configuracion
 from auth import verify_password, get_password_hash, create_access_token, verify_token, encrypt_password, decrypt_password
-from database import db, init_db
+from database import client, db, init_db
 from email_service import email_service
 from pdf_service import pdf_service
+from cache_service import user_cache, config_cache, get_cache_stats
+from responses import ORJSONResponse, api_response, json_default
+from compression import CompressionMiddleware
+from stats_service import stats_service, CAMPOS_CONTADORES, GLOBAL_ID
+from jobs_service import job_service
+from import_service import import_service, detectar_formato
+from version_service import version_service
+from events_service import event_service, TIPOS_EVENTO, SSE_RETRY_SECONDS
+from search_service import equipos_search, CAMPOS_BUSQUEDA_EQUIPOS, CAMPOS_TEXTO_BITACORAS, raices_busqueda, fragmento
 
-app = FastAPI(title="Sistema ITSM API")
+app = FastAPI(title="Sistema ITSM API", default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 app.add_middleware(
@@ -24,6 +43,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -122,6 +142,18 @@ class ConfiguracionUpdate(BaseModel):
     campos_bitacoras: Optional[List[Dict[str, str]]] = None
     campos_servicios: Optional[List[Dict[str, str]]] = None
 
+class OperacionLote(BaseModel):
+    filtro: Dict[str, Any]
+    cambios: Dict[str, Any]
+
+class BulkUpdateRequest(BaseModel):
+    filtro: Optional[Dict[str, Any]] = None
+    cambios: Optional[Dict[str, Any]] = None
+    operaciones: List[OperacionLote] = []
+
+class BulkDeleteRequest(BaseModel):
+    filtro: Dict[str, Any]
+
 async def get_current_user(authorization: Optional[str] = Header(None)) -> Dict[str, Any]:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="No autorizado")
@@ -132,18 +164,513 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> Dict[
     if not payload:
         raise HTTPException(status_code=401, detail="Token inválido")
     
-    user = await db.usuarios.find_one({"_id": ObjectId(payload.get("sub"))})
-    if not user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    user_id = payload.get("sub")
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await db.usuarios.find_one({"_id": ObjectId(user_id)})
+        if not user:
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        
+        user["_id"] = str(user["_id"])
+        user_cache.set(user_id, user)
     
-    user["_id"] = str(user["_id"])
-    return user
+    # Copia para que los handlers no modifiquen la entrada en caché
+    return dict(user)
+
+async def get_current_user_sse(authorization: Optional[str] = Header(None), token: Optional[str] = None) -> Dict[str, Any]:
+    """EventSource no permite enviar cabeceras: el token también se acepta en ?token="""
+    if not authorization and token:
+        authorization = f"Bearer {token}"
+    return await get_current_user(authorization)
 
 async def get_admin_user(current_user: Dict = Depends(get_current_user)):
     if current_user.get("rol") != "administrador":
         raise HTTPException(status_code=403, detail="Acceso denegado")
     return current_user
 
+async def get_nombres_por_id(collection, ids) -> Dict[str, str]:
+    """Obtener {id: nombre} para varios documentos con una sola consulta $in"""
+    object_ids = [ObjectId(i) for i in set(ids) if i and ObjectId.is_valid(i)]
+    if not object_ids:
+        return {}
+    
+    nombres = {}
+    async for doc in collection.find({"_id": {"$in": object_ids}}, {"nombre": 1}):
+        nombres[str(doc["_id"])] = doc.get("nombre")
+    return nombres
+
+async def iter_bitacoras_con_nombres(query: Dict[str, Any], batch_size: int = 500,
+                                     projection: Optional[Dict[str, Any]] = None):
+    """
+    Recorrer bitácoras (más recientes primero) en lotes, agregando los campos
+    'equipo' y 'tecnico' con una consulta por colección y por lote
+    """
+    cursor = db.bitacoras.find(query, projection).sort("fecha", -1).batch_size(batch_size)
+    while True:
+        lote = await cursor.to_list(length=batch_size)
+        if not lote:
+            break
+        
+        equipos, tecnicos = await asyncio.gather(
+            get_nombres_por_id(db.equipos, [b.get("equipo_id") for b in lote]),
+            get_nombres_por_id(db.usuarios, [b.get("tecnico_id") for b in lote])
+        )
+        for bitacora in lote:
+            bitacora["equipo"] = equipos.get(bitacora.get("equipo_id"), "N/A")
+            bitacora["tecnico"] = tecnicos.get(bitacora.get("tecnico_id"), "N/A")
+        
+        yield lote
+
+async def get_config() -> Optional[Dict[str, Any]]:
+    """Configuración del sistema desde la caché del proceso; solo va a Mongo si no está en caché"""
+    config = config_cache.get("config")
+    if config is None:
+        config = await db.configuracion.find_one({})
+        if config:
+            config_cache.set("config", config)
+    # Copia profunda: listas y dicts anidados (campos personalizados) no se comparten con la caché
+    return copy.deepcopy(config) if config else None
+
+async def get_marca_reportes() -> tuple:
+    """(ruta del logo, nombre del sistema) para los reportes PDF; el logo se decodifica una sola vez por contenido"""
+    config = await get_config()
+    if not config:
+        return None, "Sistema ITSM"
+    return pdf_service.get_logo_path(config.get("logo_url")), config.get("nombre_sistema", "Sistema ITSM")
+
+async def actualizar_config(cambios: Dict[str, Any]) -> Dict[str, Any]:
+    """Aplicar cambios a la configuración y refrescar la caché con el documento resultante"""
+    config = await db.configuracion.find_one_and_update(
+        {},
+        {"$set": cambios},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    config_cache.set("config", config)
+    return copy.deepcopy(config)
+
+def calcular_rango_fechas(periodo: str, fecha_inicio: Optional[str] = None):
+    """Calcular (inicio, fin) del rango de fechas según período: dia, semana, mes o personalizado"""
+    fecha_fin = datetime.utcnow()
+    if periodo == "dia":
+        fecha_inicio_dt = fecha_fin - timedelta(days=1)
+    elif periodo == "semana":
+        fecha_inicio_dt = fecha_fin - timedelta(weeks=1)
+    elif periodo == "mes":
+        fecha_inicio_dt = fecha_fin - timedelta(days=30)
+    else:
+        if fecha_inicio:
+            fecha_inicio_dt = datetime.fromisoformat(fecha_inicio)
+        else:
+            fecha_inicio_dt = datetime.utcnow() - timedelta(days=30)
+    
+    return fecha_inicio_dt, fecha_fin
+
+async def get_bitacoras_reporte(query: Dict[str, Any], fechas_iso: bool = False) -> List[Dict[str, Any]]:
+    """
+    Dataset de bitácoras para reportes PDF, con nombres de equipo y técnico resueltos.
+    fechas_iso: convertir 'fecha' y 'fecha_revision' a texto ISO (plantillas de empresa/equipo)
+    """
+    bitacoras = []
+    async for lote in iter_bitacoras_con_nombres(query):
+        for bitacora in lote:
+            fila = {
+                "_id": str(bitacora["_id"]),
+                "equipo_id": bitacora.get("equipo_id"),
+                "tecnico_id": bitacora.get("tecnico_id"),
+                "fecha": bitacora["fecha"],
+                "equipo": bitacora["equipo"],
+                "tipo": bitacora["tipo"],
+                "descripcion": bitacora["descripcion"],
+                "tecnico": bitacora["tecnico"],
+                "estado": bitacora["estado"],
+                "observaciones": bitacora.get("observaciones", ""),
+                "tiempo_estimado": bitacora.get("tiempo_estimado"),
+                "tiempo_real": bitacora.get("tiempo_real"),
+                "fecha_revision": bitacora.get("fecha_revision"),
+                "limpieza_fisica": bitacora.get("limpieza_fisica", False),
+                "actualizacion_software": bitacora.get("actualizacion_software", False),
+                "revision_hardware": bitacora.get("revision_hardware", False),
+                "respaldo_datos": bitacora.get("respaldo_datos", False),
+                "optimizacion_sistema": bitacora.get("optimizacion_sistema", False),
+                "diagnostico_problema": bitacora.get("diagnostico_problema", ""),
+                "solucion_aplicada": bitacora.get("solucion_aplicada", ""),
+                "componentes_reemplazados": bitacora.get("componentes_reemplazados", ""),
+                "anotaciones_extras": bitacora.get("anotaciones_extras", "")
+            }
+            
+            if fechas_iso:
+                if isinstance(fila["fecha"], datetime):
+                    fila["fecha"] = fila["fecha"].isoformat()
+                if isinstance(fila["fecha_revision"], datetime):
+                    fila["fecha_revision"] = fila["fecha_revision"].isoformat()
+            
+            bitacoras.append(fila)
+    return bitacoras
+
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(documento: Dict[str, Any], por_fecha: bool = False) -> str:
+    """Token opaco con la posición del último documento de una página"""
+    posicion = {"id": str(documento["_id"])}
+    if por_fecha:
+        posicion["fecha"] = documento["fecha"].isoformat()
+    return base64.urlsafe_b64encode(json.dumps(posicion).encode()).decode()
+
+def decode_cursor(token: str, por_fecha: bool = False) -> Dict[str, Any]:
+    """Convertir un token de paginación en el filtro de Mongo que continúa después de él"""
+    try:
+        posicion = json.loads(base64.urlsafe_b64decode(token.encode()))
+        ultimo_id = ObjectId(posicion["id"])
+        if por_fecha:
+            fecha = datetime.fromisoformat(posicion["fecha"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+    
+    if por_fecha:
+        return {"$or": [
+            {"fecha": {"$lt": fecha}},
+            {"fecha": fecha, "_id": {"$lt": ultimo_id}}
+        ]}
+    return {"_id": {"$gt": ultimo_id}}
+
+def find_paginado(collection, query: Dict[str, Any], limit: Optional[int] = None, after: Optional[str] = None,
+                  por_fecha: bool = False, projection: Optional[Dict[str, Any]] = None):
+    """
+    Cursor de Mongo con paginación keyset opcional.
+    Sin limit se conserva el comportamiento original (toda la colección).
+    por_fecha: ordenar por (fecha, _id) descendente en lugar de _id ascendente
+    """
+    if after:
+        # El cursor solo tiene sentido con el orden de la paginación, que exige limit
+        if not limit:
+            raise HTTPException(status_code=400, detail="El parámetro after requiere limit")
+        query = {"$and": [query, decode_cursor(after, por_fecha)]}
+    
+    cursor = collection.find(query, projection)
+    if por_fecha:
+        cursor = cursor.sort([("fecha", -1), ("_id", -1)] if limit else [("fecha", -1)])
+    elif limit:
+        cursor = cursor.sort("_id", 1)
+    
+    if limit:
+        # Un documento extra indica si existe una página siguiente
+        cursor = cursor.limit(limit + 1)
+    return cursor
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def quiere_ndjson(stream: bool, accept: Optional[str]) -> bool:
+    return stream or NDJSON_MEDIA_TYPE in (accept or "")
+
+def ndjson_response(cursor, limit: Optional[int] = None, batch_size: int = 200) -> StreamingResponse:
+    """
+    Responder un documento JSON por línea directamente desde el cursor de Motor,
+    sin construir la lista completa en memoria. Con limit se envía solo esa página.
+    """
+    if limit:
+        cursor = cursor.limit(limit)
+    
+    async def generar():
+        lineas = []
+        async for documento in cursor:
+            lineas.append(orjson.dumps(documento, default=json_default))
+            if len(lineas) >= batch_size:
+                yield b"\n".join(lineas) + b"\n"
+                lineas = []
+        if lineas:
+            yield b"\n".join(lineas) + b"\n"
+    
+    return StreamingResponse(generar(), media_type=NDJSON_MEDIA_TYPE)
+
+# Campos que no se devuelven salvo petición explícita; se excluyen desde la proyección de Mongo
+CAMPOS_PROTEGIDOS = {
+    "usuarios": ["password_hash"],
+    "equipos": ["password_windows_encrypted", "password_correo_encrypted"],
+    "servicios": ["credenciales_encrypted"],
+}
+
+def build_projection(fields: Optional[str], excluir: List[str] = (), requeridos: List[str] = ()) -> Optional[Dict[str, int]]:
+    """
+    Convertir el parámetro fields=campo1,campo2 en una proyección de Mongo.
+    excluir: campos protegidos que no deben salir de la base de datos
+    requeridos: campos que el endpoint necesita aunque no se pidan (p. ej. 'fecha' para el cursor)
+    """
+    if not fields:
+        return {campo: 0 for campo in excluir} or None
+    
+    campos = [campo.strip() for campo in fields.split(",") if campo.strip()]
+    if any(campo.startswith("$") for campo in campos):
+        raise HTTPException(status_code=400, detail="Campo no válido en fields")
+    
+    # Siempre es una proyección de inclusión, así que un campo protegido solo sale si es requerido
+    rutas = {"_id"} | {campo for campo in campos if campo.split(".")[0] not in excluir} | set(requeridos)
+    # Mongo rechaza un campo junto con uno de sus subcampos (a y a.b): basta con el padre
+    return {
+        ruta: 1 for ruta in sorted(rutas)
+        if not any(ruta.startswith(f"{otra}.") for otra in rutas)
+    }
+
+def respuesta_paginada(items: List[Dict[str, Any]], limit: Optional[int] = None, por_fecha: bool = False):
+    """Lista tal cual sin limit; con limit, {'items', 'next_cursor'}"""
+    if not limit:
+        return items
+    
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1], por_fecha)
+    return {"items": items, "next_cursor": next_cursor}
+
+def calcular_etag(request: Request, version: str) -> str:
+    """ETag débil a partir de la versión de los datos y de la variante pedida (ruta, query, Accept)"""
+    variante = f"{request.url.path}?{request.url.query}|{request.headers.get('accept', '')}|{version}"
+    return f'W/"{hashlib.sha1(variante.encode()).hexdigest()[:20]}"'
+
+def no_modificado(request: Request, etag: str) -> bool:
+    cabecera = request.headers.get("if-none-match")
+    if not cabecera:
+        return False
+    etiquetas = [etiqueta.strip().removeprefix("W/") for etiqueta in cabecera.split(",")]
+    return "*" in etiquetas or etag.removeprefix("W/") in etiquetas
+
+def con_etag(response: Response, etag: str) -> Response:
+    # no-cache: el navegador guarda la respuesta pero la revalida siempre con If-None-Match
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def respuesta_no_modificada(etag: str) -> Response:
+    return con_etag(Response(status_code=304), etag)
+
+MAX_BULK_ITEMS = 10000
+BULK_CHUNK_SIZE = 500
+
+def error_validacion(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+
+def validar_lote(items: List[Dict[str, Any]], modelo, preparar) -> tuple:
+    """
+    Validar y preparar cada elemento de una carga masiva.
+    Devuelve ([(indice, documento)], {indice: error}) para insertar solo los válidos.
+    """
+    if len(items) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_BULK_ITEMS} elementos por petición")
+    
+    validos, errores = [], {}
+    for indice, item in enumerate(items):
+        try:
+            validos.append((indice, preparar(modelo(**item))))
+        except ValidationError as e:
+            errores[indice] = error_validacion(e)
+        except TypeError:
+            errores[indice] = "El elemento debe ser un objeto"
+    return validos, errores
+
+async def insertar_en_lotes(collection, documentos: List[tuple], chunk_size: int = BULK_CHUNK_SIZE) -> tuple:
+    """
+    insert_many no ordenado por bloques de chunk_size.
+    documentos: [(indice, documento)]. Devuelve ({indice: id}, {indice: error}).
+    """
+    insertados, errores = {}, {}
+    for inicio in range(0, len(documentos), chunk_size):
+        bloque = documentos[inicio:inicio + chunk_size]
+        fallidos = {}
+        try:
+            await collection.insert_many([documento for _, documento in bloque], ordered=False)
+        except BulkWriteError as e:
+            fallidos = {error["index"]: error.get("errmsg", "Error de escritura") for error in e.details.get("writeErrors", [])}
+        
+        # insert_many asigna _id a cada documento antes de enviarlo
+        for posicion, (indice, documento) in enumerate(bloque):
+            if posicion in fallidos:
+                errores[indice] = fallidos[posicion]
+            else:
+                insertados[indice] = documento["_id"]
+    return insertados, errores
+
+def resultado_lote(total: int, insertados: Dict[int, Any], errores: Dict[int, str]) -> Dict[str, Any]:
+    resultados = []
+    for indice in range(total):
+        if indice in insertados:
+            resultados.append({"index": indice, "id": str(insertados[indice])})
+        else:
+            resultados.append({"index": indice, "error": errores.get(indice, "No insertado")})
+    return {"insertados": len(insertados), "errores": total - len(insertados), "resultados": resultados}
+
+def build_filtro(filtro: Dict[str, Any], excluir: List[str] = ()) -> Dict[str, Any]:
+    """
+    Convertir el filtro de una operación masiva en una consulta de Mongo.
+    Solo igualdad por campo (una lista equivale a $in) e 'ids' para una lista de _id;
+    no se aceptan operadores para que el filtro no pueda inyectar consultas arbitrarias.
+    """
+    if not filtro:
+        raise HTTPException(status_code=400, detail="Se requiere un filtro")
+    
+    query = {}
+    for campo, valor in filtro.items():
+        if campo == "ids":
+            if not isinstance(valor, list) or not all(ObjectId.is_valid(i) for i in valor):
+                raise HTTPException(status_code=400, detail="ids debe ser una lista de ids válidos")
+            query["_id"] = {"$in": [ObjectId(i) for i in valor]}
+        elif campo.startswith("$") or campo == "_id" or campo.split(".")[0] in excluir or isinstance(valor, dict):
+            raise HTTPException(status_code=400, detail=f"Campo no válido en filtro: {campo}")
+        elif isinstance(valor, list):
+            query[campo] = {"$in": valor}
+        else:
+            query[campo] = valor
+    return query
+
+def validar_cambios(cambios: Dict[str, Any]) -> Dict[str, Any]:
+    if not cambios:
+        raise HTTPException(status_code=400, detail="Se requieren cambios")
+    if any(campo.startswith("$") or campo == "_id" for campo in cambios):
+        raise HTTPException(status_code=400, detail="Campo no válido en cambios")
+    return dict(cambios)
+
+def agrupar_por_contadores(coleccion: str, documentos: List[Dict[str, Any]]) -> tuple:
+    """Agrupar _id por valores de los campos de contadores: ([campos], {valores: [_id]})"""
+    campos = [campo for campo in CAMPOS_CONTADORES[coleccion] if campo != "_id"]
+    grupos = {}
+    for documento in documentos:
+        grupos.setdefault(tuple(documento.get(campo) for campo in campos), []).append(documento["_id"])
+    return campos, grupos
+
+async def actualizar_grupos(coleccion: str, filtro: Dict[str, Any], cambios: Dict[str, Any],
+                            documentos: List[Dict[str, Any]]) -> tuple:
+    """
+    Aplicar cambios a documentos ya leídos, un update_many por grupo de valores de contadores.
+    Cada grupo exige que esos valores sigan siendo los leídos: un documento modificado por otra
+    escritura entre la lectura y el update no se toca (prevalece esa escritura) y no se cuenta,
+    así que el ajuste de estadísticas es exacto. Devuelve (coincidentes, modificados, empresas).
+    """
+    campos, grupos = agrupar_por_contadores(coleccion, documentos)
+    claves = list(grupos)
+    resultados = await asyncio.gather(*[
+        db[coleccion].update_many(
+            {"$and": [filtro, {"_id": {"$in": grupos[clave]}}, dict(zip(campos, clave))]},
+            {"$set": cambios}
+        )
+        for clave in claves
+    ])
+    
+    coincidentes = modificados = 0
+    antes, despues, empresas = [], [], set()
+    for clave, result in zip(claves, resultados):
+        coincidentes += result.matched_count
+        modificados += result.modified_count
+        if result.matched_count:
+            valores = dict(zip(campos, clave))
+            nuevos = {**valores, **{campo: valor for campo, valor in cambios.items() if campo in campos}}
+            antes += [valores] * result.matched_count
+            despues += [nuevos] * result.matched_count
+            empresas.update((valores.get("empresa_id"), nuevos.get("empresa_id")))
+    await stats_service.registrar_lote(coleccion, antes, despues)
+    return coincidentes, modificados, empresas
+
+async def actualizar_por_filtro(coleccion: str, request: BulkUpdateRequest, preparar_cambios=None) -> Dict[str, int]:
+    """
+    PATCH masivo: un filtro + cambios ($set con update_many) o varias operaciones
+    distintas (bulk_write de UpdateMany, en orden).
+    Si los cambios tocan campos de los contadores, los documentos se recorren en lotes de
+    BULK_CHUNK_SIZE por _id y cada operación se aplica al lote con actualizar_grupos.
+    """
+    operaciones = list(request.operaciones)
+    if request.filtro is not None or request.cambios is not None:
+        operaciones.append(OperacionLote(filtro=request.filtro or {}, cambios=request.cambios or {}))
+    if not operaciones:
+        raise HTTPException(status_code=400, detail="Se requiere filtro y cambios u operaciones")
+    if len(operaciones) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_BULK_ITEMS} operaciones por petición")
+    
+    excluir = CAMPOS_PROTEGIDOS.get(coleccion, [])
+    pares = []
+    for operacion in operaciones:
+        cambios = validar_cambios(operacion.cambios)
+        if preparar_cambios:
+            cambios = preparar_cambios(cambios)
+        pares.append((build_filtro(operacion.filtro, excluir), cambios))
+    
+    collection = db[coleccion]
+    campos = CAMPOS_CONTADORES[coleccion]
+    
+    if not any(set(cambios) & set(campos) for _, cambios in pares):
+        if len(pares) == 1:
+            result = await collection.update_many(pares[0][0], {"$set": pares[0][1]})
+        else:
+            result = await collection.bulk_write([UpdateMany(filtro, {"$set": cambios}) for filtro, cambios in pares])
+        if result.modified_count:
+            # Sin leer los documentos no se sabe qué empresas cambian: se invalidan todas
+            await version_service.incrementar(coleccion, None)
+        return {"coincidentes": result.matched_count, "modificados": result.modified_count}
+    
+    coincidentes = modificados = 0
+    empresas = set()
+    universo = {"$or": [filtro for filtro, _ in pares]}
+    ultimo = None
+    while True:
+        consulta = universo if ultimo is None else {"$and": [universo, {"_id": {"$gt": ultimo}}]}
+        ids = [
+            documento["_id"]
+            for documento in await collection.find(consulta, {"_id": 1}).sort("_id", 1).limit(BULK_CHUNK_SIZE).to_list(None)
+        ]
+        if not ids:
+            break
+        ultimo = ids[-1]
+        
+        # Las operaciones se aplican en orden dentro del lote: cada una lee el estado que dejó la anterior
+        for filtro, cambios in pares:
+            documentos = await collection.find({"$and": [filtro, {"_id": {"$in": ids}}]}, campos).to_list(None)
+            if documentos:
+                lote_coincidentes, lote_modificados, lote_empresas = await actualizar_grupos(coleccion, filtro, cambios, documentos)
+                coincidentes += lote_coincidentes
+                modificados += lote_modificados
+                empresas |= lote_empresas
+    
+    if modificados:
+        await version_service.incrementar(coleccion, empresas)
+    return {"coincidentes": coincidentes, "modificados": modificados}
+
+async def eliminar_por_filtro(coleccion: str, request: BulkDeleteRequest) -> Dict[str, int]:
+    """
+    DELETE masivo en lotes de BULK_CHUNK_SIZE, descontándolos de las estadísticas.
+    Cada grupo de valores de contadores se borra solo si esos valores siguen siendo los
+    leídos; un documento modificado entretanto se vuelve a leer en el lote siguiente.
+    """
+    collection = db[coleccion]
+    filtro = build_filtro(request.filtro, CAMPOS_PROTEGIDOS.get(coleccion, []))
+    
+    vistos, eliminados, empresas = set(), 0, set()
+    while True:
+        lote = await collection.find(filtro, CAMPOS_CONTADORES[coleccion]).limit(BULK_CHUNK_SIZE).to_list(None)
+        if not lote:
+            break
+        vistos.update(documento["_id"] for documento in lote)
+        
+        campos, grupos = agrupar_por_contadores(coleccion, lote)
+        claves = list(grupos)
+        resultados = await asyncio.gather(*[
+            collection.delete_many({"_id": {"$in": grupos[clave]}, **dict(zip(campos, clave))})
+            for clave in claves
+        ])
+        
+        antes, borrados = [], []
+        for clave, result in zip(claves, resultados):
+            valores = dict(zip(campos, clave))
+            antes += [valores] * result.deleted_count
+            if result.deleted_count:
+                empresas.add(valores.get("empresa_id"))
+            if result.deleted_count == len(grupos[clave]):
+                borrados += grupos[clave]
+        await stats_service.registrar_lote(coleccion, antes=antes)
+        eliminados += len(antes)
+        if coleccion == "equipos":
+            equipos_search.eliminar(borrados)
+    
+    if eliminados:
+        await version_service.incrementar(coleccion, empresas)
+    return {"coincidentes": len(vistos), "eliminados": eliminados}
+
 @api_router.post("/auth/login", response_model=LoginResponse)
 async def login(request: LoginRequest):
     user = await db.usuarios.find_one({"email": request.email})
@@ -166,13 +693,15 @@ async def get_me(current_user: Dict = Depends(get_current_user)):
     return current_user
 
 @api_router.get("/usuarios")
-async def get_usuarios(current_user: Dict = Depends(get_admin_user)):
-    usuarios = []
-    async for usuario in db.usuarios.find({}):
-        usuario["_id"] = str(usuario["_id"])
-        usuario.pop("password_hash", None)
-        usuarios.append(usuario)
-    return usuarios
+async def get_usuarios(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    current_user: Dict = Depends(get_admin_user)
+):
+    projection = build_projection(None, CAMPOS_PROTEGIDOS["usuarios"])
+    usuarios = await find_paginado(db.usuarios, {}, limit, after, projection=projection).to_list(None)
+    return api_response(respuesta_paginada(usuarios, limit), accept)
 
 @api_router.post("/usuarios")
 async def create_usuario(request: CreateUsuarioRequest, current_user: Dict = Depends(get_admin_user)):
@@ -206,6 +735,7 @@ async def update_usuario(usuario_id: str, data: Dict[str, Any] = Body(...), curr
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
+    user_cache.invalidate(usuario_id)
     return {"message": "Usuario actualizado"}
 
 @api_router.delete("/usuarios/{usuario_id}")
@@ -213,19 +743,28 @@ async def delete_usuario(usuario_id: str, current_user: Dict = Depends(get_admin
     result = await db.usuarios.delete_one({"_id": ObjectId(usuario_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    user_cache.invalidate(usuario_id)
     return {"message": "Usuario eliminado"}
 
 @api_router.get("/empresas")
-async def get_empresas(current_user: Dict = Depends(get_current_user)):
-    empresas = []
-    async for empresa in db.empresas.find({}):
-        empresa["_id"] = str(empresa["_id"])
-        empresas.append(empresa)
-    return empresas
+async def get_empresas(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    current_user: Dict = Depends(get_current_user)
+):
+    etag = calcular_etag(request, await version_service.obtener("empresas"))
+    if no_modificado(request, etag):
+        return respuesta_no_modificada(etag)
+    
+    empresas = await find_paginado(db.empresas, {}, limit, after, projection=build_projection(fields)).to_list(None)
+    return con_etag(api_response(respuesta_paginada(empresas, limit), accept), etag)
 
 @api_router.get("/empresas/{empresa_id}")
-async def get_empresa(empresa_id: str, current_user: Dict = Depends(get_current_user)):
-    empresa = await db.empresas.find_one({"_id": ObjectId(empresa_id)})
+async def get_empresa(empresa_id: str, fields: Optional[str] = None, current_user: Dict = Depends(get_current_user)):
+    empresa = await db.empresas.find_one({"_id": ObjectId(empresa_id)}, build_projection(fields))
     if not empresa:
         raise HTTPException(status_code=404, detail="Empresa no encontrada")
     empresa["_id"] = str(empresa["_id"])
@@ -234,7 +773,10 @@ async def get_empresa(empresa_id: str, current_user: Dict = Depends(get_current_
 @api_router.post("/empresas")
 async def create_empresa(request: EmpresaCreate, current_user: Dict = Depends(get_current_user)):
     empresa = Empresa(**request.model_dump())
-    result = await db.empresas.insert_one(empresa.model_dump(by_alias=True, exclude={"id"}))
+    documento = empresa.model_dump(by_alias=True, exclude={"id"})
+    result = await db.empresas.insert_one(documento)
+    await stats_service.registrar("empresas", despues=documento)
+    await version_service.incrementar("empresas")
     return {"id": str(result.inserted_id)}
 
 @api_router.put("/empresas/{empresa_id}")
@@ -250,38 +792,199 @@ async def update_empresa(empresa_id: str, data: Dict[str, Any] = Body(...), curr
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Empresa no encontrada")
     
+    await version_service.incrementar("empresas")
     return {"message": "Empresa actualizada"}
 
+CASCADA_BATCH_SIZE = 1000
+
+# Colecciones que dependen de una empresa, en el orden en que se eliminan
+DEPENDIENTES_EMPRESA = ["bitacoras", "servicios", "equipos"]
+
+async def borrar_lote_dependientes(coleccion: str, empresa_id: str, lote: List[Dict[str, Any]], session=None) -> tuple:
+    """
+    Borrar un lote y descontarlo de las estadísticas. Devuelve (eliminados, descontado).
+    Si otro borrado concurrente eliminó parte del lote, no se sabe qué documentos borró
+    este: el lote no se descuenta (descontado=False) para no restarlos dos veces.
+    Solo escribe en la base de datos (en la transacción de session, si la hay); la versión
+    y el índice de búsqueda se actualizan con publicar_borrado_dependientes.
+    """
+    result = await db[coleccion].delete_many(
+        {"empresa_id": empresa_id, "_id": {"$in": [documento["_id"] for documento in lote]}},
+        session=session
+    )
+    descontado = result.deleted_count == len(lote)
+    if descontado:
+        await stats_service.registrar_lote(coleccion, antes=lote, session=session)
+    return result.deleted_count, descontado
+
+async def publicar_borrado_dependientes(coleccion: str, empresa_id: str, lote: List[Dict[str, Any]]):
+    """Efectos fuera de la base de datos de un lote ya borrado: solo tras confirmar la transacción"""
+    await version_service.incrementar(coleccion, [empresa_id])
+    if coleccion == "equipos":
+        equipos_search.eliminar([documento["_id"] for documento in lote])
+
+async def eliminar_dependientes_empresa(empresa_id: str, job_id: str, transaccion: bool = False):
+    """
+    Borrar en lotes de CASCADA_BATCH_SIZE las bitácoras, servicios y equipos de una empresa,
+    descontándolos de las estadísticas y publicando el progreso en el trabajo.
+    Con transaccion=True cada lote (borrado + contadores) es atómico; requiere un replica set.
+    Se puede volver a ejecutar sobre el mismo trabajo: continúa con lo que quede por borrar.
+    """
+    try:
+        await job_service.iniciar(job_id)
+        contadores_exactos = True
+        for coleccion in DEPENDIENTES_EMPRESA:
+            while True:
+                lote = await db[coleccion].find(
+                    {"empresa_id": empresa_id}, CAMPOS_CONTADORES[coleccion]
+                ).limit(CASCADA_BATCH_SIZE).to_list(None)
+                if not lote:
+                    break
+                
+                if transaccion:
+                    async with await client.start_session() as session:
+                        async with session.start_transaction():
+                            eliminados, descontado = await borrar_lote_dependientes(coleccion, empresa_id, lote, session)
+                else:
+                    eliminados, descontado = await borrar_lote_dependientes(coleccion, empresa_id, lote)
+                await publicar_borrado_dependientes(coleccion, empresa_id, lote)
+                
+                contadores_exactos = contadores_exactos and descontado
+                await job_service.progreso(job_id, {coleccion: eliminados})
+        
+        await stats_service.descartar_empresa(empresa_id)
+        if not contadores_exactos:
+            # Algún lote coincidió con borrados concurrentes: se recalculan los contadores
+            await stats_service.reconstruir()
+        await job_service.terminar(job_id)
+    except Exception as e:
+        logger.error(f"Error eliminando dependientes de la empresa {empresa_id}: {str(e)}")
+        await job_service.terminar(job_id, error=str(e))
+
+async def reanudar_trabajos():
+    """
+    Tras un reinicio, los trabajos que quedaron a medias en BackgroundTasks se perdieron:
+    los borrados en cascada se reanudan (son repetibles) y los demás se marcan como error.
+    """
+    while True:
+        trabajo = await job_service.reclamar_interrumpido("eliminacion_empresa")
+        if trabajo is None:
+            break
+        logger.info(f"Reanudando borrado en cascada de la empresa {trabajo['empresa_id']}")
+        tarea = asyncio.create_task(eliminar_dependientes_empresa(
+            trabajo["empresa_id"], str(trabajo["_id"]), trabajo.get("transaccion", False)
+        ))
+        trabajos_reanudados.add(tarea)
+        tarea.add_done_callback(trabajos_reanudados.discard)
+    
+    abandonados = await job_service.abandonar_interrumpidos(excluir_tipos=["eliminacion_empresa"])
+    if abandonados:
+        logger.info(f"{abandonados} trabajos interrumpidos marcados como error")
+
+# Referencias a las tareas reanudadas para que no se recojan antes de terminar
+trabajos_reanudados = set()
+
 @api_router.delete("/empresas/{empresa_id}")
-async def delete_empresa(empresa_id: str, current_user: Dict = Depends(get_admin_user)):
-    result = await db.empresas.delete_one({"_id": ObjectId(empresa_id)})
-    if result.deleted_count == 0:
+async def delete_empresa(
+    empresa_id: str,
+    background_tasks: BackgroundTasks,
+    transaccion: bool = False,
+    current_user: Dict = Depends(get_admin_user)
+):
+    """
+    Eliminar la empresa y, en segundo plano, sus equipos, bitácoras y servicios.
+    El progreso se consulta en /api/trabajos/{job_id}.
+    """
+    antes = await db.empresas.find_one_and_delete({"_id": ObjectId(empresa_id)}, projection=CAMPOS_CONTADORES["empresas"])
+    if antes is None:
         raise HTTPException(status_code=404, detail="Empresa no encontrada")
-    return {"message": "Empresa eliminada"}
+    await stats_service.registrar("empresas", antes=antes)
+    await version_service.incrementar("empresas")
+    
+    totales = dict(zip(DEPENDIENTES_EMPRESA, await asyncio.gather(*[
+        db[coleccion].count_documents({"empresa_id": empresa_id}) for coleccion in DEPENDIENTES_EMPRESA
+    ])))
+    job_id = await job_service.crear(
+        "eliminacion_empresa", current_user["_id"], empresa_id=empresa_id, totales=totales, transaccion=transaccion
+    )
+    background_tasks.add_task(eliminar_dependientes_empresa, empresa_id, job_id, transaccion)
+    
+    return {"message": "Empresa eliminada", "job_id": job_id}
 
 @api_router.get("/equipos")
-async def get_equipos(empresa_id: Optional[str] = None, current_user: Dict = Depends(get_current_user)):
+async def get_equipos(
+    request: Request,
+    empresa_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False,
+    accept: Optional[str] = Header(None),
+    current_user: Dict = Depends(get_current_user)
+):
+    etag = calcular_etag(request, await version_service.obtener("equipos", empresa_id))
+    if no_modificado(request, etag):
+        return respuesta_no_modificada(etag)
+    
     query = {}
     if empresa_id:
         query["empresa_id"] = empresa_id
     
-    equipos = []
-    async for equipo in db.equipos.find(query):
-        equipo["_id"] = str(equipo["_id"])
-        equipo.pop("password_windows_encrypted", None)
-        equipo.pop("password_correo_encrypted", None)
-        equipos.append(equipo)
-    return equipos
+    projection = build_projection(fields, CAMPOS_PROTEGIDOS["equipos"])
+    
+    cursor = find_paginado(db.equipos, query, limit, after, projection=projection)
+    if quiere_ndjson(stream, accept):
+        return con_etag(ndjson_response(cursor, limit), etag)
+    
+    equipos = await cursor.to_list(None)
+    return con_etag(api_response(respuesta_paginada(equipos, limit), accept), etag)
+
+@api_router.get("/equipos/buscar")
+async def buscar_equipos(
+    q: str = Query(..., min_length=2),
+    empresa_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    fields: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    current_user: Dict = Depends(get_current_user)
+):
+    """
+    Buscar equipos por número de serie, MAC, IP, hostname, nombre, marca o modelo.
+    Admite coincidencias completas, por prefijo y parciales; resultados ordenados por 'score'.
+    """
+    try:
+        ranking = await equipos_search.buscar(q, empresa_id, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not ranking:
+        return api_response([], accept)
+    
+    projection = build_projection(fields, CAMPOS_PROTEGIDOS["equipos"])
+    equipos = await db.equipos.find({"_id": {"$in": [ObjectId(equipo_id) for equipo_id, _ in ranking]}}, projection).to_list(None)
+    por_id = {str(equipo["_id"]): equipo for equipo in equipos}
+    
+    # Equipos borrados desde otro proceso: se quitan del índice al no encontrarse
+    faltantes = [equipo_id for equipo_id, _ in ranking if equipo_id not in por_id]
+    if faltantes:
+        equipos_search.eliminar(faltantes)
+    
+    return api_response([{**por_id[equipo_id], "score": score} for equipo_id, score in ranking if equipo_id in por_id], accept)
 
 @api_router.get("/equipos/{equipo_id}")
-async def get_equipo(equipo_id: str, show_passwords: bool = False, current_user: Dict = Depends(get_current_user)):
-    equipo = await db.equipos.find_one({"_id": ObjectId(equipo_id)})
+async def get_equipo(equipo_id: str, show_passwords: bool = False, fields: Optional[str] = None, current_user: Dict = Depends(get_current_user)):
+    show_passwords = show_passwords and (current_user.get("rol") == "administrador" or current_user.get("rol") == "tecnico")
+    if show_passwords:
+        projection = build_projection(fields, requeridos=CAMPOS_PROTEGIDOS["equipos"])
+    else:
+        projection = build_projection(fields, CAMPOS_PROTEGIDOS["equipos"])
+    
+    equipo = await db.equipos.find_one({"_id": ObjectId(equipo_id)}, projection)
     if not equipo:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
     
     equipo["_id"] = str(equipo["_id"])
     
-    if show_passwords and (current_user.get("rol") == "administrador" or current_user.get("rol") == "tecnico"):
+    if show_passwords:
         if equipo.get("password_windows_encrypted"):
             try:
                 equipo["password_windows"] = decrypt_password(equipo["password_windows_encrypted"])
@@ -309,17 +1012,19 @@ async def get_equipo_historial(equipo_id: str, current_user: Dict = Depends(get_
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
     
     # Obtener todas las bitácoras del equipo
+    bitacoras = await db.bitacoras.find({"equipo_id": equipo_id}).sort("fecha", -1).to_list(None)
+    
+    # Resolver nombres de técnicos en una sola consulta
+    tecnicos = await get_nombres_por_id(db.usuarios, [b.get("tecnico_id") for b in bitacoras])
+    
     historial = []
-    async for bitacora in db.bitacoras.find({"equipo_id": equipo_id}).sort("fecha", -1):
-        # Obtener nombre del técnico
-        tecnico = await db.usuarios.find_one({"_id": ObjectId(bitacora["tecnico_id"])}, {"_id": 0})
-        
+    for bitacora in bitacoras:
         historial.append({
             "_id": str(bitacora["_id"]),
             "fecha": bitacora["fecha"],
             "tipo": bitacora["tipo"],
             "descripcion": bitacora["descripcion"],
-            "tecnico": tecnico.get("nombre") if tecnico else "N/A",
+            "tecnico": tecnicos.get(bitacora.get("tecnico_id"), "N/A"),
             "estado": bitacora["estado"],
             "observaciones": bitacora.get("observaciones", ""),
             "tiempo_estimado": bitacora.get("tiempo_estimado"),
@@ -341,8 +1046,8 @@ async def get_equipo_historial(equipo_id: str, current_user: Dict = Depends(get_
         "historial": historial
     }
 
-@api_router.post("/equipos")
-async def create_equipo(request: EquipoCreate, current_user: Dict = Depends(get_current_user)):
+def preparar_equipo(request: EquipoCreate) -> Dict[str, Any]:
+    """Documento listo para insertar, con las contraseñas cifradas"""
     equipo_data = request.model_dump()
     
     if request.password_windows:
@@ -354,12 +1059,31 @@ async def create_equipo(request: EquipoCreate, current_user: Dict = Depends(get_
         equipo_data.pop("password_correo")
     
     equipo = Equipo(**equipo_data)
-    result = await db.equipos.insert_one(equipo.model_dump(by_alias=True, exclude={"id"}))
+    return equipo.model_dump(by_alias=True, exclude={"id"})
+
+@api_router.post("/equipos")
+async def create_equipo(request: EquipoCreate, current_user: Dict = Depends(get_current_user)):
+    documento = preparar_equipo(request)
+    result = await db.equipos.insert_one(documento)
+    await stats_service.registrar("equipos", despues=documento)
+    await version_service.incrementar("equipos", [documento["empresa_id"]])
+    equipos_search.indexar([documento])
     return {"id": str(result.inserted_id)}
 
-@api_router.put("/equipos/{equipo_id}")
-async def update_equipo(equipo_id: str, data: Dict[str, Any] = Body(...), current_user: Dict = Depends(get_current_user)):
-    data.pop("_id", None)
+@api_router.post("/equipos/bulk")
+async def create_equipos_bulk(items: List[Dict[str, Any]] = Body(...), current_user: Dict = Depends(get_current_user)):
+    validos, errores = validar_lote(items, EquipoCreate, preparar_equipo)
+    insertados, errores_escritura = await insertar_en_lotes(db.equipos, validos)
+    errores.update(errores_escritura)
+    
+    documentos = [documento for indice, documento in validos if indice in insertados]
+    await stats_service.registrar_lote("equipos", despues=documentos)
+    if documentos:
+        await version_service.incrementar("equipos", {documento["empresa_id"] for documento in documentos})
+    equipos_search.indexar(documentos)
+    return resultado_lote(len(items), insertados, errores)
+
+def preparar_cambios_equipo(data: Dict[str, Any]) -> Dict[str, Any]:
     data["actualizado_en"] = datetime.utcnow()
     
     if "password_windows" in data and data["password_windows"]:
@@ -368,104 +1092,336 @@ async def update_equipo(equipo_id: str, data: Dict[str, Any] = Body(...), curren
     if "password_correo" in data and data["password_correo"]:
         data["password_correo_encrypted"] = encrypt_password(data.pop("password_correo"))
     
-    result = await db.equipos.update_one(
+    return data
+
+# Columnas del archivo que se guardan cifradas con otro nombre
+CAMPOS_CIFRADOS_EQUIPO = {
+    "password_windows": "password_windows_encrypted",
+    "password_correo": "password_correo_encrypted",
+}
+
+def validar_filas_equipo(filas: List[Dict[str, Any]]) -> tuple:
+    """
+    Validar filas de una importación; las columnas que no son del modelo van a campos_personalizados.
+    Devuelve ([(indice, documento, campos)], {indice: error}): campos son las rutas del documento
+    que vienen de celdas con valor, las únicas que un upsert cambia en un equipo existente.
+    """
+    modelo = EquipoCreate.model_fields.keys()
+    campos_por_fila = []
+    for fila in filas:
+        # Nombres válidos como ruta de Mongo: un punto anidaría el campo
+        extras = {
+            columna.replace(".", "_").lstrip("$"): fila.pop(columna)
+            for columna in list(fila) if columna not in modelo
+        }
+        campos = [CAMPOS_CIFRADOS_EQUIPO.get(columna, columna) for columna in fila if columna != "campos_personalizados"]
+        campos += [f"campos_personalizados.{columna}" for columna in extras]
+        if extras:
+            fila["campos_personalizados"] = {**extras, **(fila.get("campos_personalizados") or {})}
+        campos_por_fila.append(campos)
+    
+    validos, errores = validar_lote(filas, EquipoCreate, preparar_equipo)
+    return [(indice, documento, campos_por_fila[indice]) for indice, documento in validos], errores
+
+@api_router.post("/equipos/importar", status_code=202)
+async def importar_equipos(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    modo: str = "insertar",
+    current_user: Dict = Depends(get_current_user)
+):
+    """
+    Importar equipos desde CSV o XLSX en segundo plano.
+    modo=upsert actualiza los equipos existentes de la misma empresa con el mismo numero_serie.
+    El progreso y los errores por fila se consultan en /api/trabajos/{job_id}.
+    """
+    if modo not in ("insertar", "upsert"):
+        raise HTTPException(status_code=400, detail="Modo no válido, use insertar o upsert")
+    try:
+        formato = detectar_formato(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Copia propia del archivo: el upload se cierra al terminar la petición
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{formato}") as destino:
+        while bloque := await file.read(1024 * 1024):
+            destino.write(bloque)
+    
+    job_id = await job_service.crear("importacion_equipos", current_user["_id"], archivo=file.filename, modo=modo)
+    background_tasks.add_task(
+        import_service.importar, destino.name, validar_filas_equipo, modo, formato,
+        job_id=job_id, eliminar_archivo=True
+    )
+    return {"job_id": job_id}
+
+@api_router.patch("/equipos/bulk")
+async def update_equipos_bulk(request: BulkUpdateRequest, current_user: Dict = Depends(get_current_user)):
+    resultado = await actualizar_por_filtro("equipos", request, preparar_cambios_equipo)
+    # Los equipos modificados llevan actualizado_en nuevo: los recoge la sincronización del índice
+    equipos_search.invalidar()
+    return resultado
+
+@api_router.delete("/equipos/bulk")
+async def delete_equipos_bulk(request: BulkDeleteRequest, current_user: Dict = Depends(get_current_user)):
+    return await eliminar_por_filtro("equipos", request)
+
+@api_router.put("/equipos/{equipo_id}")
+async def update_equipo(equipo_id: str, data: Dict[str, Any] = Body(...), current_user: Dict = Depends(get_current_user)):
+    data.pop("_id", None)
+    data = preparar_cambios_equipo(data)
+    
+    antes = await db.equipos.find_one_and_update(
         {"_id": ObjectId(equipo_id)},
-        {"$set": data}
+        {"$set": data},
+        projection={**CAMPOS_CONTADORES["equipos"], **{campo: 1 for campo in CAMPOS_BUSQUEDA_EQUIPOS}}
     )
     
-    if result.matched_count == 0:
+    if antes is None:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
     
+    await stats_service.registrar("equipos", antes, {**antes, **data})
+    await version_service.incrementar("equipos", [antes.get("empresa_id"), data.get("empresa_id")])
+    equipos_search.indexar([{**antes, **data}])
+    
     return {"message": "Equipo actualizado"}
 
 @api_router.delete("/equipos/{equipo_id}")
 async def delete_equipo(equipo_id: str, current_user: Dict = Depends(get_current_user)):
-    result = await db.equipos.delete_one({"_id": ObjectId(equipo_id)})
-    if result.deleted_count == 0:
+    antes = await db.equipos.find_one_and_delete({"_id": ObjectId(equipo_id)}, projection=CAMPOS_CONTADORES["equipos"])
+    if antes is None:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
+    await stats_service.registrar("equipos", antes=antes)
+    await version_service.incrementar("equipos", [antes.get("empresa_id")])
+    equipos_search.eliminar([equipo_id])
     return {"message": "Equipo eliminado"}
 
 @api_router.get("/bitacoras")
-async def get_bitacoras(equipo_id: Optional[str] = None, empresa_id: Optional[str] = None, current_user: Dict = Depends(get_current_user)):
+async def get_bitacoras(
+    request: Request,
+    equipo_id: Optional[str] = None,
+    empresa_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    stream: bool = False,
+    accept: Optional[str] = Header(None),
+    current_user: Dict = Depends(get_current_user)
+):
+    etag = calcular_etag(request, await version_service.obtener("bitacoras", empresa_id))
+    if no_modificado(request, etag):
+        return respuesta_no_modificada(etag)
+    
     query = {}
     if equipo_id:
         query["equipo_id"] = equipo_id
     if empresa_id:
         query["empresa_id"] = empresa_id
     
-    bitacoras = []
-    async for bitacora in db.bitacoras.find(query).sort("fecha", -1):
-        bitacora["_id"] = str(bitacora["_id"])
-        bitacoras.append(bitacora)
-    return bitacoras
+    # El cursor de paginación necesita 'fecha' aunque no se haya pedido
+    projection = build_projection(fields, requeridos=["fecha"] if limit else [])
+    
+    cursor = find_paginado(db.bitacoras, query, limit, after, por_fecha=True, projection=projection)
+    if quiere_ndjson(stream, accept):
+        return con_etag(ndjson_response(cursor, limit), etag)
+    
+    bitacoras = await cursor.to_list(None)
+    return con_etag(api_response(respuesta_paginada(bitacoras, limit, por_fecha=True), accept), etag)
 
-@api_router.post("/bitacoras")
-async def create_bitacora(request: BitacoraCreate, background_tasks: BackgroundTasks, current_user: Dict = Depends(get_current_user)):
+def preparar_bitacora(request: BitacoraCreate) -> Dict[str, Any]:
     bitacora_data = request.model_dump()
     if not bitacora_data.get("fecha"):
         bitacora_data["fecha"] = datetime.utcnow()
     
     bitacora = Bitacora(**bitacora_data)
-    result = await db.bitacoras.insert_one(bitacora.model_dump(by_alias=True, exclude={"id"}))
+    return bitacora.model_dump(by_alias=True, exclude={"id"})
+
+async def notificar_mantenimientos(bitacoras: List[Dict[str, Any]], background_tasks: BackgroundTasks):
+    """
+    Programar los correos de mantenimiento agrupados por empresa:
+    un correo por empresa con todos sus mantenimientos, no uno por bitácora.
+    """
+    empresa_ids = [ObjectId(i) for i in {b["empresa_id"] for b in bitacoras} if ObjectId.is_valid(i)]
+    empresas, equipos, tecnicos = await asyncio.gather(
+        db.empresas.find({"_id": {"$in": empresa_ids}}, {"email": 1}).to_list(None),
+        get_nombres_por_id(db.equipos, [b["equipo_id"] for b in bitacoras]),
+        get_nombres_por_id(db.usuarios, [b["tecnico_id"] for b in bitacoras])
+    )
+    emails = {str(empresa["_id"]): empresa.get("email") for empresa in empresas}
+    
+    por_empresa: Dict[str, List[Dict[str, str]]] = {}
+    for bitacora in bitacoras:
+        email = emails.get(bitacora["empresa_id"])
+        equipo = equipos.get(bitacora["equipo_id"])
+        tecnico = tecnicos.get(bitacora["tecnico_id"])
+        if email and equipo and tecnico:
+            por_empresa.setdefault(email, []).append({
+                "equipo": equipo,
+                "fecha": bitacora["fecha"].strftime("%d/%m/%Y %H:%M"),
+                "tecnico": tecnico
+            })
+    
+    for email, mantenimientos in por_empresa.items():
+        if len(mantenimientos) == 1:
+            m = mantenimientos[0]
+            background_tasks.add_task(email_service.send_maintenance_notification, email, m["equipo"], m["fecha"], m["tecnico"])
+        else:
+            background_tasks.add_task(email_service.send_maintenance_summary, email, mantenimientos)
+
+@api_router.get("/bitacoras/buscar")
+async def buscar_bitacoras(
+    q: str = Query(..., min_length=2),
+    empresa_id: Optional[str] = None,
+    equipo_id: Optional[str] = None,
+    fecha_desde: Optional[datetime] = None,
+    fecha_hasta: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    accept: Optional[str] = Header(None),
+    current_user: Dict = Depends(get_current_user)
+):
+    """
+    Búsqueda de texto (índice 'bitacoras_texto') en descripción, diagnóstico, solución,
+    observaciones y anotaciones. Admite "frases" y -exclusiones. Resultados por relevancia
+    ('score') con fragmentos resaltados por campo en 'fragmentos'.
+    """
+    query = {"$text": {"$search": q}}
+    if empresa_id:
+        query["empresa_id"] = empresa_id
+    if equipo_id:
+        query["equipo_id"] = equipo_id
+    if fecha_desde or fecha_hasta:
+        query["fecha"] = {}
+        if fecha_desde:
+            query["fecha"]["$gte"] = fecha_desde
+        if fecha_hasta:
+            query["fecha"]["$lte"] = fecha_hasta
+    
+    projection = {campo: 1 for campo in ["equipo_id", "empresa_id", "tecnico_id", "tipo", "estado", "fecha", *CAMPOS_TEXTO_BITACORAS]}
+    projection["score"] = {"$meta": "textScore"}
+    
+    bitacoras = await db.bitacoras.find(query, projection).sort(
+        [("score", {"$meta": "textScore"}), ("fecha", -1)]
+    ).skip(offset).limit(limit).to_list(None)
+    
+    equipos, tecnicos = await asyncio.gather(
+        get_nombres_por_id(db.equipos, [b.get("equipo_id") for b in bitacoras]),
+        get_nombres_por_id(db.usuarios, [b.get("tecnico_id") for b in bitacoras])
+    )
     
-    equipo = await db.equipos.find_one({"_id": ObjectId(request.equipo_id)})
-    empresa = await db.empresas.find_one({"_id": ObjectId(request.empresa_id)})
-    tecnico = await db.usuarios.find_one({"_id": ObjectId(request.tecnico_id)})
+    raices = raices_busqueda(q)
+    for bitacora in bitacoras:
+        bitacora["equipo"] = equipos.get(bitacora.get("equipo_id"), "N/A")
+        bitacora["tecnico"] = tecnicos.get(bitacora.get("tecnico_id"), "N/A")
+        fragmentos = {campo: fragmento(bitacora.get(campo), raices) for campo in CAMPOS_TEXTO_BITACORAS}
+        bitacora["fragmentos"] = {campo: texto for campo, texto in fragmentos.items() if texto}
+        # Además de la descripción, de los campos largos solo viajan los fragmentos
+        for campo in CAMPOS_TEXTO_BITACORAS[1:]:
+            bitacora.pop(campo, None)
+    
+    return api_response(bitacoras, accept)
+
+@api_router.post("/bitacoras")
+async def create_bitacora(request: BitacoraCreate, background_tasks: BackgroundTasks, current_user: Dict = Depends(get_current_user)):
+    documento = preparar_bitacora(request)
+    result = await db.bitacoras.insert_one(documento)
+    await stats_service.registrar("bitacoras", despues=documento)
+    await version_service.incrementar("bitacoras", [documento["empresa_id"]])
     
-    if empresa and equipo and tecnico:
-        background_tasks.add_task(
-            email_service.send_maintenance_notification,
-            empresa.get("email"),
-            equipo.get("nombre"),
-            bitacora_data["fecha"].strftime("%d/%m/%Y %H:%M"),
-            tecnico.get("nombre")
-        )
+    await notificar_mantenimientos([documento], background_tasks)
     
     return {"id": str(result.inserted_id)}
 
+@api_router.post("/bitacoras/bulk")
+async def create_bitacoras_bulk(
+    background_tasks: BackgroundTasks,
+    items: List[Dict[str, Any]] = Body(...),
+    current_user: Dict = Depends(get_current_user)
+):
+    validos, errores = validar_lote(items, BitacoraCreate, preparar_bitacora)
+    insertados, errores_escritura = await insertar_en_lotes(db.bitacoras, validos)
+    errores.update(errores_escritura)
+    
+    documentos = [documento for indice, documento in validos if indice in insertados]
+    await stats_service.registrar_lote("bitacoras", despues=documentos)
+    if documentos:
+        await version_service.incrementar("bitacoras", {documento["empresa_id"] for documento in documentos})
+    await notificar_mantenimientos(documentos, background_tasks)
+    
+    return resultado_lote(len(items), insertados, errores)
+
+@api_router.patch("/bitacoras/bulk")
+async def update_bitacoras_bulk(request: BulkUpdateRequest, current_user: Dict = Depends(get_current_user)):
+    return await actualizar_por_filtro("bitacoras", request)
+
+@api_router.delete("/bitacoras/bulk")
+async def delete_bitacoras_bulk(request: BulkDeleteRequest, current_user: Dict = Depends(get_current_user)):
+    return await eliminar_por_filtro("bitacoras", request)
+
 @api_router.put("/bitacoras/{bitacora_id}")
 async def update_bitacora(bitacora_id: str, data: Dict[str, Any] = Body(...), current_user: Dict = Depends(get_current_user)):
     data.pop("_id", None)
     
-    result = await db.bitacoras.update_one(
+    antes = await db.bitacoras.find_one_and_update(
         {"_id": ObjectId(bitacora_id)},
-        {"$set": data}
+        {"$set": data},
+        projection=CAMPOS_CONTADORES["bitacoras"]
     )
     
-    if result.matched_count == 0:
+    if antes is None:
         raise HTTPException(status_code=404, detail="Bitácora no encontrada")
     
+    await stats_service.registrar("bitacoras", antes, {**antes, **data})
+    await version_service.incrementar("bitacoras", [antes.get("empresa_id"), data.get("empresa_id")])
+    
     return {"message": "Bitácora actualizada"}
 
 @api_router.delete("/bitacoras/{bitacora_id}")
 async def delete_bitacora(bitacora_id: str, current_user: Dict = Depends(get_current_user)):
-    result = await db.bitacoras.delete_one({"_id": ObjectId(bitacora_id)})
-    if result.deleted_count == 0:
+    antes = await db.bitacoras.find_one_and_delete({"_id": ObjectId(bitacora_id)}, projection=CAMPOS_CONTADORES["bitacoras"])
+    if antes is None:
         raise HTTPException(status_code=404, detail="Bitácora no encontrada")
+    await stats_service.registrar("bitacoras", antes=antes)
+    await version_service.incrementar("bitacoras", [antes.get("empresa_id")])
     return {"message": "Bitácora eliminada"}
 
 @api_router.get("/servicios")
-async def get_servicios(empresa_id: Optional[str] = None, current_user: Dict = Depends(get_current_user)):
+async def get_servicios(
+    request: Request,
+    empresa_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    current_user: Dict = Depends(get_current_user)
+):
+    etag = calcular_etag(request, await version_service.obtener("servicios", empresa_id))
+    if no_modificado(request, etag):
+        return respuesta_no_modificada(etag)
+    
     query = {}
     if empresa_id:
         query["empresa_id"] = empresa_id
     
-    servicios = []
-    async for servicio in db.servicios.find(query):
-        servicio["_id"] = str(servicio["_id"])
-        servicio.pop("credenciales_encrypted", None)
-        servicios.append(servicio)
-    return servicios
+    projection = build_projection(fields, CAMPOS_PROTEGIDOS["servicios"])
+    
+    servicios = await find_paginado(db.servicios, query, limit, after, projection=projection).to_list(None)
+    return con_etag(api_response(respuesta_paginada(servicios, limit), accept), etag)
 
 @api_router.get("/servicios/{servicio_id}")
-async def get_servicio(servicio_id: str, show_credentials: bool = False, current_user: Dict = Depends(get_current_user)):
-    servicio = await db.servicios.find_one({"_id": ObjectId(servicio_id)})
+async def get_servicio(servicio_id: str, show_credentials: bool = False, fields: Optional[str] = None, current_user: Dict = Depends(get_current_user)):
+    show_credentials = show_credentials and current_user.get("rol") in ["administrador", "tecnico"]
+    if show_credentials:
+        projection = build_projection(fields, requeridos=CAMPOS_PROTEGIDOS["servicios"])
+    else:
+        projection = build_projection(fields, CAMPOS_PROTEGIDOS["servicios"])
+    
+    servicio = await db.servicios.find_one({"_id": ObjectId(servicio_id)}, projection)
     if not servicio:
         raise HTTPException(status_code=404, detail="Servicio no encontrado")
     
     servicio["_id"] = str(servicio["_id"])
     
-    if show_credentials and current_user.get("rol") in ["administrador", "tecnico"]:
+    if show_credentials:
         if servicio.get("credenciales_encrypted"):
             try:
                 servicio["credenciales"] = decrypt_password(servicio["credenciales_encrypted"])
@@ -485,31 +1441,51 @@ async def create_servicio(request: ServicioCreate, current_user: Dict = Depends(
         servicio_data.pop("credenciales")
     
     servicio = Servicio(**servicio_data)
-    result = await db.servicios.insert_one(servicio.model_dump(by_alias=True, exclude={"id"}))
+    documento = servicio.model_dump(by_alias=True, exclude={"id"})
+    result = await db.servicios.insert_one(documento)
+    await stats_service.registrar("servicios", despues=documento)
+    await version_service.incrementar("servicios", [documento["empresa_id"]])
     return {"id": str(result.inserted_id)}
 
+def preparar_cambios_servicio(data: Dict[str, Any]) -> Dict[str, Any]:
+    if "credenciales" in data and data["credenciales"]:
+        data["credenciales_encrypted"] = encrypt_password(data.pop("credenciales"))
+    return data
+
+@api_router.patch("/servicios/bulk")
+async def update_servicios_bulk(request: BulkUpdateRequest, current_user: Dict = Depends(get_current_user)):
+    return await actualizar_por_filtro("servicios", request, preparar_cambios_servicio)
+
+@api_router.delete("/servicios/bulk")
+async def delete_servicios_bulk(request: BulkDeleteRequest, current_user: Dict = Depends(get_current_user)):
+    return await eliminar_por_filtro("servicios", request)
+
 @api_router.put("/servicios/{servicio_id}")
 async def update_servicio(servicio_id: str, data: Dict[str, Any] = Body(...), current_user: Dict = Depends(get_current_user)):
     data.pop("_id", None)
+    data = preparar_cambios_servicio(data)
     
-    if "credenciales" in data and data["credenciales"]:
-        data["credenciales_encrypted"] = encrypt_password(data.pop("credenciales"))
-    
-    result = await db.servicios.update_one(
+    antes = await db.servicios.find_one_and_update(
         {"_id": ObjectId(servicio_id)},
-        {"$set": data}
+        {"$set": data},
+        projection=CAMPOS_CONTADORES["servicios"]
     )
     
-    if result.matched_count == 0:
+    if antes is None:
         raise HTTPException(status_code=404, detail="Servicio no encontrado")
     
+    await stats_service.registrar("servicios", antes, {**antes, **data})
+    await version_service.incrementar("servicios", [antes.get("empresa_id"), data.get("empresa_id")])
+    
     return {"message": "Servicio actualizado"}
 
 @api_router.delete("/servicios/{servicio_id}")
 async def delete_servicio(servicio_id: str, current_user: Dict = Depends(get_current_user)):
-    result = await db.servicios.delete_one({"_id": ObjectId(servicio_id)})
-    if result.deleted_count == 0:
+    antes = await db.servicios.find_one_and_delete({"_id": ObjectId(servicio_id)}, projection=CAMPOS_CONTADORES["servicios"])
+    if antes is None:
         raise HTTPException(status_code=404, detail="Servicio no encontrado")
+    await stats_service.registrar("servicios", antes=antes)
+    await version_service.incrementar("servicios", [antes.get("empresa_id")])
     return {"message": "Servicio eliminado"}
 
 @api_router.get("/reportes/empresa/{empresa_id}")
@@ -523,59 +1499,37 @@ async def generate_empresa_report(
     Generar reporte detallado de empresa con todos sus equipos y mantenimientos
     template: 'moderna', 'clasica', 'minimalista'
     """
-    empresa = await db.empresas.find_one({"_id": ObjectId(empresa_id)}, {"_id": 0})
+    # Obtener empresa, equipos, bitácoras y servicios de forma concurrente
+    empresa, equipos, bitacoras, servicios = await asyncio.gather(
+        db.empresas.find_one({"_id": ObjectId(empresa_id)}, {"_id": 0}),
+        db.equipos.find(
+            {"empresa_id": empresa_id},
+            {"password_windows_encrypted": 0, "password_correo_encrypted": 0}
+        ).to_list(None),
+        get_bitacoras_reporte({"empresa_id": empresa_id}, fechas_iso=True),
+        db.servicios.find({"empresa_id": empresa_id}, {"credenciales_encrypted": 0}).to_list(None)
+    )
     if not empresa:
         raise HTTPException(status_code=404, detail="Empresa no encontrada")
     
     empresa["_id"] = empresa_id
     
-    # Obtener equipos con toda la información
-    equipos = []
-    async for equipo in db.equipos.find({"empresa_id": empresa_id}, {"_id": 0}):
-        equipo["_id"] = str(equipo.get("_id", ""))
-        equipos.append(equipo)
+    # Agrupar bitácoras por equipo en una sola pasada (ya vienen ordenadas por fecha descendente)
+    bitacoras_por_equipo = {}
+    for bitacora in bitacoras:
+        bitacoras_por_equipo.setdefault(bitacora.get("equipo_id"), []).append(bitacora)
     
-    # Obtener bitácoras con información completa
-    bitacoras = []
-    async for bitacora in db.bitacoras.find({"empresa_id": empresa_id}).sort("fecha", -1):
-        bitacora["_id"] = str(bitacora["_id"])
-        
-        # Obtener nombre del técnico
-        if bitacora.get("tecnico_id"):
-            tecnico = await db.usuarios.find_one({"_id": ObjectId(bitacora["tecnico_id"])}, {"_id": 0, "nombre": 1})
-            bitacora["tecnico"] = tecnico.get("nombre") if tecnico else "N/A"
-        
-        # Formatear fechas
-        if isinstance(bitacora.get("fecha"), datetime):
-            bitacora["fecha"] = bitacora["fecha"].isoformat()
-        if isinstance(bitacora.get("fecha_revision"), datetime):
-            bitacora["fecha_revision"] = bitacora["fecha_revision"].isoformat()
-        
-        bitacoras.append(bitacora)
+    for equipo in equipos:
+        equipo["_id"] = str(equipo["_id"])
+        equipo["bitacoras"] = bitacoras_por_equipo.get(equipo["_id"], [])
     
-    servicios = []
-    async for servicio in db.servicios.find({"empresa_id": empresa_id}):
+    for servicio in servicios:
         servicio["_id"] = str(servicio["_id"])
         if isinstance(servicio.get("fecha_renovacion"), datetime):
             servicio["fecha_renovacion"] = servicio["fecha_renovacion"].isoformat()
-        servicios.append(servicio)
     
     try:
-        # Obtener configuración para logo y nombre
-        config = await db.configuracion.find_one({})
-        logo_path = None
-        sistema_nombre = "Sistema ITSM"
-        
-        if config:
-            sistema_nombre = config.get("nombre_sistema", "Sistema ITSM")
-            # Si hay logo en base64, guardarlo temporalmente
-            if config.get("logo_url") and config["logo_url"].startswith("data:image"):
-                import base64
-                logo_data = config["logo_url"].split(",")[1]
-                logo_bytes = base64.b64decode(logo_data)
-                logo_path = "/tmp/logo_temp.png"
-                with open(logo_path, "wb") as f:
-                    f.write(logo_bytes)
+        logo_path, sistema_nombre = await get_marca_reportes()
         
         # Validar template
         if template not in ["moderna", "clasica", "minimalista"]:
@@ -612,36 +1566,10 @@ async def generate_equipo_report(
     equipo["_id"] = equipo_id
     
     # Obtener todas las bitácoras del equipo con información completa
-    bitacoras = []
-    async for bitacora in db.bitacoras.find({"equipo_id": equipo_id}).sort("fecha", -1):
-        bitacora["_id"] = str(bitacora["_id"])
-        
-        # Obtener nombre del técnico
-        if bitacora.get("tecnico_id"):
-            tecnico = await db.usuarios.find_one({"_id": ObjectId(bitacora["tecnico_id"])}, {"_id": 0, "nombre": 1})
-            bitacora["tecnico"] = tecnico.get("nombre") if tecnico else "N/A"
-        
-        # Formatear fecha
-        if isinstance(bitacora.get("fecha"), datetime):
-            bitacora["fecha"] = bitacora["fecha"].isoformat()
-        
-        bitacoras.append(bitacora)
+    bitacoras = await get_bitacoras_reporte({"equipo_id": equipo_id}, fechas_iso=True)
     
     try:
-        # Obtener configuración para logo y nombre
-        config = await db.configuracion.find_one({})
-        logo_path = None
-        sistema_nombre = "Sistema ITSM"
-        
-        if config:
-            sistema_nombre = config.get("nombre_sistema", "Sistema ITSM")
-            if config.get("logo_url") and config["logo_url"].startswith("data:image"):
-                import base64
-                logo_data = config["logo_url"].split(",")[1]
-                logo_bytes = base64.b64decode(logo_data)
-                logo_path = "/tmp/logo_temp.png"
-                with open(logo_path, "wb") as f:
-                    f.write(logo_bytes)
+        logo_path, sistema_nombre = await get_marca_reportes()
         
         # Validar template
         if template not in ["moderna", "clasica", "minimalista"]:
@@ -671,57 +1599,48 @@ async def exportar_bitacoras(
     fecha_inicio: Optional[str] = None,
     current_user: Dict = Depends(get_current_user)
 ):
+    """
+    Exportar bitácoras a CSV en streaming: las filas se escriben a medida que llegan del cursor.
+    periodo: 'dia', 'semana', 'mes', 'todo' (sin límite de fechas) o personalizado con fecha_inicio
+    """
     import csv
     from io import StringIO
-    from datetime import timedelta
-    
-    # Calcular rango de fechas según período
-    fecha_fin = datetime.utcnow()
-    if periodo == "dia":
-        fecha_inicio_dt = fecha_fin - timedelta(days=1)
-    elif periodo == "semana":
-        fecha_inicio_dt = fecha_fin - timedelta(weeks=1)
-    elif periodo == "mes":
-        fecha_inicio_dt = fecha_fin - timedelta(days=30)
-    else:
-        if fecha_inicio:
-            fecha_inicio_dt = datetime.fromisoformat(fecha_inicio)
-        else:
-            fecha_inicio_dt = datetime.utcnow() - timedelta(days=30)
     
     # Consultar bitácoras
-    query = {
-        "empresa_id": empresa_id,
-        "fecha": {"$gte": fecha_inicio_dt, "$lte": fecha_fin}
-    }
-    
-    bitacoras = []
-    async for bitacora in db.bitacoras.find(query).sort("fecha", -1):
-        equipo = await db.equipos.find_one({"_id": ObjectId(bitacora["equipo_id"])})
-        tecnico = await db.usuarios.find_one({"_id": ObjectId(bitacora["tecnico_id"])})
+    query = {"empresa_id": empresa_id}
+    if periodo != "todo":
+        fecha_inicio_dt, fecha_fin = calcular_rango_fechas(periodo, fecha_inicio)
+        query["fecha"] = {"$gte": fecha_inicio_dt, "$lte": fecha_fin}
+    
+    columnas = ["fecha", "equipo", "tipo", "descripcion", "tecnico", "estado", "observaciones", "anotaciones_extras"]
+    projection = {campo: 1 for campo in columnas if campo not in ("equipo", "tecnico")}
+    projection.update({"equipo_id": 1, "tecnico_id": 1})
+    
+    async def generar_csv():
+        # Un búfer por lote: la memoria no depende del número de filas exportadas
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(columnas)
+        yield output.getvalue()
         
-        bitacoras.append({
-            "fecha": bitacora["fecha"].strftime("%d/%m/%Y %H:%M"),
-            "equipo": equipo.get("nombre") if equipo else "N/A",
-            "tipo": bitacora["tipo"],
-            "descripcion": bitacora["descripcion"],
-            "tecnico": tecnico.get("nombre") if tecnico else "N/A",
-            "estado": bitacora["estado"],
-            "observaciones": bitacora.get("observaciones", ""),
-            "anotaciones_extras": bitacora.get("anotaciones_extras", "")
-        })
-    
-    # Crear CSV
-    output = StringIO()
-    if bitacoras:
-        writer = csv.DictWriter(output, fieldnames=bitacoras[0].keys())
-        writer.writeheader()
-        writer.writerows(bitacoras)
+        async for lote in iter_bitacoras_con_nombres(query, projection=projection):
+            output.seek(0)
+            output.truncate(0)
+            for bitacora in lote:
+                writer.writerow([
+                    bitacora["fecha"].strftime("%d/%m/%Y %H:%M"),
+                    bitacora["equipo"],
+                    bitacora["tipo"],
+                    bitacora["descripcion"],
+                    bitacora["tecnico"],
+                    bitacora["estado"],
+                    bitacora.get("observaciones", ""),
+                    bitacora.get("anotaciones_extras", "")
+                ])
+            yield output.getvalue()
     
-    from fastapi.responses import StreamingResponse
-    output.seek(0)
     return StreamingResponse(
-        iter([output.getvalue()]),
+        generar_csv(),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=bitacoras_{empresa_id}_{periodo}.csv"}
     )
@@ -736,21 +1655,9 @@ async def exportar_bitacoras_pdf(
     current_user: Dict = Depends(get_current_user)
 ):
     """Exportar bitácoras a PDF con campos seleccionables y plantillas"""
-    from datetime import timedelta
     
     # Calcular rango de fechas
-    fecha_fin = datetime.utcnow()
-    if periodo == "dia":
-        fecha_inicio_dt = fecha_fin - timedelta(days=1)
-    elif periodo == "semana":
-        fecha_inicio_dt = fecha_fin - timedelta(weeks=1)
-    elif periodo == "mes":
-        fecha_inicio_dt = fecha_fin - timedelta(days=30)
-    else:
-        if fecha_inicio:
-            fecha_inicio_dt = datetime.fromisoformat(fecha_inicio)
-        else:
-            fecha_inicio_dt = datetime.utcnow() - timedelta(days=30)
+    fecha_inicio_dt, fecha_fin = calcular_rango_fechas(periodo, fecha_inicio)
     
     # Obtener empresa
     empresa = await db.empresas.find_one({"_id": ObjectId(empresa_id)})
@@ -763,48 +1670,10 @@ async def exportar_bitacoras_pdf(
         "fecha": {"$gte": fecha_inicio_dt, "$lte": fecha_fin}
     }
     
-    bitacoras = []
-    async for bitacora in db.bitacoras.find(query).sort("fecha", -1):
-        equipo = await db.equipos.find_one({"_id": ObjectId(bitacora["equipo_id"])}, {"_id": 0})
-        tecnico = await db.usuarios.find_one({"_id": ObjectId(bitacora["tecnico_id"])}, {"_id": 0})
-        
-        bitacoras.append({
-            "fecha": bitacora["fecha"],
-            "equipo": equipo.get("nombre") if equipo else "N/A",
-            "tipo": bitacora["tipo"],
-            "descripcion": bitacora["descripcion"],
-            "tecnico": tecnico.get("nombre") if tecnico else "N/A",
-            "estado": bitacora["estado"],
-            "observaciones": bitacora.get("observaciones", ""),
-            "tiempo_estimado": bitacora.get("tiempo_estimado"),
-            "tiempo_real": bitacora.get("tiempo_real"),
-            "fecha_revision": bitacora.get("fecha_revision"),
-            "limpieza_fisica": bitacora.get("limpieza_fisica", False),
-            "actualizacion_software": bitacora.get("actualizacion_software", False),
-            "revision_hardware": bitacora.get("revision_hardware", False),
-            "respaldo_datos": bitacora.get("respaldo_datos", False),
-            "optimizacion_sistema": bitacora.get("optimizacion_sistema", False),
-            "diagnostico_problema": bitacora.get("diagnostico_problema", ""),
-            "solucion_aplicada": bitacora.get("solucion_aplicada", ""),
-            "componentes_reemplazados": bitacora.get("componentes_reemplazados", ""),
-            "anotaciones_extras": bitacora.get("anotaciones_extras", "")
-        })
+    bitacoras = await get_bitacoras_reporte(query)
     
     try:
-        # Obtener configuración para logo
-        config = await db.configuracion.find_one({})
-        logo_path = None
-        sistema_nombre = "Sistema ITSM"
-        
-        if config:
-            sistema_nombre = config.get("nombre_sistema", "Sistema ITSM")
-            if config.get("logo_url") and config["logo_url"].startswith("data:image"):
-                import base64
-                logo_data = config["logo_url"].split(",")[1]
-                logo_bytes = base64.b64decode(logo_data)
-                logo_path = "/tmp/logo_temp.png"
-                with open(logo_path, "wb") as f:
-                    f.write(logo_bytes)
+        logo_path, sistema_nombre = await get_marca_reportes()
         
         # Parsear campos seleccionados
         campos_seleccionados = None
@@ -833,21 +1702,9 @@ async def exportar_bitacoras_pdf_detallado(
     current_user: Dict = Depends(get_current_user)
 ):
     """Exportar bitácoras a PDF detallado con TODO el contenido"""
-    from datetime import timedelta
     
     # Calcular rango de fechas
-    fecha_fin = datetime.utcnow()
-    if periodo == "dia":
-        fecha_inicio_dt = fecha_fin - timedelta(days=1)
-    elif periodo == "semana":
-        fecha_inicio_dt = fecha_fin - timedelta(weeks=1)
-    elif periodo == "mes":
-        fecha_inicio_dt = fecha_fin - timedelta(days=30)
-    else:
-        if fecha_inicio:
-            fecha_inicio_dt = datetime.fromisoformat(fecha_inicio)
-        else:
-            fecha_inicio_dt = datetime.utcnow() - timedelta(days=30)
+    fecha_inicio_dt, fecha_fin = calcular_rango_fechas(periodo, fecha_inicio)
     
     # Obtener empresa
     empresa = await db.empresas.find_one({"_id": ObjectId(empresa_id)})
@@ -860,47 +1717,10 @@ async def exportar_bitacoras_pdf_detallado(
         "fecha": {"$gte": fecha_inicio_dt, "$lte": fecha_fin}
     }
     
-    bitacoras = []
-    async for bitacora in db.bitacoras.find(query).sort("fecha", -1):
-        equipo = await db.equipos.find_one({"_id": ObjectId(bitacora["equipo_id"])}, {"_id": 0})
-        tecnico = await db.usuarios.find_one({"_id": ObjectId(bitacora["tecnico_id"])}, {"_id": 0})
-        
-        bitacoras.append({
-            "fecha": bitacora["fecha"],
-            "equipo": equipo.get("nombre") if equipo else "N/A",
-            "tipo": bitacora["tipo"],
-            "descripcion": bitacora["descripcion"],
-            "tecnico": tecnico.get("nombre") if tecnico else "N/A",
-            "estado": bitacora["estado"],
-            "observaciones": bitacora.get("observaciones", ""),
-            "tiempo_estimado": bitacora.get("tiempo_estimado"),
-            "tiempo_real": bitacora.get("tiempo_real"),
-            "limpieza_fisica": bitacora.get("limpieza_fisica", False),
-            "actualizacion_software": bitacora.get("actualizacion_software", False),
-            "revision_hardware": bitacora.get("revision_hardware", False),
-            "respaldo_datos": bitacora.get("respaldo_datos", False),
-            "optimizacion_sistema": bitacora.get("optimizacion_sistema", False),
-            "diagnostico_problema": bitacora.get("diagnostico_problema", ""),
-            "solucion_aplicada": bitacora.get("solucion_aplicada", ""),
-            "componentes_reemplazados": bitacora.get("componentes_reemplazados", ""),
-            "anotaciones_extras": bitacora.get("anotaciones_extras", "")
-        })
+    bitacoras = await get_bitacoras_reporte(query)
     
     try:
-        # Obtener configuración para logo
-        config = await db.configuracion.find_one({})
-        logo_path = None
-        sistema_nombre = "Sistema ITSM"
-        
-        if config:
-            sistema_nombre = config.get("nombre_sistema", "Sistema ITSM")
-            if config.get("logo_url") and config["logo_url"].startswith("data:image"):
-                import base64
-                logo_data = config["logo_url"].split(",")[1]
-                logo_bytes = base64.b64decode(logo_data)
-                logo_path = "/tmp/logo_temp.png"
-                with open(logo_path, "wb") as f:
-                    f.write(logo_bytes)
+        logo_path, sistema_nombre = await get_marca_reportes()
         
         filename = pdf_service.generate_bitacoras_report_detailed(
             bitacoras, 
@@ -915,41 +1735,46 @@ async def exportar_bitacoras_pdf_detallado(
         raise HTTPException(status_code=500, detail=f"Error al generar reporte: {str(e)}")
 
 @api_router.get("/configuracion")
-async def get_configuracion(current_user: Dict = Depends(get_current_user)):
-    config = await db.configuracion.find_one({})
+async def get_configuracion(request: Request, current_user: Dict = Depends(get_current_user)):
+    config = await get_config()
     if not config:
         config = Configuracion().model_dump(by_alias=True)
         await db.configuracion.insert_one(config)
     
+    # Toda escritura de la configuración actualiza actualizado_en
+    etag = calcular_etag(request, f"{config['_id']}:{config.get('actualizado_en')}")
+    if no_modificado(request, etag):
+        return respuesta_no_modificada(etag)
+    
     config["_id"] = str(config["_id"])
-    return config
+    return con_etag(ORJSONResponse(config), etag)
 
 @api_router.put("/configuracion")
 async def update_configuracion(request: ConfiguracionUpdate, current_user: Dict = Depends(get_admin_user)):
     update_data = request.model_dump(exclude_unset=True)
     update_data["actualizado_en"] = datetime.utcnow()
     
-    result = await db.configuracion.update_one(
-        {},
-        {"$set": update_data},
-        upsert=True
-    )
+    await actualizar_config(update_data)
     
     return {"message": "Configuración actualizada"}
 
 @api_router.get("/configuracion/campos/{entity_type}")
-async def get_custom_fields_config(entity_type: str, current_user: Dict = Depends(get_current_user)):
+async def get_custom_fields_config(entity_type: str, request: Request, current_user: Dict = Depends(get_current_user)):
     """Obtener configuración de campos personalizados para una entidad"""
     valid_entities = ["empresas", "equipos", "bitacoras", "servicios"]
     if entity_type not in valid_entities:
         raise HTTPException(status_code=400, detail="Tipo de entidad no válido")
     
-    config = await db.configuracion.find_one({})
+    config = await get_config()
     if not config:
         return {f"campos_{entity_type}": []}
     
+    etag = calcular_etag(request, f"{config['_id']}:{config.get('actualizado_en')}")
+    if no_modificado(request, etag):
+        return respuesta_no_modificada(etag)
+    
     field_name = f"campos_{entity_type}"
-    return {field_name: config.get(field_name, [])}
+    return con_etag(ORJSONResponse({field_name: config.get(field_name, [])}), etag)
 
 @api_router.put("/configuracion/campos/{entity_type}")
 async def update_custom_fields_config(
@@ -976,103 +1801,102 @@ async def update_custom_fields_config(
         if campo["tipo"] == "select" and "opciones" not in campo:
             raise HTTPException(status_code=400, detail="Los campos tipo 'select' deben tener 'opciones'")
     
-    result = await db.configuracion.update_one(
-        {},
-        {"$set": {field_name: campos, "actualizado_en": datetime.utcnow()}},
-        upsert=True
-    )
+    await actualizar_config({field_name: campos, "actualizado_en": datetime.utcnow()})
     
     return {"message": f"Configuración de campos para {entity_type} actualizada", field_name: campos}
 
+# Configuración predefinida de campos por tipo de equipo
+CAMPOS_POR_TIPO_EQUIPO = {
+    "laptop": [
+        {"nombre": "Procesador", "tipo": "texto", "requerido": True},
+        {"nombre": "RAM (GB)", "tipo": "numero", "requerido": True},
+        {"nombre": "Disco Duro", "tipo": "texto", "requerido": True},
+        {"nombre": "Disco Duro Capacidad (GB)", "tipo": "numero", "requerido": False},
+        {"nombre": "Sistema Operativo", "tipo": "texto", "requerido": True},
+        {"nombre": "Tarjeta Gráfica", "tipo": "texto", "requerido": False},
+        {"nombre": "Pantalla (pulgadas)", "tipo": "numero", "requerido": False},
+        {"nombre": "Batería Estado", "tipo": "select", "opciones": ["Excelente", "Buena", "Regular", "Mala"], "requerido": False}
+    ],
+    "desktop": [
+        {"nombre": "Procesador", "tipo": "texto", "requerido": True},
+        {"nombre": "RAM (GB)", "tipo": "numero", "requerido": True},
+        {"nombre": "Disco Duro", "tipo": "texto", "requerido": True},
+        {"nombre": "Disco Duro Capacidad (GB)", "tipo": "numero", "requerido": False},
+        {"nombre": "Sistema Operativo", "tipo": "texto", "requerido": True},
+        {"nombre": "Tarjeta Gráfica", "tipo": "texto", "requerido": False},
+        {"nombre": "Fuente de Poder (W)", "tipo": "numero", "requerido": False},
+        {"nombre": "Gabinete Tipo", "tipo": "texto", "requerido": False}
+    ],
+    "servidor": [
+        {"nombre": "Procesador", "tipo": "texto", "requerido": True},
+        {"nombre": "Núcleos CPU", "tipo": "numero", "requerido": False},
+        {"nombre": "RAM (GB)", "tipo": "numero", "requerido": True},
+        {"nombre": "Discos", "tipo": "texto", "requerido": True},
+        {"nombre": "Configuración RAID", "tipo": "select", "opciones": ["RAID 0", "RAID 1", "RAID 5", "RAID 6", "RAID 10", "Sin RAID"], "requerido": False},
+        {"nombre": "Sistema Operativo", "tipo": "texto", "requerido": True},
+        {"nombre": "Servicios Activos", "tipo": "texto", "requerido": False},
+        {"nombre": "IP Asignada", "tipo": "texto", "requerido": False},
+        {"nombre": "Puerto Administración", "tipo": "texto", "requerido": False}
+    ],
+    "firewall": [
+        {"nombre": "Modelo", "tipo": "texto", "requerido": True},
+        {"nombre": "Firmware", "tipo": "texto", "requerido": True},
+        {"nombre": "Puertos WAN", "tipo": "numero", "requerido": True},
+        {"nombre": "Puertos LAN", "tipo": "numero", "requerido": True},
+        {"nombre": "IP WAN", "tipo": "texto", "requerido": False},
+        {"nombre": "IP LAN", "tipo": "texto", "requerido": False},
+        {"nombre": "VPN Configurado", "tipo": "checkbox", "requerido": False},
+        {"nombre": "Reglas Configuradas", "tipo": "numero", "requerido": False}
+    ],
+    "switch": [
+        {"nombre": "Modelo", "tipo": "texto", "requerido": True},
+        {"nombre": "Puertos Totales", "tipo": "numero", "requerido": True},
+        {"nombre": "Puertos Gigabit", "tipo": "numero", "requerido": False},
+        {"nombre": "Puertos SFP", "tipo": "numero", "requerido": False},
+        {"nombre": "VLANs Configuradas", "tipo": "texto", "requerido": False},
+        {"nombre": "Administrable", "tipo": "checkbox", "requerido": False},
+        {"nombre": "IP Administración", "tipo": "texto", "requerido": False},
+        {"nombre": "PoE", "tipo": "checkbox", "requerido": False}
+    ],
+    "repetidor": [
+        {"nombre": "Modelo", "tipo": "texto", "requerido": True},
+        {"nombre": "Frecuencia", "tipo": "select", "opciones": ["2.4 GHz", "5 GHz", "Dual Band"], "requerido": True},
+        {"nombre": "Velocidad Máxima (Mbps)", "tipo": "numero", "requerido": False},
+        {"nombre": "SSID Principal", "tipo": "texto", "requerido": False},
+        {"nombre": "Rango Cobertura (m)", "tipo": "numero", "requerido": False},
+        {"nombre": "Antenas", "tipo": "numero", "requerido": False}
+    ],
+    "dvr": [
+        {"nombre": "Modelo", "tipo": "texto", "requerido": True},
+        {"nombre": "Canales", "tipo": "numero", "requerido": True},
+        {"nombre": "Capacidad HDD (TB)", "tipo": "numero", "requerido": True},
+        {"nombre": "Resolución Grabación", "tipo": "select", "opciones": ["720p", "1080p", "4K", "5MP"], "requerido": False},
+        {"nombre": "FPS", "tipo": "numero", "requerido": False},
+        {"nombre": "Acceso Remoto", "tipo": "checkbox", "requerido": False},
+        {"nombre": "IP Asignada", "tipo": "texto", "requerido": False}
+    ],
+    "red": [
+        {"nombre": "Tipo", "tipo": "select", "opciones": ["Router", "Access Point", "Modem", "Bridge", "Gateway"], "requerido": True},
+        {"nombre": "Modelo", "tipo": "texto", "requerido": True},
+        {"nombre": "Velocidad", "tipo": "texto", "requerido": False},
+        {"nombre": "Frecuencia", "tipo": "select", "opciones": ["2.4 GHz", "5 GHz", "Dual Band", "N/A"], "requerido": False},
+        {"nombre": "IP Asignada", "tipo": "texto", "requerido": False},
+        {"nombre": "DHCP Activo", "tipo": "checkbox", "requerido": False}
+    ]
+}
+
+# Los campos por tipo solo cambian con el código: su ETag se calcula una vez
+VERSION_CAMPOS_TIPO_EQUIPO = hashlib.sha1(orjson.dumps(CAMPOS_POR_TIPO_EQUIPO)).hexdigest()
+
 @api_router.get("/configuracion/campos-tipo-equipo/{tipo_equipo}")
-async def get_campos_tipo_equipo(tipo_equipo: str, current_user: Dict = Depends(get_current_user)):
+async def get_campos_tipo_equipo(tipo_equipo: str, request: Request, current_user: Dict = Depends(get_current_user)):
     """Obtener campos específicos para un tipo de equipo"""
-    
-    # Configuración predefinida de campos por tipo de equipo
-    campos_por_tipo = {
-        "laptop": [
-            {"nombre": "Procesador", "tipo": "texto", "requerido": True},
-            {"nombre": "RAM (GB)", "tipo": "numero", "requerido": True},
-            {"nombre": "Disco Duro", "tipo": "texto", "requerido": True},
-            {"nombre": "Disco Duro Capacidad (GB)", "tipo": "numero", "requerido": False},
-            {"nombre": "Sistema Operativo", "tipo": "texto", "requerido": True},
-            {"nombre": "Tarjeta Gráfica", "tipo": "texto", "requerido": False},
-            {"nombre": "Pantalla (pulgadas)", "tipo": "numero", "requerido": False},
-            {"nombre": "Batería Estado", "tipo": "select", "opciones": ["Excelente", "Buena", "Regular", "Mala"], "requerido": False}
-        ],
-        "desktop": [
-            {"nombre": "Procesador", "tipo": "texto", "requerido": True},
-            {"nombre": "RAM (GB)", "tipo": "numero", "requerido": True},
-            {"nombre": "Disco Duro", "tipo": "texto", "requerido": True},
-            {"nombre": "Disco Duro Capacidad (GB)", "tipo": "numero", "requerido": False},
-            {"nombre": "Sistema Operativo", "tipo": "texto", "requerido": True},
-            {"nombre": "Tarjeta Gráfica", "tipo": "texto", "requerido": False},
-            {"nombre": "Fuente de Poder (W)", "tipo": "numero", "requerido": False},
-            {"nombre": "Gabinete Tipo", "tipo": "texto", "requerido": False}
-        ],
-        "servidor": [
-            {"nombre": "Procesador", "tipo": "texto", "requerido": True},
-            {"nombre": "Núcleos CPU", "tipo": "numero", "requerido": False},
-            {"nombre": "RAM (GB)", "tipo": "numero", "requerido": True},
-            {"nombre": "Discos", "tipo": "texto", "requerido": True},
-            {"nombre": "Configuración RAID", "tipo": "select", "opciones": ["RAID 0", "RAID 1", "RAID 5", "RAID 6", "RAID 10", "Sin RAID"], "requerido": False},
-            {"nombre": "Sistema Operativo", "tipo": "texto", "requerido": True},
-            {"nombre": "Servicios Activos", "tipo": "texto", "requerido": False},
-            {"nombre": "IP Asignada", "tipo": "texto", "requerido": False},
-            {"nombre": "Puerto Administración", "tipo": "texto", "requerido": False}
-        ],
-        "firewall": [
-            {"nombre": "Modelo", "tipo": "texto", "requerido": True},
-            {"nombre": "Firmware", "tipo": "texto", "requerido": True},
-            {"nombre": "Puertos WAN", "tipo": "numero", "requerido": True},
-            {"nombre": "Puertos LAN", "tipo": "numero", "requerido": True},
-            {"nombre": "IP WAN", "tipo": "texto", "requerido": False},
-            {"nombre": "IP LAN", "tipo": "texto", "requerido": False},
-            {"nombre": "VPN Configurado", "tipo": "checkbox", "requerido": False},
-            {"nombre": "Reglas Configuradas", "tipo": "numero", "requerido": False}
-        ],
-        "switch": [
-            {"nombre": "Modelo", "tipo": "texto", "requerido": True},
-            {"nombre": "Puertos Totales", "tipo": "numero", "requerido": True},
-            {"nombre": "Puertos Gigabit", "tipo": "numero", "requerido": False},
-            {"nombre": "Puertos SFP", "tipo": "numero", "requerido": False},
-            {"nombre": "VLANs Configuradas", "tipo": "texto", "requerido": False},
-            {"nombre": "Administrable", "tipo": "checkbox", "requerido": False},
-            {"nombre": "IP Administración", "tipo": "texto", "requerido": False},
-            {"nombre": "PoE", "tipo": "checkbox", "requerido": False}
-        ],
-        "repetidor": [
-            {"nombre": "Modelo", "tipo": "texto", "requerido": True},
-            {"nombre": "Frecuencia", "tipo": "select", "opciones": ["2.4 GHz", "5 GHz", "Dual Band"], "requerido": True},
-            {"nombre": "Velocidad Máxima (Mbps)", "tipo": "numero", "requerido": False},
-            {"nombre": "SSID Principal", "tipo": "texto", "requerido": False},
-            {"nombre": "Rango Cobertura (m)", "tipo": "numero", "requerido": False},
-            {"nombre": "Antenas", "tipo": "numero", "requerido": False}
-        ],
-        "dvr": [
-            {"nombre": "Modelo", "tipo": "texto", "requerido": True},
-            {"nombre": "Canales", "tipo": "numero", "requerido": True},
-            {"nombre": "Capacidad HDD (TB)", "tipo": "numero", "requerido": True},
-            {"nombre": "Resolución Grabación", "tipo": "select", "opciones": ["720p", "1080p", "4K", "5MP"], "requerido": False},
-            {"nombre": "FPS", "tipo": "numero", "requerido": False},
-            {"nombre": "Acceso Remoto", "tipo": "checkbox", "requerido": False},
-            {"nombre": "IP Asignada", "tipo": "texto", "requerido": False}
-        ],
-        "red": [
-            {"nombre": "Tipo", "tipo": "select", "opciones": ["Router", "Access Point", "Modem", "Bridge", "Gateway"], "requerido": True},
-            {"nombre": "Modelo", "tipo": "texto", "requerido": True},
-            {"nombre": "Velocidad", "tipo": "texto", "requerido": False},
-            {"nombre": "Frecuencia", "tipo": "select", "opciones": ["2.4 GHz", "5 GHz", "Dual Band", "N/A"], "requerido": False},
-            {"nombre": "IP Asignada", "tipo": "texto", "requerido": False},
-            {"nombre": "DHCP Activo", "tipo": "checkbox", "requerido": False}
-        ]
-    }
+    etag = calcular_etag(request, VERSION_CAMPOS_TIPO_EQUIPO)
+    if no_modificado(request, etag):
+        return respuesta_no_modificada(etag)
     
     tipo_lower = tipo_equipo.lower()
-    if tipo_lower not in campos_por_tipo:
-        return {"campos": []}
-    
-    return {"campos": campos_por_tipo[tipo_lower]}
+    return con_etag(ORJSONResponse({"campos": CAMPOS_POR_TIPO_EQUIPO.get(tipo_lower, [])}), etag)
 
 @api_router.post("/configuracion/logo")
 async def upload_logo(file: bytes = Body(...), current_user: Dict = Depends(get_admin_user)):
@@ -1082,37 +1906,87 @@ async def upload_logo(file: bytes = Body(...), current_user: Dict = Depends(get_
     # Guardar como base64 en la configuración
     logo_base64 = base64.b64encode(file).decode('utf-8')
     
-    await db.configuracion.update_one(
-        {},
-        {"$set": {"logo_url": f"data:image/png;base64,{logo_base64}", "actualizado_en": datetime.utcnow()}},
-        upsert=True
-    )
+    await actualizar_config({"logo_url": f"data:image/png;base64,{logo_base64}", "actualizado_en": datetime.utcnow()})
     
     return {"message": "Logo actualizado exitosamente", "logo_url": f"data:image/png;base64,{logo_base64}"}
 
+@api_router.get("/trabajos/{job_id}")
+async def get_trabajo(job_id: str, current_user: Dict = Depends(get_current_user)):
+    """Estado y progreso de un trabajo en segundo plano"""
+    trabajo = await job_service.obtener(job_id)
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    # Documento de Mongo tal cual (_id ObjectId): lo codifica orjson, no jsonable_encoder
+    return api_response(trabajo)
+
 @api_router.get("/estadisticas")
-async def get_estadisticas(current_user: Dict = Depends(get_current_user)):
-    total_empresas = await db.empresas.count_documents({})
-    total_equipos = await db.equipos.count_documents({})
-    equipos_activos = await db.equipos.count_documents({"estado": "Activo"})
-    total_bitacoras = await db.bitacoras.count_documents({})
-    bitacoras_pendientes = await db.bitacoras.count_documents({"estado": "Pendiente"})
-    total_servicios = await db.servicios.count_documents({"activo": True})
-    
-    servicios_cursor = db.servicios.find({"activo": True})
-    costo_total_servicios = 0
-    async for servicio in servicios_cursor:
-        costo_total_servicios += servicio.get("costo_mensual", 0)
+async def get_estadisticas(empresa_id: Optional[str] = None, current_user: Dict = Depends(get_current_user)):
+    # Lectura de un solo documento de contadores mantenido por los handlers de escritura
+    return await stats_service.obtener(empresa_id)
+
+SSE_KEEPALIVE = 15
+
+def evento_sse(evento: Dict[str, Any], numero: int) -> bytes:
+    datos = {campo: valor for campo, valor in evento.items() if campo != "tipo"}
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (numero, evento["tipo"].encode(), orjson.dumps(datos, default=json_default))
+
+@api_router.get("/eventos")
+async def stream_eventos(
+    request: Request,
+    empresa_id: Optional[str] = None,
+    tipos: Optional[str] = None,
+    current_user: Dict = Depends(get_current_user_sse)
+):
+    """
+    Server-sent events con los cambios de empresas, equipos, bitácoras y servicios y los
+    contadores de /estadisticas, para no volver a pedir los listados completos.
+    tipos: lista separada por comas de empresas, equipos, bitacoras, servicios, estadisticas.
+    Un evento 'resync' indica que se perdieron eventos y hay que recargar los datos.
+    """
+    tipos_pedidos = [tipo.strip() for tipo in tipos.split(",") if tipo.strip()] if tipos else list(TIPOS_EVENTO)
+    desconocidos = set(tipos_pedidos) - set(TIPOS_EVENTO)
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Tipos de evento no válidos: {', '.join(sorted(desconocidos))}")
+    
+    event_service.iniciar(CAMPOS_PROTEGIDOS)
+    suscripcion = event_service.suscribir(empresa_id, tipos_pedidos)
+    # Reconexión del navegador: los eventos emitidos mientras tanto no se guardan
+    reconexion = request.headers.get("last-event-id") is not None
+    
+    async def generar():
+        numero = 0
+        try:
+            yield f"retry: {SSE_RETRY_SECONDS * 1000}\n\n".encode()
+            numero += 1
+            yield evento_sse({"tipo": "resync" if reconexion else "listo", "modo": event_service.modo}, numero)
+            while True:
+                try:
+                    evento = await asyncio.wait_for(suscripcion.cola.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Comentario SSE: mantiene abierta la conexión a través de proxies
+                    yield b": ping\n\n"
+                    continue
+                numero += 1
+                yield evento_sse(evento, numero)
+        finally:
+            event_service.cancelar(suscripcion)
     
-    return {
-        "total_empresas": total_empresas,
-        "total_equipos": total_equipos,
-        "equipos_activos": equipos_activos,
-        "total_bitacoras": total_bitacoras,
-        "bitacoras_pendientes": bitacoras_pendientes,
-        "total_servicios": total_servicios,
-        "costo_total_servicios": costo_total_servicios
-    }
+    return StreamingResponse(
+        generar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.post("/estadisticas/reconstruir")
+async def reconstruir_estadisticas(current_user: Dict = Depends(get_admin_user)):
+    """Recalcular los contadores de estadísticas desde cero"""
+    documentos = await stats_service.reconstruir()
+    return {"message": "Estadísticas reconstruidas", "documentos": documentos}
+
+@api_router.get("/cache/stats")
+async def get_cache_metrics(current_user: Dict = Depends(get_admin_user)):
+    """Métricas de aciertos y fallos de las cachés en memoria de este proceso y estado del índice de búsqueda"""
+    return {**get_cache_stats(), "indice_equipos": equipos_search.stats()}
 
 @api_router.get("/")
 async def root():
@@ -1140,7 +2014,14 @@ async def startup():
         config = Configuracion()
         await db.configuracion.insert_one(config.model_dump(by_alias=True, exclude={"id"}))
         logger.info("Configuración inicial creada")
+    
+    stats_exists = await db.estadisticas.find_one({"_id": GLOBAL_ID})
+    if not stats_exists:
+        await stats_service.reconstruir()
+        logger.info("Contadores de estadísticas reconstruidos")
+    
+    await reanudar_trabajos()
 
 @app.on_event("shutdown")
 async def shutdown():
-    pass
+    await event_service.detener()
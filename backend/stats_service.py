@@ -0,0 +1,171 @@
+from pymongo import ReplaceOne, DeleteMany
+from typing import Dict, Any, Iterable, Optional
+from datetime import datetime
+import asyncio
+
+from database import db
+
+GLOBAL_ID = "global"
+
+# Campos que cada colección necesita leer para calcular su aporte a los contadores
+CAMPOS_CONTADORES = {
+    "empresas": {"_id": 1},
+    "equipos": {"empresa_id": 1, "estado": 1},
+    "bitacoras": {"empresa_id": 1, "estado": 1},
+    "servicios": {"empresa_id": 1, "activo": 1, "costo_mensual": 1},
+}
+
+def _clave(valor: Any) -> str:
+    """Nombre de campo seguro para Mongo a partir de un estado"""
+    return str(valor or "Sin estado").replace(".", "_").lstrip("$")
+
+def _sumar(documento: Dict[str, Any], campo: str, valor: float):
+    """Sumar sobre un campo que puede venir en notación con punto (equipos_por_estado.Activo)"""
+    if "." in campo:
+        grupo, subcampo = campo.split(".", 1)
+        documento.setdefault(grupo, {})
+        documento[grupo][subcampo] = documento[grupo].get(subcampo, 0) + valor
+    else:
+        documento[campo] = documento.get(campo, 0) + valor
+
+class StatsService:
+    """
+    Contadores de estadísticas en la colección 'estadisticas': un documento global
+    y uno por empresa ('empresa:<id>'), actualizados con $inc en cada escritura.
+    """
+    def __init__(self):
+        self.collection = db.estadisticas
+
+    def _aporte(self, coleccion: str, documento: Optional[Dict[str, Any]]) -> Dict[str, float]:
+        if not documento:
+            return {}
+        if coleccion == "empresas":
+            return {"total_empresas": 1}
+        if coleccion == "equipos":
+            return {"total_equipos": 1, f"equipos_por_estado.{_clave(documento.get('estado'))}": 1}
+        if coleccion == "bitacoras":
+            return {"total_bitacoras": 1, f"bitacoras_por_estado.{_clave(documento.get('estado'))}": 1}
+        if coleccion == "servicios" and documento.get("activo", True):
+            return {"total_servicios": 1, "costo_total_servicios": documento.get("costo_mensual") or 0}
+        return {}
+
+    def _acumular(self, incrementos: Dict[str, Dict[str, float]], coleccion: str,
+                  documento: Optional[Dict[str, Any]], signo: int):
+        aporte = self._aporte(coleccion, documento)
+        destinos = [GLOBAL_ID]
+        if coleccion != "empresas" and documento and documento.get("empresa_id"):
+            destinos.append(f"empresa:{documento['empresa_id']}")
+        for destino in destinos:
+            for campo, valor in aporte.items():
+                inc = incrementos.setdefault(destino, {})
+                inc[campo] = inc.get(campo, 0) + signo * valor
+
+    async def _aplicar(self, incrementos: Dict[str, Dict[str, float]], session=None):
+        operaciones = []
+        for destino, inc in incrementos.items():
+            inc = {campo: valor for campo, valor in inc.items() if valor}
+            if inc:
+                operaciones.append((destino, inc))
+        
+        if session is not None:
+            # Dentro de una transacción las operaciones de una sesión van en serie
+            for destino, inc in operaciones:
+                await self.collection.update_one({"_id": destino}, {"$inc": inc}, upsert=True, session=session)
+        elif operaciones:
+            await asyncio.gather(*[
+                self.collection.update_one({"_id": destino}, {"$inc": inc}, upsert=True)
+                for destino, inc in operaciones
+            ])
+
+    async def registrar(self, coleccion: str, antes: Optional[Dict[str, Any]] = None,
+                        despues: Optional[Dict[str, Any]] = None):
+        """
+        Aplicar a los contadores el cambio de un documento.
+        Alta: solo despues; baja: solo antes; modificación: ambos.
+        """
+        incrementos: Dict[str, Dict[str, float]] = {}
+        self._acumular(incrementos, coleccion, antes, -1)
+        self._acumular(incrementos, coleccion, despues, 1)
+        await self._aplicar(incrementos)
+
+    async def registrar_lote(self, coleccion: str, antes: Iterable[Dict[str, Any]] = (),
+                             despues: Iterable[Dict[str, Any]] = (), session=None):
+        """Como registrar, para muchos documentos: un solo $inc por documento de contadores"""
+        incrementos: Dict[str, Dict[str, float]] = {}
+        for documento in antes:
+            self._acumular(incrementos, coleccion, documento, -1)
+        for documento in despues:
+            self._acumular(incrementos, coleccion, documento, 1)
+        await self._aplicar(incrementos, session)
+
+    async def descartar_empresa(self, empresa_id: str):
+        """Eliminar los contadores de una empresa borrada"""
+        await self.collection.delete_one({"_id": f"empresa:{empresa_id}"})
+
+    async def obtener(self, empresa_id: Optional[str] = None) -> Dict[str, Any]:
+        """Leer los contadores (globales o de una empresa) con el formato de /api/estadisticas"""
+        documento = await self.collection.find_one({"_id": f"empresa:{empresa_id}" if empresa_id else GLOBAL_ID})
+        if documento is None and not empresa_id:
+            await self.reconstruir()
+            documento = await self.collection.find_one({"_id": GLOBAL_ID})
+        documento = documento or {}
+
+        equipos_por_estado = documento.get("equipos_por_estado", {})
+        bitacoras_por_estado = documento.get("bitacoras_por_estado", {})
+        return {
+            "total_empresas": 1 if empresa_id else documento.get("total_empresas", 0),
+            "total_equipos": documento.get("total_equipos", 0),
+            "equipos_activos": equipos_por_estado.get("Activo", 0),
+            "total_bitacoras": documento.get("total_bitacoras", 0),
+            "bitacoras_pendientes": bitacoras_por_estado.get("Pendiente", 0),
+            "total_servicios": documento.get("total_servicios", 0),
+            "costo_total_servicios": documento.get("costo_total_servicios", 0),
+            "equipos_por_estado": equipos_por_estado,
+            "bitacoras_por_estado": bitacoras_por_estado
+        }
+
+    async def reconstruir(self) -> int:
+        """
+        Recalcular todos los contadores desde las colecciones y reemplazar los existentes.
+        Devuelve el número de documentos de contadores escritos.
+        """
+        por_estado = [{"$group": {"_id": {"empresa_id": "$empresa_id", "estado": "$estado"}, "total": {"$sum": 1}}}]
+        total_empresas, equipos, bitacoras, servicios = await asyncio.gather(
+            db.empresas.count_documents({}),
+            db.equipos.aggregate(por_estado).to_list(None),
+            db.bitacoras.aggregate(por_estado).to_list(None),
+            db.servicios.aggregate([
+                # Sin campo activo cuenta como activo, igual que en _aporte
+                {"$match": {"activo": {"$ne": False}}},
+                {"$group": {"_id": "$empresa_id", "total": {"$sum": 1}, "costo": {"$sum": "$costo_mensual"}}}
+            ]).to_list(None)
+        )
+
+        documentos = {GLOBAL_ID: {"total_empresas": total_empresas}}
+
+        def sumar(empresa_id, campo, valor):
+            _sumar(documentos[GLOBAL_ID], campo, valor)
+            if empresa_id:
+                _sumar(documentos.setdefault(f"empresa:{empresa_id}", {}), campo, valor)
+
+        for grupo in equipos:
+            sumar(grupo["_id"].get("empresa_id"), "total_equipos", grupo["total"])
+            sumar(grupo["_id"].get("empresa_id"), f"equipos_por_estado.{_clave(grupo['_id'].get('estado'))}", grupo["total"])
+        for grupo in bitacoras:
+            sumar(grupo["_id"].get("empresa_id"), "total_bitacoras", grupo["total"])
+            sumar(grupo["_id"].get("empresa_id"), f"bitacoras_por_estado.{_clave(grupo['_id'].get('estado'))}", grupo["total"])
+        for grupo in servicios:
+            sumar(grupo["_id"], "total_servicios", grupo["total"])
+            sumar(grupo["_id"], "costo_total_servicios", grupo["costo"])
+
+        ahora = datetime.utcnow()
+        operaciones = [
+            ReplaceOne({"_id": doc_id}, {**valores, "reconstruido_en": ahora}, upsert=True)
+            for doc_id, valores in documentos.items()
+        ]
+        operaciones.append(DeleteMany({"_id": {"$nin": list(documentos.keys())}}))
+        await self.collection.bulk_write(operaciones, ordered=False)
+
+        return len(documentos)
+
+stats_service = StatsService()
@@ -0,0 +1,41 @@
+from typing import Iterable, Optional
+import asyncio
+
+from database import db
+
+class VersionService:
+    """
+    Contadores de versión por colección y por empresa en la colección 'versiones',
+    incrementados en cada escritura. Sirven para calcular ETags sin leer los documentos.
+
+    Documento por colección: {"_id": "equipos", "version": n, "epoca": m}
+    Documento por empresa:   {"_id": "equipos:<empresa_id>", "version": k}
+    'epoca' sube cuando una escritura no sabe a qué empresas afecta (p. ej. un PATCH
+    masivo por filtro) e invalida así las versiones de todas las empresas a la vez.
+    """
+    def __init__(self):
+        self.collection = db.versiones
+
+    async def incrementar(self, coleccion: str, empresa_ids: Optional[Iterable[str]] = ()):
+        """empresa_ids=None: alcance desconocido, se incrementa la época de la colección"""
+        inc = {"version": 1}
+        if empresa_ids is None:
+            inc["epoca"] = 1
+        operaciones = [self.collection.update_one({"_id": coleccion}, {"$inc": inc}, upsert=True)]
+        for empresa_id in set(empresa_ids or ()):
+            if empresa_id:
+                operaciones.append(
+                    self.collection.update_one({"_id": f"{coleccion}:{empresa_id}"}, {"$inc": {"version": 1}}, upsert=True)
+                )
+        await asyncio.gather(*operaciones)
+
+    async def obtener(self, coleccion: str, empresa_id: Optional[str] = None) -> str:
+        """Versión actual de la colección, o de la colección para una empresa"""
+        ids = [coleccion] + ([f"{coleccion}:{empresa_id}"] if empresa_id else [])
+        documentos = {doc["_id"]: doc async for doc in self.collection.find({"_id": {"$in": ids}})}
+        general = documentos.get(coleccion, {})
+        if empresa_id:
+            return f"{general.get('epoca', 0)}.{documentos.get(ids[1], {}).get('version', 0)}"
+        return str(general.get("version", 0))
+
+version_service = VersionService()
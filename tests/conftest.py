@@ -0,0 +1,8 @@
+import os
+import sys
+
+# database.py lee la conexión del entorno al importarse; Motor no conecta hasta la primera operación
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "itsm_test")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
@@ -0,0 +1,165 @@
+"""Colecciones de Mongo en memoria para las pruebas: cuentan las consultas que reciben"""
+from bson import ObjectId
+from typing import Any, Dict, List
+
+
+def _coincide(documento: Dict[str, Any], filtro: Dict[str, Any]) -> bool:
+    for campo, condicion in filtro.items():
+        if campo == "$and":
+            if not all(_coincide(documento, parte) for parte in condicion):
+                return False
+            continue
+        if campo == "$or":
+            if not any(_coincide(documento, parte) for parte in condicion):
+                return False
+            continue
+        valor = documento.get(campo)
+        if isinstance(condicion, dict) and any(clave.startswith("$") for clave in condicion):
+            for operador, operando in condicion.items():
+                if operador == "$in" and valor not in operando:
+                    return False
+                if operador == "$nin" and valor in operando:
+                    return False
+                if operador == "$gt" and not (valor is not None and valor > operando):
+                    return False
+                if operador == "$lt" and not (valor is not None and valor < operando):
+                    return False
+                if operador == "$ne" and valor == operando:
+                    return False
+        elif valor != condicion:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, documentos: List[Dict[str, Any]]):
+        self.documentos = documentos
+
+    def sort(self, campo, direccion=1):
+        orden = [(campo, direccion)] if isinstance(campo, str) else campo
+        # Ordenación estable: se aplica desde la última clave hacia la primera
+        for clave, sentido in reversed(orden):
+            self.documentos.sort(key=lambda documento: documento.get(clave), reverse=sentido == -1)
+        return self
+
+    def limit(self, cantidad):
+        if cantidad:
+            self.documentos = self.documentos[:cantidad]
+        return self
+
+    def batch_size(self, _):
+        return self
+
+    async def to_list(self, length=None):
+        documentos, self.documentos = self.documentos[:length], self.documentos[length:] if length else []
+        return documentos
+
+    def __aiter__(self):
+        return self._iterar()
+
+    async def _iterar(self):
+        for documento in self.documentos:
+            yield documento
+
+
+def _expresion(documento: Dict[str, Any], expresion):
+    """Expresiones de agregación mínimas: "$campo", {clave: "$campo"} o constantes"""
+    if isinstance(expresion, str) and expresion.startswith("$"):
+        return documento.get(expresion[1:])
+    if isinstance(expresion, dict):
+        return tuple(sorted((clave, _expresion(documento, valor)) for clave, valor in expresion.items()))
+    return expresion
+
+
+def _agrupar(documentos: List[Dict[str, Any]], grupo: Dict[str, Any]) -> List[Dict[str, Any]]:
+    resultados = {}
+    for documento in documentos:
+        clave = _expresion(documento, grupo["_id"])
+        resultado = resultados.setdefault(clave, {"_id": dict(clave) if isinstance(clave, tuple) else clave})
+        for campo, acumulador in grupo.items():
+            if campo != "_id":
+                resultado[campo] = resultado.get(campo, 0) + (_expresion(documento, acumulador["$sum"]) or 0)
+    return list(resultados.values())
+
+
+class FakeCollection:
+    def __init__(self, documentos=()):
+        self.documentos = [dict(documento) for documento in documentos]
+        for documento in self.documentos:
+            documento.setdefault("_id", ObjectId())
+        self.consultas = 0
+
+    def _buscar(self, filtro):
+        return [dict(documento) for documento in self.documentos if _coincide(documento, filtro or {})]
+
+    def find(self, filtro=None, projection=None):
+        self.consultas += 1
+        return FakeCursor(self._buscar(filtro))
+
+    async def find_one(self, filtro=None, projection=None):
+        self.consultas += 1
+        documentos = self._buscar(filtro)
+        return documentos[0] if documentos else None
+
+    async def count_documents(self, filtro):
+        self.consultas += 1
+        return len(self._buscar(filtro))
+
+    def aggregate(self, pipeline):
+        """Solo $match y $group"""
+        self.consultas += 1
+        documentos = self._buscar({})
+        for etapa in pipeline:
+            if "$match" in etapa:
+                documentos = [documento for documento in documentos if _coincide(documento, etapa["$match"])]
+            elif "$group" in etapa:
+                documentos = _agrupar(documentos, etapa["$group"])
+        return FakeCursor(documentos)
+
+    async def find_one_and_update(self, filtro, cambios, projection=None, session=None):
+        """Solo $set e $inc; devuelve el documento anterior"""
+        self.consultas += 1
+        for documento in self.documentos:
+            if _coincide(documento, filtro):
+                anterior = dict(documento)
+                documento.update(cambios.get("$set", {}))
+                for campo, valor in cambios.get("$inc", {}).items():
+                    documento[campo] = documento.get(campo, 0) + valor
+                return anterior
+        return None
+
+    async def update_many(self, filtro, cambios, session=None):
+        """Solo $set"""
+        self.consultas += 1
+        coincidentes = modificados = 0
+        for documento in self.documentos:
+            if _coincide(documento, filtro):
+                coincidentes += 1
+                if any(documento.get(campo) != valor for campo, valor in cambios["$set"].items()):
+                    modificados += 1
+                    documento.update(cambios["$set"])
+        return type("UpdateResult", (), {"matched_count": coincidentes, "modified_count": modificados})()
+
+    async def delete_many(self, filtro, session=None):
+        self.consultas += 1
+        borrados = self._buscar(filtro)
+        ids = {documento["_id"] for documento in borrados}
+        self.documentos = [documento for documento in self.documentos if documento["_id"] not in ids]
+        return type("DeleteResult", (), {"deleted_count": len(borrados)})()
+
+
+class FakeDB:
+    def __init__(self, **colecciones):
+        for nombre, documentos in colecciones.items():
+            setattr(self, nombre, FakeCollection(documentos))
+
+    def __getattr__(self, nombre):
+        coleccion = FakeCollection()
+        setattr(self, nombre, coleccion)
+        return coleccion
+
+    def __getitem__(self, nombre):
+        return getattr(self, nombre)
+
+    def consultas(self) -> int:
+        return sum(coleccion.consultas for coleccion in vars(self).values() if isinstance(coleccion, FakeCollection))
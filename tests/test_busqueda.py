@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+import search_service
+import server
+from search_service import EquiposSearchIndex
+from tests.fakes import FakeDB
+
+EMPRESA = "65f000000000000000000001"
+OTRA = "65f000000000000000000002"
+
+
+def _equipo(numero_serie, marca, empresa_id=EMPRESA):
+    return {"_id": ObjectId(), "empresa_id": empresa_id, "numero_serie": numero_serie, "marca": marca,
+            "nombre": f"PC {numero_serie}", "modelo": "Latitude", "estado": "Activo"}
+
+
+@pytest.fixture
+def indice(monkeypatch):
+    equipos = [_equipo("SN-A1", "Dell"), _equipo("SN-A2", "Dell"), _equipo("SN-B1", "HP")]
+    monkeypatch.setattr(server, "db", FakeDB(equipos=equipos))
+
+    # Índice ya construido y recién sincronizado: las búsquedas no van a la base de datos
+    indice = EquiposSearchIndex()
+    indice._registros, indice._por_id, indice._trigramas, indice._prefijos = indice._construir(equipos)
+    indice._marca, indice._sincronizado_en = datetime.utcnow(), time.monotonic()
+    monkeypatch.setattr(server, "equipos_search", indice)
+
+    async def nada(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(server.stats_service, "registrar_lote", nada)
+    monkeypatch.setattr(server.version_service, "incrementar", nada)
+    return indice
+
+
+def test_borrado_masivo_quita_equipos_del_indice(indice):
+    assert len(asyncio.run(indice.buscar("latitude"))) == 3
+
+    resultado = asyncio.run(server.eliminar_por_filtro("equipos", server.BulkDeleteRequest(filtro={"marca": "Dell"})))
+
+    assert resultado == {"coincidentes": 2, "eliminados": 2}
+    encontrados = asyncio.run(indice.buscar("latitude"))
+    assert [equipo_id for equipo_id, _ in encontrados] == [indice._registros[2][0]]
+    assert indice.stats()["borrados"] == 2
+
+
+def test_estadisticas_de_cache_incluyen_el_indice(indice):
+    metricas = asyncio.run(server.get_cache_metrics(current_user={}))
+    assert metricas["indice_equipos"]["equipos"] == 3
+
+
+def test_cambio_de_otra_empresa_conserva_la_cache(indice):
+    asyncio.run(indice.buscar("dell", empresa_id=EMPRESA))
+    asyncio.run(indice.buscar("dell"))
+
+    indice.indexar([_equipo("SN-C1", "Dell", OTRA)])
+
+    # La búsqueda de EMPRESA sigue en caché; la de todas las empresas incluye el equipo nuevo
+    aciertos = indice._resultados.hits
+    assert len(asyncio.run(indice.buscar("dell", empresa_id=EMPRESA))) == 2
+    assert indice._resultados.hits == aciertos + 1
+    assert len(asyncio.run(indice.buscar("dell"))) == 3
+    assert indice._resultados.hits == aciertos + 1
+
+
+def test_sincronizar_equipos_sin_cambios_no_invalida(indice):
+    asyncio.run(indice.buscar("dell"))
+    version = indice._version
+
+    indice.indexar(list(server.db.equipos.documentos))
+
+    assert indice._version == version
+    assert len(indice._resultados._data) == 1
+
+
+def test_puntuacion_fuera_del_event_loop(indice, monkeypatch):
+    hilos = []
+    original = EquiposSearchIndex._buscar
+
+    def buscar(*args):
+        hilos.append(threading.current_thread())
+        return original(*args)
+
+    monkeypatch.setattr(indice, "_buscar", buscar)
+    asyncio.run(indice.buscar("dell"))
+
+    assert hilos and hilos[0] is not threading.main_thread()
+
+
+def test_construccion_por_lotes(monkeypatch):
+    equipos = [_equipo(f"SN-{numero}", "Lenovo") for numero in range(5)]
+    monkeypatch.setattr(search_service, "db", FakeDB(equipos=equipos))
+    indice = EquiposSearchIndex()
+    indice.LOTE_CONSTRUCCION = 2
+    lotes = []
+    original = EquiposSearchIndex._construir
+
+    def construir(documentos, estructuras=None):
+        lotes.append(len(documentos))
+        return original(documentos, estructuras)
+
+    monkeypatch.setattr(indice, "_construir", construir)
+
+    encontrados = asyncio.run(indice.buscar("lenovo", limit=10))
+
+    assert lotes == [2, 2, 1]
+    assert sorted(equipo_id for equipo_id, _ in encontrados) == sorted(str(equipo["_id"]) for equipo in equipos)
@@ -0,0 +1,157 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import server
+from tests.fakes import FakeCollection, FakeDB
+
+EMPRESA = "65f000000000000000000001"
+
+
+class BorradoConcurrente(FakeCollection):
+    """Otro borrado elimina un documento del lote entre la lectura y el delete_many"""
+    async def delete_many(self, filtro, session=None):
+        if self.documentos:
+            self.documentos.pop(0)
+        return await super().delete_many(filtro, session)
+
+
+class TransaccionAbortada(Exception):
+    pass
+
+
+class FakeSession:
+    """Sesión cuya transacción falla al confirmarse si confirmar=False"""
+    def __init__(self, confirmar):
+        self.confirmar = confirmar
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, tipo, *args):
+        if tipo is None and not self.confirmar:
+            raise TransaccionAbortada("WriteConflict")
+        return False
+
+    def start_transaction(self):
+        return FakeSession(self.confirmar)
+
+
+class FakeClient:
+    def __init__(self, confirmar=True):
+        self.confirmar = confirmar
+
+    async def start_session(self):
+        return FakeSession(self.confirmar)
+
+
+@pytest.fixture
+def llamadas(monkeypatch):
+    registro = {"registrar_lote": [], "reconstruir": 0, "incrementar": [], "indice": [], "terminar": []}
+
+    async def registrar_lote(coleccion, antes=(), despues=(), session=None):
+        registro["registrar_lote"].append((coleccion, len(list(antes))))
+
+    async def reconstruir():
+        registro["reconstruir"] += 1
+
+    async def nada(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(server.stats_service, "registrar_lote", registrar_lote)
+    monkeypatch.setattr(server.stats_service, "reconstruir", reconstruir)
+    monkeypatch.setattr(server.stats_service, "descartar_empresa", nada)
+    async def incrementar(coleccion, empresa_ids=None):
+        registro["incrementar"].append(coleccion)
+
+    async def terminar(job_id, error=None, resultado=None):
+        registro["terminar"].append(error)
+
+    monkeypatch.setattr(server.version_service, "incrementar", incrementar)
+    for metodo in ("iniciar", "progreso"):
+        monkeypatch.setattr(server.job_service, metodo, nada)
+    monkeypatch.setattr(server.job_service, "terminar", terminar)
+    monkeypatch.setattr(server.equipos_search, "eliminar", registro["indice"].append)
+    return registro
+
+
+def _documentos(cantidad):
+    return [{"empresa_id": EMPRESA, "estado": "Activo"} for _ in range(cantidad)]
+
+
+def test_lotes_completos_se_descuentan(monkeypatch, llamadas):
+    db = FakeDB(equipos=_documentos(5), bitacoras=_documentos(3), servicios=[])
+    monkeypatch.setattr(server, "db", db)
+
+    asyncio.run(server.eliminar_dependientes_empresa(EMPRESA, "job"))
+
+    assert sorted(llamadas["registrar_lote"]) == [("bitacoras", 3), ("equipos", 5)]
+    assert llamadas["reconstruir"] == 0
+    assert db.equipos.documentos == []
+
+
+def test_lote_con_borrado_concurrente_no_se_descuenta_dos_veces(monkeypatch, llamadas):
+    db = FakeDB(bitacoras=[], servicios=[])
+    db.equipos = BorradoConcurrente(_documentos(5))
+    monkeypatch.setattr(server, "db", db)
+
+    asyncio.run(server.eliminar_dependientes_empresa(EMPRESA, "job"))
+
+    assert llamadas["registrar_lote"] == []
+    assert llamadas["reconstruir"] == 1
+    assert db.equipos.documentos == []
+
+
+def test_transaccion_abortada_no_publica_el_borrado(monkeypatch, llamadas):
+    db = FakeDB(equipos=_documentos(2), bitacoras=[], servicios=[])
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "client", FakeClient(confirmar=False))
+
+    asyncio.run(server.eliminar_dependientes_empresa(EMPRESA, "job", transaccion=True))
+
+    # Ni la versión ni el índice de búsqueda reflejan un lote que no se borró
+    assert llamadas["incrementar"] == []
+    assert llamadas["indice"] == []
+    assert llamadas["terminar"] == ["WriteConflict"]
+
+
+def test_transaccion_confirmada_publica_el_borrado(monkeypatch, llamadas):
+    db = FakeDB(equipos=_documentos(2), bitacoras=[], servicios=[])
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "client", FakeClient())
+
+    asyncio.run(server.eliminar_dependientes_empresa(EMPRESA, "job", transaccion=True))
+
+    assert llamadas["incrementar"] == ["equipos"]
+    assert len(llamadas["indice"]) == 1
+    assert llamadas["terminar"] == [None]
+
+
+def test_reanudar_trabajos_interrumpidos(monkeypatch):
+    antiguo = datetime.utcnow() - timedelta(hours=1)
+    trabajos = FakeDB(trabajos=[
+        {"tipo": "eliminacion_empresa", "estado": "en_curso", "empresa_id": EMPRESA, "transaccion": True, "actualizado_en": antiguo},
+        {"tipo": "eliminacion_empresa", "estado": "en_curso", "empresa_id": "otra", "actualizado_en": datetime.utcnow()},
+        {"tipo": "importacion_equipos", "estado": "pendiente", "actualizado_en": antiguo},
+        {"tipo": "importacion_equipos", "estado": "completado", "actualizado_en": antiguo},
+    ]).trabajos
+    monkeypatch.setattr(server.job_service, "collection", trabajos)
+    reanudados = []
+
+    async def eliminar_dependientes_empresa(empresa_id, job_id, transaccion=False):
+        reanudados.append((empresa_id, transaccion))
+
+    monkeypatch.setattr(server, "eliminar_dependientes_empresa", eliminar_dependientes_empresa)
+
+    async def arrancar_dos_veces():
+        # Un segundo proceso que arranca después no vuelve a tomar el mismo trabajo
+        await server.reanudar_trabajos()
+        await server.reanudar_trabajos()
+        await asyncio.gather(*server.trabajos_reanudados)
+
+    asyncio.run(arrancar_dos_veces())
+
+    assert reanudados == [(EMPRESA, True)]
+    assert [trabajo["estado"] for trabajo in trabajos.documentos] == ["en_curso", "en_curso", "error", "completado"]
+    assert trabajos.documentos[0]["reanudaciones"] == 1
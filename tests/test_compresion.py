@@ -0,0 +1,132 @@
+import gzip
+import zlib
+
+import pytest
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from compression import COMPRESSION_MIN_SIZE, CompressionMiddleware
+
+FILAS_CSV = [f"{numero},PC-{numero:04d},Mantenimiento preventivo,Completado\n".encode() for numero in range(200)]
+
+
+@pytest.fixture
+def bloques_enviados():
+    return []
+
+
+@pytest.fixture
+def cliente(bloques_enviados):
+    app = FastAPI()
+
+    @app.get("/json")
+    def json(tamano: int):
+        return Response(b'"' + b"x" * (tamano - 2) + b'"', media_type="application/json")
+
+    @app.get("/csv")
+    def csv():
+        def filas():
+            for numero in range(0, len(FILAS_CSV), 50):
+                yield b"".join(FILAS_CSV[numero:numero + 50])
+        return StreamingResponse(filas(), media_type="text/csv")
+
+    @app.get("/eventos")
+    def eventos():
+        return StreamingResponse(iter([b"data: 1\n\n", b"data: 2\n\n"]), media_type="text/event-stream")
+
+    @app.get("/no-modificado")
+    def no_modificado():
+        return Response(status_code=304, headers={"etag": '"v1"'})
+
+    @app.get("/vary")
+    def vary():
+        return Response(b"x" * 2048, media_type="application/json", headers={"vary": "Accept"})
+
+    aplicacion = CompressionMiddleware(app)
+
+    async def registrar(scope, receive, send):
+        # Bloques que salen del middleware, antes de que TestClient los junte
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.body":
+                bloques_enviados.append(mensaje.get("body", b""))
+            await send(mensaje)
+        await aplicacion(scope, receive, enviar)
+
+    return TestClient(registrar)
+
+
+def _crudo(respuesta) -> bytes:
+    return b"".join(respuesta.iter_raw())
+
+
+def test_cuerpo_grande_se_comprime(cliente):
+    with cliente.stream("GET", f"/json?tamano={COMPRESSION_MIN_SIZE * 4}", headers={"Accept-Encoding": "gzip"}) as respuesta:
+        crudo = _crudo(respuesta)
+
+    assert respuesta.headers["content-encoding"] == "gzip"
+    assert respuesta.headers["vary"] == "Accept-Encoding"
+    assert int(respuesta.headers["content-length"]) == len(crudo)
+    assert len(gzip.decompress(crudo)) == COMPRESSION_MIN_SIZE * 4
+
+
+def test_cuerpo_pequeno_no_se_comprime_pero_lleva_vary(cliente):
+    respuesta = cliente.get(f"/json?tamano={COMPRESSION_MIN_SIZE // 2}", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in respuesta.headers
+    assert respuesta.headers["vary"] == "Accept-Encoding"
+    assert len(respuesta.content) == COMPRESSION_MIN_SIZE // 2
+
+
+def test_csv_en_streaming_se_comprime_por_bloque(cliente, bloques_enviados):
+    with cliente.stream("GET", "/csv", headers={"Accept-Encoding": "gzip"}) as respuesta:
+        crudo = _crudo(respuesta)
+
+    assert respuesta.headers["content-encoding"] == "gzip"
+    assert "content-length" not in respuesta.headers
+    # Cada bloque se vacía por separado: los primeros ya se pueden descomprimir sin el resto
+    datos = [bloque for bloque in bloques_enviados if bloque]
+    assert len(datos) >= 4
+    parcial = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(datos[0])
+    assert parcial == b"".join(FILAS_CSV[:50])
+    assert gzip.decompress(crudo) == b"".join(FILAS_CSV)
+
+
+def test_eventos_sse_sin_comprimir(cliente):
+    with cliente.stream("GET", "/eventos", headers={"Accept-Encoding": "gzip, br"}) as respuesta:
+        crudo = _crudo(respuesta)
+
+    assert "content-encoding" not in respuesta.headers
+    assert "vary" not in respuesta.headers
+    assert crudo == b"data: 1\n\ndata: 2\n\n"
+
+
+def test_304_sin_cambios(cliente):
+    respuesta = cliente.get("/no-modificado", headers={"Accept-Encoding": "gzip"})
+
+    assert respuesta.status_code == 304
+    assert "content-encoding" not in respuesta.headers
+    assert respuesta.headers["etag"] == '"v1"'
+    assert respuesta.content == b""
+
+
+def test_vary_existente_se_combina(cliente):
+    with cliente.stream("GET", "/vary", headers={"Accept-Encoding": "gzip"}) as respuesta:
+        _crudo(respuesta)
+
+    assert respuesta.headers.get_list("vary") == ["Accept, Accept-Encoding"]
+
+
+@pytest.mark.parametrize("accept_encoding, esperada", [
+    ("gzip;q=0", None),
+    ("br;q=0, gzip", "gzip"),
+    ("*;q=0", None),
+    ("identity", None),
+])
+def test_accept_encoding_con_q_cero(cliente, accept_encoding, esperada):
+    with cliente.stream("GET", f"/json?tamano={COMPRESSION_MIN_SIZE * 2}", headers={"Accept-Encoding": accept_encoding}) as respuesta:
+        crudo = _crudo(respuesta)
+
+    assert respuesta.headers.get("content-encoding") == esperada
+    if esperada is None:
+        assert len(crudo) == COMPRESSION_MIN_SIZE * 2
@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+import server
+from tests.fakes import FakeDB
+
+
+@pytest.fixture(autouse=True)
+def cache_limpia():
+    server.config_cache.clear()
+    yield
+    server.config_cache.clear()
+
+
+def test_modificar_la_configuracion_devuelta_no_altera_la_cache(monkeypatch):
+    db = FakeDB(configuracion=[{"nombre_sistema": "ITSM", "campos_equipos": [{"nombre": "activo_fijo"}], "colores": {"primario": "#000"}}])
+    monkeypatch.setattr(server, "db", db)
+
+    config = asyncio.run(server.get_config())
+    config["campos_equipos"].append({"nombre": "intruso"})
+    config["campos_equipos"][0]["nombre"] = "cambiado"
+    config["colores"]["primario"] = "#fff"
+
+    otra = asyncio.run(server.get_config())
+    assert otra["campos_equipos"] == [{"nombre": "activo_fijo"}]
+    assert otra["colores"] == {"primario": "#000"}
+    # La segunda lectura sale de la caché
+    assert db.configuracion.consultas == 1
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+import stats_service as modulo
+from stats_service import GLOBAL_ID, StatsService
+from tests.fakes import FakeCollection, FakeDB
+
+EMPRESA = "65f000000000000000000001"
+
+SERVICIOS = [
+    {"empresa_id": EMPRESA, "activo": True, "costo_mensual": 100},
+    {"empresa_id": EMPRESA, "activo": False, "costo_mensual": 40},
+    # Documento anterior al campo activo
+    {"empresa_id": EMPRESA, "costo_mensual": 25},
+]
+
+
+class Contadores(FakeCollection):
+    async def bulk_write(self, operaciones, ordered=True):
+        self.escritos = {operacion._filter["_id"]: operacion._doc for operacion in operaciones if hasattr(operacion, "_doc")}
+
+
+@pytest.fixture
+def servicio(monkeypatch):
+    db = FakeDB(empresas=[{"_id": EMPRESA}], equipos=[], bitacoras=[], servicios=SERVICIOS)
+    monkeypatch.setattr(modulo, "db", db)
+    servicio = StatsService()
+    servicio.collection = Contadores()
+    return servicio
+
+
+def test_reconstruir_coincide_con_los_contadores_incrementales(servicio):
+    incrementos = {}
+    for documento in SERVICIOS:
+        servicio._acumular(incrementos, "servicios", documento, 1)
+
+    asyncio.run(servicio.reconstruir())
+
+    for destino in (GLOBAL_ID, f"empresa:{EMPRESA}"):
+        reconstruido = servicio.collection.escritos[destino]
+        assert reconstruido["total_servicios"] == incrementos[destino]["total_servicios"] == 2
+        assert reconstruido["costo_total_servicios"] == incrementos[destino]["costo_total_servicios"] == 125
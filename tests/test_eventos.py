@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+
+import events_service
+from events_service import EventService
+from stats_service import GLOBAL_ID
+
+EMPRESA = "65f000000000000000000001"
+OTRA = "65f000000000000000000002"
+
+
+@pytest.fixture
+def servicio(monkeypatch):
+    servicio = EventService()
+    servicio.marcadas = []
+    # Las estadísticas se publican tras un intervalo leyendo Mongo: aquí solo se registra qué alcances se marcan
+    monkeypatch.setattr(servicio, "_marcar_estadisticas", lambda empresas: servicio.marcadas.append(set(empresas)))
+    return servicio
+
+
+def _eventos(suscripcion):
+    eventos = []
+    while not suscripcion.cola.empty():
+        eventos.append(suscripcion.cola.get_nowait())
+    return eventos
+
+
+def _cambio(coleccion, operacion, documento_id, **datos):
+    return {"ns": {"db": "itsm", "coll": coleccion}, "operationType": operacion, "documentKey": {"_id": documento_id}, **datos}
+
+
+def test_procesar_insercion_y_modificacion(servicio):
+    propia, ajena = servicio.suscribir(EMPRESA), servicio.suscribir(OTRA)
+
+    servicio._procesar(_cambio("equipos", "insert", "e1", fullDocument={"_id": "e1", "empresa_id": EMPRESA, "estado": "Activo"}))
+    servicio._procesar(_cambio(
+        "equipos", "update", "e1",
+        fullDocument={"_id": "e1", "empresa_id": EMPRESA, "estado": "Inactivo"},
+        updateDescription={"updatedFields": {"estado": "Inactivo"}, "removedFields": ["hostname"]}
+    ))
+
+    assert _eventos(propia) == [
+        {"tipo": "equipos", "operacion": "insert", "id": "e1", "empresa_id": EMPRESA,
+         "documento": {"_id": "e1", "empresa_id": EMPRESA, "estado": "Activo"}},
+        {"tipo": "equipos", "operacion": "update", "id": "e1", "empresa_id": EMPRESA,
+         "cambios": {"estado": "Inactivo"}, "eliminados": ["hostname"]},
+    ]
+    assert _eventos(ajena) == []
+
+
+def test_procesar_borrado_llega_a_todas_las_empresas(servicio):
+    propia, ajena = servicio.suscribir(EMPRESA), servicio.suscribir(OTRA)
+
+    servicio._procesar(_cambio("bitacoras", "delete", "b1"))
+
+    evento = {"tipo": "bitacoras", "operacion": "delete", "id": "b1", "empresa_id": None}
+    assert _eventos(propia) == [evento]
+    assert _eventos(ajena) == [evento]
+
+
+def test_procesar_empresa_usa_su_id_y_filtra_tipos(servicio):
+    solo_equipos = servicio.suscribir(EMPRESA, tipos=["equipos"])
+    empresas = servicio.suscribir(EMPRESA, tipos=["empresas"])
+
+    servicio._procesar(_cambio("empresas", "replace", EMPRESA, fullDocument={"_id": EMPRESA, "nombre": "ACME"}))
+
+    assert _eventos(solo_equipos) == []
+    assert [evento["empresa_id"] for evento in _eventos(empresas)] == [EMPRESA]
+
+
+def test_procesar_estadisticas_marca_el_alcance(servicio):
+    suscripcion = servicio.suscribir()
+
+    servicio._procesar(_cambio("estadisticas", "update", GLOBAL_ID))
+    servicio._procesar(_cambio("estadisticas", "update", f"empresa:{EMPRESA}"))
+
+    assert servicio.marcadas == [{None}, {EMPRESA}]
+    assert _eventos(suscripcion) == []
+
+
+def test_procesar_drop_pide_resync(servicio):
+    suscripcion = servicio.suscribir(EMPRESA)
+
+    servicio._procesar(_cambio("equipos", "drop", None))
+
+    assert _eventos(suscripcion) == [{"tipo": "resync", "empresa_id": None, "motivo": "drop"}]
+
+
+def test_comparar_versiones_por_empresa(servicio):
+    propia, ajena = servicio.suscribir(EMPRESA), servicio.suscribir(OTRA)
+    anteriores = {
+        "equipos": {"_id": "equipos", "version": 3, "epoca": 1},
+        f"equipos:{EMPRESA}": {"version": 2},
+        f"equipos:{OTRA}": {"version": 1},
+        "servicios": {"_id": "servicios", "version": 5, "epoca": 1},
+    }
+    actuales = {
+        **anteriores,
+        "equipos": {"_id": "equipos", "version": 4, "epoca": 1},
+        f"equipos:{EMPRESA}": {"version": 3},
+    }
+
+    servicio._comparar_versiones(anteriores, actuales)
+
+    assert _eventos(propia) == [{"tipo": "equipos", "operacion": "cambio", "empresa_id": EMPRESA, "version": 4}]
+    assert _eventos(ajena) == []
+    assert servicio.marcadas == [{None, EMPRESA}]
+
+
+def test_comparar_versiones_cambio_de_epoca_avisa_a_todos(servicio):
+    propia, ajena = servicio.suscribir(EMPRESA), servicio.suscribir(OTRA)
+    anteriores = {"bitacoras": {"_id": "bitacoras", "version": 7, "epoca": 2}}
+    actuales = {"bitacoras": {"_id": "bitacoras", "version": 8, "epoca": 3}}
+
+    servicio._comparar_versiones(anteriores, actuales)
+
+    evento = {"tipo": "bitacoras", "operacion": "cambio", "empresa_id": None, "version": 8}
+    assert _eventos(propia) == [evento]
+    assert _eventos(ajena) == [evento]
+    assert servicio.marcadas == [{None, EMPRESA, OTRA}]
+
+
+def test_comparar_versiones_sin_cambios(servicio):
+    suscripcion = servicio.suscribir()
+    versiones = {"equipos": {"_id": "equipos", "version": 3, "epoca": 1}}
+
+    servicio._comparar_versiones(versiones, dict(versiones))
+
+    assert _eventos(suscripcion) == []
+    assert servicio.marcadas == []
+
+
+def test_cola_llena_se_sustituye_por_resync(servicio, monkeypatch):
+    monkeypatch.setattr(events_service, "SSE_QUEUE_SIZE", 3)
+    lenta, rapida = servicio.suscribir(EMPRESA), servicio.suscribir(EMPRESA)
+
+    for numero in range(4):
+        servicio._procesar(_cambio("equipos", "delete", f"e{numero}"))
+        if numero < 3:
+            _eventos(rapida)
+
+    assert _eventos(lenta) == [{"tipo": "resync", "empresa_id": None, "motivo": "cola_llena"}]
+    # Tras el resync la cola vuelve a aceptar eventos
+    servicio._procesar(_cambio("equipos", "delete", "e4"))
+    assert [evento["id"] for evento in _eventos(lenta)] == ["e4"]
+    assert [evento["id"] for evento in _eventos(rapida)] == ["e3", "e4"]
+
+
+def test_marcar_estadisticas_agrupa_y_publica(monkeypatch):
+    monkeypatch.setattr(events_service, "SSE_STATS_INTERVAL", 0)
+    lecturas = []
+
+    async def obtener(empresa_id=None):
+        lecturas.append(empresa_id)
+        return {"equipos": 1}
+
+    monkeypatch.setattr(events_service.stats_service, "obtener", obtener)
+    servicio = EventService()
+
+    async def ejecutar():
+        propia = servicio.suscribir(EMPRESA)
+        servicio.suscribir(OTRA, tipos=["equipos"])
+        servicio._marcar_estadisticas([EMPRESA, OTRA])
+        servicio._marcar_estadisticas([EMPRESA])
+        await servicio._tarea_estadisticas
+        return _eventos(propia)
+
+    eventos = asyncio.run(ejecutar())
+
+    # OTRA no tiene suscriptores de estadísticas: no se lee
+    assert lecturas == [EMPRESA]
+    assert eventos == [{"tipo": "estadisticas", "empresa_id": EMPRESA, "datos": {"equipos": 1}}]
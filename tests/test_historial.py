@@ -0,0 +1,43 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import server
+from tests.fakes import FakeDB
+
+
+def _db_con_bitacoras(cantidad: int) -> tuple:
+    equipo_id = ObjectId()
+    tecnicos = [ObjectId() for _ in range(5)]
+    bitacoras = [
+        {
+            "equipo_id": str(equipo_id),
+            "tecnico_id": str(tecnicos[indice % len(tecnicos)]),
+            "fecha": datetime(2024, 1, 1) + timedelta(days=indice),
+            "tipo": "Mantenimiento preventivo",
+            "descripcion": f"Revisión {indice}",
+            "estado": "Completado",
+        }
+        for indice in range(cantidad)
+    ]
+    db = FakeDB(
+        equipos=[{"_id": equipo_id, "nombre": "PC-01"}],
+        usuarios=[{"_id": tecnico, "nombre": f"Técnico {numero}"} for numero, tecnico in enumerate(tecnicos)],
+        bitacoras=bitacoras,
+    )
+    return db, str(equipo_id)
+
+
+@pytest.mark.parametrize("cantidad", [1, 10, 500])
+def test_historial_consultas_constantes(monkeypatch, cantidad):
+    db, equipo_id = _db_con_bitacoras(cantidad)
+    monkeypatch.setattr(server, "db", db)
+
+    resultado = asyncio.run(server.get_equipo_historial(equipo_id, current_user={}))
+
+    assert resultado["total_revisiones"] == cantidad
+    assert all(item["tecnico"].startswith("Técnico") for item in resultado["historial"])
+    # equipo + bitácoras + técnicos, sin importar cuántas bitácoras haya
+    assert db.consultas() == 3
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+import import_service as modulo
+import server
+from import_service import ImportService
+from tests.fakes import FakeCollection, _coincide
+
+E1 = "65f000000000000000000001"
+E2 = "65f000000000000000000002"
+
+
+class FakeEquipos(FakeCollection):
+    """Aplica UpdateOne con upsert, $set (rutas con punto) y $setOnInsert"""
+    async def bulk_write(self, operaciones, ordered=True):
+        for operacion in operaciones:
+            filtro, update = operacion._filter, operacion._doc
+            existente = next((d for d in self.documentos if _coincide(d, filtro)), None)
+            if existente is None:
+                existente = {**filtro, **update.get("$setOnInsert", {})}
+                existente.setdefault("_id", len(self.documentos) + 1)
+                self.documentos.append(existente)
+            for ruta, valor in update.get("$set", {}).items():
+                destino = existente
+                *padres, campo = ruta.split(".")
+                for padre in padres:
+                    destino = destino.setdefault(padre, {})
+                destino[campo] = valor
+
+
+@pytest.fixture
+def servicio(monkeypatch):
+    async def nada(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(modulo.stats_service, "registrar_lote", nada)
+    monkeypatch.setattr(modulo.version_service, "incrementar", nada)
+    servicio = ImportService()
+    servicio.collection = FakeEquipos([
+        {
+            "empresa_id": E1, "numero_serie": "SN1", "nombre": "PC contabilidad", "tipo": "PC",
+            "marca": "Dell", "modelo": "Optiplex", "ubicacion": "Piso 1", "estado": "En reparación",
+            "campos_personalizados": {"activo_fijo": "AF-9"}, "campos_dinamicos": {"ram": "16GB"},
+        },
+        {
+            "empresa_id": E2, "numero_serie": "SN1", "nombre": "Otro cliente", "tipo": "PC",
+            "marca": "HP", "modelo": "ProDesk", "ubicacion": "Bodega", "estado": "Activo",
+        },
+    ])
+    return servicio
+
+
+def _fila(**valores):
+    return {"empresa_id": E1, "numero_serie": "SN1", "nombre": "PC contabilidad", "tipo": "PC",
+            "marca": "Dell", "modelo": "Optiplex", "ubicacion": "Piso 2", **valores}
+
+
+def _upsert(servicio, filas):
+    validos, errores = server.validar_filas_equipo(filas)
+    assert errores == {}
+    return asyncio.run(servicio._upsert(validos))
+
+
+def _equipo(servicio, empresa_id, numero_serie):
+    return next(d for d in servicio.collection.documentos
+                if d["empresa_id"] == empresa_id and d["numero_serie"] == numero_serie)
+
+
+def test_upsert_conserva_campos_sin_columna(servicio):
+    conteo, errores = _upsert(servicio, [_fila(proveedor="Acme")])
+
+    equipo = _equipo(servicio, E1, "SN1")
+    assert conteo == {"insertados": 0, "actualizados": 1}
+    assert equipo["ubicacion"] == "Piso 2"
+    assert equipo["proveedor"] == "Acme"
+    # Sin columna estado ni columnas extra: no se aplican los valores por defecto del modelo
+    assert equipo["estado"] == "En reparación"
+    assert equipo["campos_personalizados"] == {"activo_fijo": "AF-9"}
+    assert equipo["campos_dinamicos"] == {"ram": "16GB"}
+
+
+def test_upsert_agrega_columnas_extra_sin_borrar_las_existentes(servicio):
+    _upsert(servicio, [_fila(**{"centro_costo": "CC-1", "Fecha adq.": "2020"})])
+
+    assert _equipo(servicio, E1, "SN1")["campos_personalizados"] == {
+        "activo_fijo": "AF-9", "centro_costo": "CC-1", "Fecha adq_": "2020"
+    }
+
+
+def test_upsert_no_toca_otra_empresa_con_el_mismo_numero_serie(servicio):
+    _upsert(servicio, [_fila(empresa_id=E2, nombre="Reemplazo", ubicacion="Piso 9")])
+
+    equipo = _equipo(servicio, E2, "SN1")
+    assert equipo["nombre"] == "Reemplazo"
+    assert _equipo(servicio, E1, "SN1")["ubicacion"] == "Piso 1"
+
+
+def test_upsert_alta_aplica_valores_por_defecto(servicio):
+    conteo, _ = _upsert(servicio, [_fila(numero_serie="SN2", nota_extra="x")])
+
+    equipo = _equipo(servicio, E1, "SN2")
+    assert conteo == {"insertados": 1, "actualizados": 0}
+    assert equipo["estado"] == "Activo"
+    assert equipo["campos_personalizados"] == {"nota_extra": "x"}
+    assert equipo["campos_dinamicos"] == {}
+    assert "creado_en" in equipo
@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+from pymongo import TEXT
+
+import database
+
+
+class FakeIndexCollection:
+    def __init__(self, existentes):
+        self.existentes = existentes
+        self.creados = []
+
+    async def index_information(self):
+        return self.existentes
+
+    async def create_indexes(self, modelos):
+        nombres = [modelo.document["name"] for modelo in modelos]
+        self.creados.extend(nombres)
+        return nombres
+
+
+class FakeIndexDB(dict):
+    def __missing__(self, coleccion):
+        self[coleccion] = FakeIndexCollection({"_id_": {"key": [("_id", 1)]}})
+        return self[coleccion]
+
+
+def _como_en_mongo(modelo):
+    """index_information() de un índice ya creado a partir de su IndexModel"""
+    documento = dict(modelo.document)
+    key = list(documento.pop("key").items())
+    if any(orden == TEXT for _, orden in key):
+        documento["weights"] = {campo: documento.get("weights", {}).get(campo, 1) for campo, orden in key if orden == TEXT}
+        key = [("_fts", "text"), ("_ftsx", 1)]
+    return {**documento, "key": key, "v": 2}
+
+
+def _sincronizar(monkeypatch, existentes_por_coleccion):
+    fake = FakeIndexDB({
+        coleccion: FakeIndexCollection(existentes) for coleccion, existentes in existentes_por_coleccion.items()
+    })
+    monkeypatch.setattr(database, "db", fake)
+    return asyncio.run(database.sync_indexes()), fake
+
+
+def test_crea_los_indices_faltantes(monkeypatch):
+    drift, fake = _sincronizar(monkeypatch, {})
+
+    for coleccion, modelos in database.INDEXES.items():
+        assert fake[coleccion].creados == [modelo.document["name"] for modelo in modelos]
+        assert drift[coleccion]["distintos"] == []
+
+
+def test_sin_drift_cuando_coinciden(monkeypatch):
+    existentes = {
+        coleccion: {"_id_": {"key": [("_id", 1)]}, **{m.document["name"]: _como_en_mongo(m) for m in modelos}}
+        for coleccion, modelos in database.INDEXES.items()
+    }
+    drift, fake = _sincronizar(monkeypatch, existentes)
+
+    for coleccion in database.INDEXES:
+        assert drift[coleccion] == {"creados": [], "distintos": [], "no_declarados": []}
+
+
+def test_reporta_distintos_y_no_declarados_sin_borrarlos(monkeypatch):
+    modelo = database.INDEXES["equipos"][0]
+    existentes = {
+        coleccion: {m.document["name"]: _como_en_mongo(m) for m in modelos}
+        for coleccion, modelos in database.INDEXES.items()
+    }
+    existentes["equipos"][modelo.document["name"]] = {"key": [("empresa_id", 1), ("_id", 1)], "unique": True}
+    existentes["equipos"]["viejo_1"] = {"key": [("viejo", 1)]}
+
+    drift, fake = _sincronizar(monkeypatch, existentes)
+
+    assert drift["equipos"]["distintos"] == [modelo.document["name"]]
+    assert drift["equipos"]["no_declarados"] == ["viejo_1"]
+    assert "viejo_1" in fake["equipos"].existentes
+
+
+# Forma de las consultas principales: (colección, campos de igualdad, orden)
+CONSULTAS = [
+    ("equipos", ["empresa_id"], [("_id", 1)]),
+    ("bitacoras", ["empresa_id"], [("fecha", -1), ("_id", -1)]),
+    ("bitacoras", ["equipo_id"], [("fecha", -1), ("_id", -1)]),
+    ("bitacoras", [], [("fecha", -1), ("_id", -1)]),
+    ("servicios", ["empresa_id"], [("_id", 1)]),
+    ("equipos", ["empresa_id", "numero_serie"], []),
+]
+
+
+@pytest.mark.parametrize("coleccion,igualdad,orden", CONSULTAS)
+def test_consultas_principales_tienen_indice(coleccion, igualdad, orden):
+    """Un índice cubre igualdad + orden si empieza por los campos de igualdad seguidos del orden"""
+    esperado = [(campo, 1) for campo in igualdad] + orden
+    claves = [list(modelo.document["key"].items()) for modelo in database.INDEXES[coleccion]]
+
+    def cubre(clave):
+        prefijo = clave[:len(esperado)]
+        return len(prefijo) == len(esperado) and all(
+            campo == campo_esperado and (campo_esperado in igualdad or orden_indice == orden_esperado)
+            for (campo, orden_indice), (campo_esperado, orden_esperado) in zip(prefijo, esperado)
+        )
+
+    assert any(cubre(clave) for clave in claves)
+
+
+def _etapas(plan):
+    """Recorrer el plan ganador de explain() (motor clásico y SBE)"""
+    if not isinstance(plan, dict):
+        return
+    yield plan
+    for clave in ("inputStage", "queryPlan", "outerStage", "innerStage"):
+        yield from _etapas(plan.get(clave))
+    for hijo in plan.get("inputStages", []):
+        yield from _etapas(hijo)
+
+
+@pytest.fixture(scope="module")
+def mongo():
+    import os
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    cliente = MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=500)
+    try:
+        cliente.admin.command("ping")
+    except PyMongoError:
+        pytest.skip("MongoDB no disponible en MONGO_URL")
+
+    base = cliente[f"{os.environ['DB_NAME']}_explain"]
+    for coleccion, modelos in database.INDEXES.items():
+        base[coleccion].create_indexes(modelos)
+    # Algunos documentos para que el planificador compare planes reales
+    base.equipos.insert_many([{"empresa_id": f"e{n % 10}", "numero_serie": f"SN{n}"} for n in range(200)])
+    base.bitacoras.insert_many([{"empresa_id": f"e{n % 10}", "equipo_id": f"q{n % 50}", "fecha": n} for n in range(200)])
+    base.servicios.insert_many([{"empresa_id": f"e{n % 10}"} for n in range(50)])
+    yield base
+    cliente.drop_database(base.name)
+    cliente.close()
+
+
+@pytest.mark.parametrize("coleccion,igualdad,orden", CONSULTAS)
+def test_explain_usa_indice(mongo, coleccion, igualdad, orden):
+    filtro = {campo: ("e1" if campo == "empresa_id" else "q1" if campo == "equipo_id" else "SN1") for campo in igualdad}
+    cursor = mongo[coleccion].find(filtro)
+    if orden:
+        cursor = cursor.sort(orden)
+
+    plan = cursor.explain()["queryPlanner"]["winningPlan"]
+    etapas = [etapa.get("stage") for etapa in _etapas(plan)]
+
+    assert "IXSCAN" in etapas
+    assert "COLLSCAN" not in etapas
+    # El orden lo da el índice, sin ordenar en memoria
+    assert "SORT" not in etapas
@@ -0,0 +1,46 @@
+import base64
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pdf_service import PDFService
+
+CONTENIDO = b"\x89PNG\r\n\x1a\n" + os.urandom(2048)
+LOGO_URL = "data:image/png;base64," + base64.b64encode(CONTENIDO).decode()
+
+
+@pytest.fixture
+def servicios(tmp_path):
+    """Varias instancias con el mismo directorio: simulan procesos distintos del servidor"""
+    instancias = [PDFService() for _ in range(4)]
+    for servicio in instancias:
+        servicio.logo_dir = str(tmp_path / "itsm_logos")
+    return instancias
+
+
+def test_reportes_concurrentes_comparten_un_archivo(servicios):
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        rutas = list(pool.map(lambda numero: servicios[numero % len(servicios)].get_logo_path(LOGO_URL), range(200)))
+
+    assert len(set(rutas)) == 1
+    with open(rutas[0], "rb") as f:
+        assert f.read() == CONTENIDO
+    # Ni temporales a medio escribir ni copias por reporte
+    assert os.listdir(servicios[0].logo_dir) == [os.path.basename(rutas[0])]
+
+
+def test_logo_borrado_por_limpieza_se_vuelve_a_escribir(servicios):
+    servicio = servicios[0]
+    ruta = servicio.get_logo_path(LOGO_URL)
+    os.remove(ruta)
+    os.rmdir(servicio.logo_dir)
+
+    assert servicio.get_logo_path(LOGO_URL) == ruta
+    with open(ruta, "rb") as f:
+        assert f.read() == CONTENIDO
+
+
+def test_sin_logo():
+    assert PDFService().get_logo_path(None) is None
+    assert PDFService().get_logo_path("https://example.com/logo.png") is None
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+import server
+from tests.fakes import FakeCollection, FakeDB
+
+EMPRESA = "65f000000000000000000001"
+OTRA = "65f000000000000000000002"
+
+
+class EdicionConcurrente(FakeCollection):
+    """Un PUT cambia el estado del primer documento entre la lectura del lote y la escritura"""
+    editado = False
+
+    def _editar(self):
+        if not self.editado:
+            self.editado = True
+            self.documentos[0]["estado"] = "En reparación"
+
+    async def update_many(self, filtro, cambios, session=None):
+        self._editar()
+        return await super().update_many(filtro, cambios, session)
+
+    async def delete_many(self, filtro, session=None):
+        self._editar()
+        return await super().delete_many(filtro, session)
+
+
+@pytest.fixture
+def deltas(monkeypatch):
+    """Transiciones de contadores registradas: (antes, despues) por documento"""
+    registro = []
+
+    async def registrar_lote(coleccion, antes=(), despues=(), session=None):
+        antes, despues = list(antes), list(despues)
+        registro.extend(zip(antes, despues or [None] * len(antes)))
+
+    async def nada(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(server.stats_service, "registrar_lote", registrar_lote)
+    monkeypatch.setattr(server.version_service, "incrementar", nada)
+    monkeypatch.setattr(server.equipos_search, "eliminar", lambda ids: None)
+    monkeypatch.setattr(server, "BULK_CHUNK_SIZE", 2)
+    return registro
+
+
+def _equipos(cantidad, empresa_id=EMPRESA):
+    return [{"empresa_id": empresa_id, "estado": "Activo"} for _ in range(cantidad)]
+
+
+def test_actualizar_en_lotes(monkeypatch, deltas):
+    db = FakeDB(equipos=_equipos(5) + _equipos(2, OTRA))
+    monkeypatch.setattr(server, "db", db)
+
+    request = server.BulkUpdateRequest(filtro={"empresa_id": EMPRESA}, cambios={"estado": "Inactivo"})
+    resultado = asyncio.run(server.actualizar_por_filtro("equipos", request))
+
+    assert resultado == {"coincidentes": 5, "modificados": 5}
+    assert deltas == [({"empresa_id": EMPRESA, "estado": "Activo"}, {"empresa_id": EMPRESA, "estado": "Inactivo"})] * 5
+    assert [d["estado"] for d in db.equipos.documentos] == ["Inactivo"] * 5 + ["Activo"] * 2
+
+
+def test_operaciones_en_orden_por_lote(monkeypatch, deltas):
+    db = FakeDB(equipos=_equipos(3))
+    monkeypatch.setattr(server, "db", db)
+
+    request = server.BulkUpdateRequest(operaciones=[
+        {"filtro": {"estado": "Activo"}, "cambios": {"estado": "Inactivo"}},
+        {"filtro": {"estado": "Inactivo"}, "cambios": {"estado": "Baja"}},
+    ])
+    resultado = asyncio.run(server.actualizar_por_filtro("equipos", request))
+
+    assert resultado == {"coincidentes": 6, "modificados": 6}
+    assert [d["estado"] for d in db.equipos.documentos] == ["Baja"] * 3
+    # Cada documento pasa Activo -> Inactivo -> Baja: el neto de contadores es Activo -> Baja
+    assert len(deltas) == 6
+
+
+def test_actualizacion_concurrente_no_se_cuenta_dos_veces(monkeypatch, deltas):
+    db = FakeDB()
+    db.equipos = EdicionConcurrente(_equipos(2))
+    monkeypatch.setattr(server, "db", db)
+
+    request = server.BulkUpdateRequest(filtro={"empresa_id": EMPRESA}, cambios={"estado": "Inactivo"})
+    resultado = asyncio.run(server.actualizar_por_filtro("equipos", request))
+
+    # El documento editado por el PUT conserva su estado y solo su PUT lo cuenta
+    assert resultado == {"coincidentes": 1, "modificados": 1}
+    assert [d["estado"] for d in db.equipos.documentos] == ["En reparación", "Inactivo"]
+    assert deltas == [({"empresa_id": EMPRESA, "estado": "Activo"}, {"empresa_id": EMPRESA, "estado": "Inactivo"})]
+
+
+def test_eliminar_en_lotes(monkeypatch, deltas):
+    db = FakeDB(equipos=_equipos(5) + _equipos(1, OTRA))
+    monkeypatch.setattr(server, "db", db)
+
+    resultado = asyncio.run(server.eliminar_por_filtro("equipos", server.BulkDeleteRequest(filtro={"empresa_id": EMPRESA})))
+
+    assert resultado == {"coincidentes": 5, "eliminados": 5}
+    assert len(deltas) == 5
+    assert [d["empresa_id"] for d in db.equipos.documentos] == [OTRA]
+
+
+def test_eliminacion_con_edicion_concurrente_descuenta_el_estado_nuevo(monkeypatch, deltas):
+    db = FakeDB()
+    db.equipos = EdicionConcurrente(_equipos(2))
+    monkeypatch.setattr(server, "db", db)
+
+    resultado = asyncio.run(server.eliminar_por_filtro("equipos", server.BulkDeleteRequest(filtro={"empresa_id": EMPRESA})))
+
+    assert resultado == {"coincidentes": 2, "eliminados": 2}
+    assert db.equipos.documentos == []
+    assert sorted(antes["estado"] for antes, _ in deltas) == ["Activo", "En reparación"]
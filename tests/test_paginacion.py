@@ -0,0 +1,23 @@
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+import server
+from tests.fakes import FakeCollection
+
+
+def test_after_sin_limit_rechazado():
+    cursor = server.encode_cursor({"_id": ObjectId()})
+    with pytest.raises(HTTPException) as error:
+        server.find_paginado(FakeCollection(), {}, limit=None, after=cursor)
+    assert error.value.status_code == 400
+
+
+def test_after_con_limit_continua_en_orden():
+    coleccion = FakeCollection([{"_id": ObjectId()} for _ in range(5)])
+    ids = sorted(documento["_id"] for documento in coleccion.documentos)
+    cursor = server.encode_cursor({"_id": ids[1]})
+
+    pagina = server.find_paginado(coleccion, {}, limit=2, after=cursor)
+
+    assert [documento["_id"] for documento in pagina.documentos] == ids[2:5]
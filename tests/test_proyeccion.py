@@ -0,0 +1,34 @@
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def test_campos_simples():
+    assert server.build_projection("nombre,estado") == {"_id": 1, "estado": 1, "nombre": 1}
+
+
+def test_padre_e_hijo_se_reducen_al_padre():
+    projection = server.build_projection("campos_personalizados,campos_personalizados.x,campos_personalizados.y.z")
+    assert projection == {"_id": 1, "campos_personalizados": 1}
+
+
+def test_subcampo_de_un_requerido():
+    projection = server.build_projection("fecha.dia,descripcion", requeridos=["fecha"])
+    assert projection == {"_id": 1, "descripcion": 1, "fecha": 1}
+
+
+def test_prefijo_de_nombre_no_es_padre():
+    projection = server.build_projection("campos,campos_personalizados.x")
+    assert projection == {"_id": 1, "campos": 1, "campos_personalizados.x": 1}
+
+
+def test_protegidos_excluidos():
+    assert server.build_projection("nombre,password_windows_encrypted", ["password_windows_encrypted"]) == {"_id": 1, "nombre": 1}
+    assert server.build_projection(None, ["password_windows_encrypted"]) == {"password_windows_encrypted": 0}
+
+
+def test_operador_rechazado():
+    with pytest.raises(HTTPException) as error:
+        server.build_projection("$where")
+    assert error.value.status_code == 400
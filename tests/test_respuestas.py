@@ -0,0 +1,31 @@
+from datetime import datetime
+
+import msgpack
+import orjson
+from bson import ObjectId
+
+import responses
+from responses import MSGPACK_MEDIA_TYPE, MsgPackResponse, ORJSONResponse, api_response
+
+DOCUMENTO = {"_id": ObjectId("65f000000000000000000000"), "fecha": datetime(2024, 5, 1, 10, 30)}
+ESPERADO = {"_id": "65f000000000000000000000", "fecha": "2024-05-01T10:30:00"}
+
+
+def test_json_por_defecto():
+    respuesta = api_response([DOCUMENTO])
+    assert isinstance(respuesta, ORJSONResponse)
+    assert orjson.loads(respuesta.body) == [ESPERADO]
+
+
+def test_msgpack_si_se_pide():
+    respuesta = api_response([DOCUMENTO], f"{MSGPACK_MEDIA_TYPE}, application/json;q=0.5")
+    assert isinstance(respuesta, MsgPackResponse)
+    assert respuesta.media_type == MSGPACK_MEDIA_TYPE
+    assert msgpack.unpackb(respuesta.body) == [ESPERADO]
+
+
+def test_sin_msgpack_instalado_responde_json(monkeypatch):
+    monkeypatch.setattr(responses, "msgpack", None)
+    respuesta = api_response([DOCUMENTO], MSGPACK_MEDIA_TYPE)
+    assert isinstance(respuesta, ORJSONResponse)
+    assert orjson.loads(respuesta.body) == [ESPERADO]
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture
+def cliente():
+    server.app.dependency_overrides[server.get_current_user] = lambda: {"_id": "usuario", "rol": "administrador"}
+    with TestClient(server.app) as cliente:
+        yield cliente
+    server.app.dependency_overrides.clear()
+
+
+@pytest.fixture(autouse=True)
+def sin_startup(monkeypatch):
+    # startup crea índices y el administrador: no hay Mongo en las pruebas
+    monkeypatch.setattr(server.app.router, "on_startup", [])
+    monkeypatch.setattr(server.app.router, "on_shutdown", [])
+
+
+def test_trabajo_con_object_id(cliente, monkeypatch):
+    job_id = ObjectId()
+    trabajo = {
+        "_id": job_id,
+        "tipo": "importacion_equipos",
+        "estado": "en_curso",
+        "progreso": {"procesados": 1000, "insertados": 998, "errores": 2},
+        "errores": [{"fila": 7, "error": "numero_serie: Field required"}],
+        "creado_en": datetime(2024, 5, 1, 10, 30),
+    }
+
+    async def obtener(_):
+        return trabajo
+
+    monkeypatch.setattr(server.job_service, "obtener", obtener)
+
+    respuesta = cliente.get(f"/api/trabajos/{job_id}")
+
+    assert respuesta.status_code == 200
+    cuerpo = respuesta.json()
+    assert cuerpo["_id"] == str(job_id)
+    assert cuerpo["progreso"]["insertados"] == 998
+    assert cuerpo["creado_en"] == "2024-05-01T10:30:00"
+
+
+def test_trabajo_inexistente(cliente, monkeypatch):
+    async def obtener(_):
+        return None
+
+    monkeypatch.setattr(server.job_service, "obtener", obtener)
+
+    assert cliente.get(f"/api/trabajos/{ObjectId()}").status_code == 404